@@ -0,0 +1,382 @@
+import heapq
+import html
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ast_handlers import POSITION_FIELDS
+from ast_paths import child_node_id, join_path
+from detail import NON_CHILD_FIELDS, child_fields, is_node
+from dot_render import (DEFAULT_EDGE_ATTRS, NODE_DEFAULTS, _attr_line, _edge_line, _node_line,
+                        format_label_for_node, format_label_for_summary, line_text)
+from graphviz.quoting import quote
+from viz_config import DIFF_COLORS, DIFF_LEGEND
+
+DIFF_GRAPH_ATTRS = {'rankdir': 'TB', 'ranksep': '0.3', 'nodesep': '0.25'}
+
+# Subtrees smaller than this are not matched on their hash alone (a lone `x` or `1` occurs all
+# over a file); they are paired later, inside parents that were matched
+MIN_HASH_MATCH_SIZE = 2
+
+
+class _Node:
+    """One AST node of a flattened tree; trees are lists of these in pre-order."""
+    __slots__ = ('node', 'type', 'label', 'parent', 'children', 'field', 'position', 'path', 'hash', 'size', 'height')
+
+    def __init__(self, node: dict, parent: int, field: Optional[str], position: Optional[int], path: str):
+        self.node = node
+        self.type = node['type']
+        self.label = node_label(node)
+        self.parent = parent
+        self.children: List[int] = []
+        self.field = field
+        self.position = position
+        self.path = path
+        self.hash = 0
+        self.size = 1
+        self.height = 1
+
+
+def node_label(node: dict) -> Tuple:
+    """The node's own values (names, constants, operators' context...), without positions or children."""
+    label = []
+    for key, value in node.items():
+        if key == 'type' or key in POSITION_FIELDS:
+            continue
+        if is_node(value):
+            if key in NON_CHILD_FIELDS:  # ctx: part of the node, not a child
+                label.append((key, value['type']))
+        elif not isinstance(value, list) or (value and not any(is_node(item) for item in value)):
+            label.append((key, repr(value)))
+    return tuple(label)
+
+
+def flatten(ast_dict: dict) -> List[_Node]:
+    """Pre-order list of the tree's nodes, with subtree hashes, sizes and heights computed bottom-up."""
+    nodes: List[_Node] = []
+    stack = [(ast_dict, -1, None, None, '')]
+    while stack:
+        node, parent, field, position, path = stack.pop()
+        index = len(nodes)
+        nodes.append(_Node(node, parent, field, position, path))
+        if parent >= 0:
+            nodes[parent].children.append(index)
+        children = []
+        for child_field, value in child_fields(node):
+            if isinstance(value, list):
+                children.extend((item, index, child_field, i, join_path(path, child_field, i))
+                                for i, item in enumerate(value) if is_node(item))
+            else:
+                children.append((value, index, child_field, None, join_path(path, child_field)))
+        stack.extend(reversed(children))
+    # Reverse pre-order visits every child before its parent
+    for entry in reversed(nodes):
+        child_nodes = [nodes[c] for c in entry.children]
+        entry.hash = hash((entry.type, entry.label, tuple((c.field, c.hash) for c in child_nodes)))
+        entry.size = 1 + sum(c.size for c in child_nodes)
+        entry.height = 1 + max((c.height for c in child_nodes), default=0)
+    return nodes
+
+
+class AstDiff:
+    """
+    Structural diff of two AST dictionaries (GumTree-style), in about linear time in the tree sizes:
+    1. Identical subtrees are matched through their bottom-up structural hashes, tallest new
+       subtrees first, to old subtrees none of whose nodes is matched yet (so the matching stays
+       one-to-one), preferring a candidate in the same place (under the matched parent, or at
+       the same path).
+    2. Unmatched nodes are matched bottom-up to the old node most of their matched children
+       came from (a function whose body was edited is still the same function).
+    3. Children of matched nodes that are still unmatched are aligned field by field, by type
+       and label, in order.
+    Matched nodes whose own values differ are 'updated'; those whose parent or field changed, or
+    that left the longest run of siblings kept in order, are 'moved'. Unmatched new nodes are
+    'inserted', unmatched old ones 'deleted'.
+    """
+    def __init__(self, old: dict, new: dict):
+        self.old = flatten(old)
+        self.new = flatten(new)
+        self.old_match = [-1] * len(self.old)
+        self.new_match = [-1] * len(self.new)
+        self._match_identical()
+        self._match_containers()
+        self._match_children()
+        self.kinds: Dict[int, Tuple[str, ...]] = self._classify()
+        self.deleted = [i for i, match in enumerate(self.old_match) if match < 0]
+
+    def _pair(self, old: int, new: int) -> None:
+        assert self.old_match[old] < 0 and self.new_match[new] < 0, (old, new)
+        self.old_match[old] = new
+        self.new_match[new] = old
+
+    def _match_identical(self) -> None:
+        old, new = self.old, self.new
+        by_hash: Dict[int, deque] = defaultdict(deque)
+        by_path = {}
+        for i, entry in enumerate(old):
+            if entry.size >= MIN_HASH_MATCH_SIZE or i == 0:
+                by_hash[entry.hash].append(i)
+                by_path[entry.path] = i
+        # Tallest first: a subtree is offered its match before any subtree it could contain
+        queue = [(-new[0].height, 0)]
+        while queue:
+            n = heapq.heappop(queue)[1]
+            entry = new[n]
+            candidate = self._identical_candidate(entry, by_hash, by_path) if entry.hash in by_hash else None
+            if candidate is None:
+                for c in entry.children:
+                    heapq.heappush(queue, (-new[c].height, c))
+                continue
+            # Same hash: same shape, so both subtrees list their nodes in the same pre-order
+            for offset in range(entry.size):
+                self._pair(candidate + offset, n + offset)
+
+    def _unmatched_subtree(self, o: int) -> bool:
+        """Whether no node of the old subtree at o is matched yet (its rows are o .. o + size - 1)."""
+        old_match = self.old_match
+        return all(old_match[i] < 0 for i in range(o, o + self.old[o].size))
+
+    def _identical_candidate(self, entry: _Node, by_hash: Dict[int, deque], by_path: Dict[str, int]) -> Optional[int]:
+        old = self.old
+        if entry.parent >= 0 and self.new_match[entry.parent] >= 0:
+            for c in old[self.new_match[entry.parent]].children:
+                if old[c].hash == entry.hash and old[c].field == entry.field and old[c].position == entry.position \
+                        and self._unmatched_subtree(c):
+                    return c
+        same_path = by_path.get(entry.path)
+        if same_path is not None and old[same_path].hash == entry.hash and self._unmatched_subtree(same_path):
+            return same_path
+        candidates = by_hash[entry.hash]
+        # Candidates with a matched node are dropped as they are met (they cannot become unmatched
+        # again), so every list is walked once overall
+        while candidates and not self._unmatched_subtree(candidates[0]):
+            candidates.popleft()
+        return candidates[0] if candidates and entry.size >= MIN_HASH_MATCH_SIZE else None
+
+    def _match_containers(self) -> None:
+        old, new = self.old, self.new
+        if self.new_match[0] < 0 and self.old_match[0] < 0:
+            self._pair(0, 0)
+        for n in range(len(new) - 1, 0, -1):
+            entry = new[n]
+            if self.new_match[n] >= 0 or not entry.children:
+                continue
+            votes = Counter(old[self.new_match[c]].parent for c in entry.children if self.new_match[c] >= 0)
+            for candidate, _ in votes.most_common():
+                if candidate >= 0 and self.old_match[candidate] < 0 and old[candidate].type == entry.type:
+                    self._pair(candidate, n)
+                    break
+
+    def _match_children(self) -> None:
+        old, new = self.old, self.new
+        for n, entry in enumerate(new):
+            o = self.new_match[n]
+            if o < 0:
+                continue
+            unmatched = [c for c in old[o].children if self.old_match[c] < 0]
+            if not unmatched:
+                continue
+            by_label: Dict[tuple, deque] = defaultdict(deque)
+            by_type: Dict[tuple, deque] = defaultdict(deque)
+            for c in unmatched:
+                by_label[(old[c].field, old[c].type, old[c].label)].append(c)
+                by_type[(old[c].field, old[c].type)].append(c)
+            for c in entry.children:
+                if self.new_match[c] >= 0:
+                    continue
+                child = new[c]
+                for queue in (by_label[(child.field, child.type, child.label)], by_type[(child.field, child.type)]):
+                    while queue and self.old_match[queue[0]] >= 0:
+                        queue.popleft()
+                    if queue:
+                        self._pair(queue.popleft(), c)
+                        break
+
+    def _classify(self) -> Dict[int, Tuple[str, ...]]:
+        old, new = self.old, self.new
+        kinds: Dict[int, Tuple[str, ...]] = {}
+        out_of_order = set()
+        for n, entry in enumerate(new):
+            o = self.new_match[n]
+            if o < 0:
+                continue
+            # Children that stayed under this parent but not in the longest run kept in order moved
+            order = {c: i for i, c in enumerate(old[o].children)}
+            stayed = [(order[self.new_match[c]], c) for c in entry.children if self.new_match[c] in order]
+            out_of_order.update(stayed_out_of_order(stayed))
+        for n, entry in enumerate(new):
+            o = self.new_match[n]
+            if o < 0:
+                kinds[n] = ('inserted',)
+                continue
+            found = []
+            if old[o].label != entry.label:
+                found.append('updated')
+            if n and (self.new_match[entry.parent] != old[o].parent or old[o].field != entry.field
+                      or n in out_of_order):
+                found.append('moved')
+            if found:
+                kinds[n] = tuple(found)
+        return kinds
+
+    def stats(self) -> Dict[str, int]:
+        counts = Counter(kind for kinds in self.kinds.values() for kind in kinds)
+        return {"old_nodes": len(self.old), "new_nodes": len(self.new), "deleted": len(self.deleted),
+                **{kind: counts.get(kind, 0) for kind in ('inserted', 'updated', 'moved')}}
+
+    def changes(self) -> List[dict]:
+        """
+        One entry per changed node (inserted or deleted subtrees once, at their root, with their size):
+        kinds, type, old/new paths and line ranges, and the old and new values of updated nodes.
+        """
+        changes = []
+        for n, kinds in self.kinds.items():
+            entry = self.new[n]
+            o = self.new_match[n]
+            if o < 0 and entry.parent >= 0 and self.new_match[entry.parent] < 0:
+                continue  # reported with its inserted ancestor
+            change = {"kinds": list(kinds), "type": entry.type, "new_path": entry.path,
+                      "new_lines": line_text(entry.node) or None}
+            if o < 0:
+                change["size"] = entry.size
+            else:
+                change.update(old_path=self.old[o].path, old_lines=line_text(self.old[o].node) or None)
+                if 'updated' in kinds:
+                    old_values, new_values = dict(self.old[o].label), dict(entry.label)
+                    keys = [k for k in dict.fromkeys([*old_values, *new_values]) if old_values.get(k) != new_values.get(k)]
+                    change.update(old_values={k: old_values.get(k) for k in keys},
+                                  new_values={k: new_values.get(k) for k in keys})
+            changes.append(change)
+        for o in self.deleted:
+            entry = self.old[o]
+            if entry.parent >= 0 and self.old_match[entry.parent] < 0:
+                continue  # reported with its deleted ancestor
+            changes.append({"kinds": ['deleted'], "type": entry.type, "old_path": entry.path,
+                            "old_lines": line_text(entry.node) or None, "size": entry.size})
+        return changes
+
+
+def stayed_out_of_order(stayed: List[Tuple[int, int]]) -> List[int]:
+    """Items (old position, id) outside one longest run of increasing old positions (patience LIS)."""
+    if len(stayed) < 2:
+        return []
+    # Per run length: the smallest position ending such a run, and the item it ends at
+    tail_values: List[int] = []
+    tails: List[int] = []
+    previous = [-1] * len(stayed)
+    for i, (position, _) in enumerate(stayed):
+        at = bisect_left(tail_values, position)
+        if at == len(tail_values):
+            tail_values.append(position)
+            tails.append(i)
+        else:
+            tail_values[at] = position
+            tails[at] = i
+        previous[i] = tails[at - 1] if at else -1
+    keep = set()
+    i = tails[-1]
+    while i >= 0:
+        keep.add(i)
+        i = previous[i]
+    return [item for i, (_, item) in enumerate(stayed) if i not in keep]
+
+
+def _changed_values(old: _Node, new: _Node) -> str:
+    old_values, new_values = dict(old.label), dict(new.label)
+    parts = [f"{key}: {old_values.get(key, '-')} → {new_values.get(key, '-')}"
+             for key in dict.fromkeys([*old_values, *new_values]) if old_values.get(key) != new_values.get(key)]
+    return html.escape('; '.join(parts))
+
+
+def _with_rows(label: str, *rows: str) -> str:
+    """Append rows to a label made by format_label_for_node (HTML table or plain HTML-like text)."""
+    cells = ''.join(f"<TR><TD ALIGN='LEFT'><FONT POINT-SIZE='8' COLOR='grey30'>{row}</FONT></TD></TR>" for row in rows)
+    if label.startswith("<<TABLE"):
+        return label[:-len("</TABLE>>")] + cells + "</TABLE>>"
+    return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'><TR><TD ALIGN='LEFT'>{label[1:-1]}</TD></TR>{cells}</TABLE>>"
+
+
+def iter_diff_dot(diff: AstDiff, collapse_unchanged: bool = True, name: str = 'diff') -> Iterator[str]:
+    """
+    Yield DOT for one graph of both versions: the new tree, with each changed node coloured by
+    DIFF_COLORS and deleted subtrees attached (dashed) where they used to be. With
+    collapse_unchanged, subtrees without any change are drawn as one summary node.
+    'arguments' nodes are skipped as in the regular graph.
+    """
+    old, new = diff.old, diff.new
+    # Deleted subtrees hang under the new counterpart of their old parent
+    deleted_under: Dict[int, List[int]] = defaultdict(list)
+    dirty = [False] * len(new)
+    for o in diff.deleted:
+        parent = old[o].parent
+        if parent >= 0 and diff.old_match[parent] >= 0:
+            deleted_under[diff.old_match[parent]].append(o)
+            dirty[diff.old_match[parent]] = True
+    for n in diff.kinds:
+        dirty[n] = True
+    for n in range(len(new) - 1, 0, -1):
+        if dirty[n]:
+            dirty[new[n].parent] = True
+
+    yield f"digraph {quote(name)} {{\n"
+    yield _attr_line(0, 'node', **NODE_DEFAULTS)
+    yield _attr_line(0, 'graph', **DIFF_GRAPH_ATTRS)
+    yield _attr_line(0, 'edge', **DEFAULT_EDGE_ATTRS)
+
+    def child(side: str, c: int, parent_id: Optional[str], node_id: str) -> tuple:
+        entry = (new if side == 'new' else old)[c]
+        return side, c, parent_id, entry.field, child_node_id(node_id, entry.field, entry.position)
+
+    # (tree, index, id of the drawn parent, edge label, node ID as in the regular graph); IDs are
+    # computed here rather than in flatten(), since collapsed subtrees never need theirs
+    stack: List[Tuple[str, int, Optional[str], Optional[str], str]] = [('new', 0, None, None, 'n')]
+    while stack:
+        side, index, parent_id, field, node_id = stack.pop()
+        entry = (new if side == 'new' else old)[index]
+        if entry.type == 'arguments':
+            children = [child(side, c, parent_id, node_id) for c in entry.children]
+            if side == 'new':
+                children.extend(child('old', o, parent_id, node_id) for o in deleted_under.get(index, ()))
+            stack.extend(reversed(children))
+            continue
+        if side == 'old':
+            # Deleted nodes sit where they used to be, so "d" in place of "n" keeps them apart
+            drawn_id = f"d{node_id[1:]}"
+            yield _node_line(0, drawn_id, format_label_for_node(entry.node), style='filled,dashed',
+                             fillcolor=DIFF_COLORS['deleted'])
+            if parent_id:
+                yield _edge_line(0, parent_id, drawn_id, label=field, style='dashed', color='grey50')
+            stack.extend(reversed([child('old', c, drawn_id, node_id) for c in entry.children
+                                   if diff.old_match[c] < 0]))
+            continue
+
+        kinds = diff.kinds.get(index, ())
+        if collapse_unchanged and not dirty[index] and entry.size > 1 and parent_id:
+            label = format_label_for_summary({**entry.node, 'collapsed': entry.size - 1})
+            yield _node_line(0, node_id, label, style='filled,dashed', fillcolor=DIFF_COLORS['unchanged'])
+        else:
+            label = format_label_for_node(entry.node)
+            o = diff.new_match[index]
+            rows = []
+            if 'updated' in kinds:
+                rows.append(_changed_values(old[o], entry))
+            if 'moved' in kinds and line_text(old[o].node):
+                rows.append(f"moved from {line_text(old[o].node)}")
+            kind = kinds[0] if kinds else 'unchanged'
+            yield _node_line(0, node_id, _with_rows(label, *rows) if rows else label, style='filled',
+                             fillcolor=DIFF_COLORS[kind])
+            children = [child('new', c, node_id, node_id) for c in entry.children]
+            children.extend(child('old', o, node_id, node_id) for o in deleted_under.get(index, ()))
+            stack.extend(reversed(children))
+        if parent_id:
+            yield _edge_line(0, parent_id, node_id, label=field)
+
+    cells = ''.join(f"<TR><TD WIDTH='15' HEIGHT='15' FIXEDSIZE='TRUE' BGCOLOR='{DIFF_COLORS[kind]}'> </TD>"
+                    f"<TD ALIGN='LEFT'><FONT POINT-SIZE='8'>{text}</FONT></TD></TR>" for text, kind in DIFF_LEGEND)
+    yield _node_line(0, 'diff_legend', f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='1' CELLPADDING='1'>{cells}</TABLE>>",
+                     shape='plaintext')
+    yield "}\n"
+
+
+def diff_dot(diff: AstDiff, collapse_unchanged: bool = True, name: str = 'diff') -> str:
+    return ''.join(iter_diff_dot(diff, collapse_unchanged, name))
@@ -1,5 +1,5 @@
 import ast
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional, Tuple
 
 class ASTNodeHandler:
     """
@@ -19,112 +19,142 @@ class ASTNodeHandler:
     @staticmethod
     def handle_constant(node: ast.Constant) -> Dict[str, Any]:
         """Handle Constant nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "value": node.value,
-            "kind": type(node.value).__name__
-        }
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["value"] = node.value
+        node_dict["kind"] = type(node.value).__name__
+        return node_dict
     @staticmethod
     def handle_name(node: ast.Name) -> Dict[str, Any]:
         """Handle Name nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "id": node.id,
-            "ctx": node.ctx.__class__.__name__
-        }
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["id"] = node.id
+        node_dict["ctx"] = node.ctx.__class__.__name__
+        return node_dict
     @staticmethod
     def handle_binop(node: ast.BinOp) -> Dict[str, Any]:
         """Handle BinOp nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-        }
+        return ASTNodeHandler.get_node_attributes(node)
     @staticmethod
     def handle_joinedstr(node: ast.JoinedStr) -> Dict[str, Any]:
         """Handle JoinedStr nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "values": [ast_to_dict(value) for value in node.values]
-        }
+        # The values list itself is filled in by ast_to_dict's field walk
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["values"] = []
+        return node_dict
     @staticmethod
     def handle_formattedvalue(node: ast.FormattedValue) -> Dict[str, Any]:
         """Handle FormattedValue nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "value": ast_to_dict(node.value),
-            "conversion": node.conversion,
-            "format_spec": ast_to_dict(node.format_spec) if node.format_spec else None
-        }
+        # value and format_spec are filled in by ast_to_dict's field walk
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["value"] = None
+        node_dict["conversion"] = node.conversion
+        node_dict["format_spec"] = None
+        return node_dict
     @staticmethod
     def handle_unaryop(node: ast.UnaryOp) -> Dict[str, Any]:
         """Handle UnaryOp nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-        }
+        return ASTNodeHandler.get_node_attributes(node)
     @staticmethod
     def handle_compare(node: ast.Compare) -> Dict[str, Any]:
         """Handle Compare nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-        }
+        return ASTNodeHandler.get_node_attributes(node)
     @staticmethod
     def handle_attribute(node: ast.Attribute) -> Dict[str, Any]:
         """Handle Attribute nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "attr": node.attr,
-            "ctx": node.ctx.__class__.__name__
-        }
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["attr"] = node.attr
+        node_dict["ctx"] = node.ctx.__class__.__name__
+        return node_dict
     @staticmethod
     def handle_function_def(node: ast.FunctionDef) -> Dict[str, Any]:
         """Handle FunctionDef nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "name": node.name
-        }
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["name"] = node.name
+        return node_dict
     @staticmethod
     def handle_class_def(node: ast.ClassDef) -> Dict[str, Any]:
         """Handle ClassDef nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "name": node.name
-        }
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["name"] = node.name
+        return node_dict
     @staticmethod
     def handle_arg(node: ast.arg) -> Dict[str, Any]:
         """Handle arg nodes."""
-        return {
-            **ASTNodeHandler.get_node_attributes(node),
-            "arg": node.arg
-        }
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+        node_dict["arg"] = node.arg
+        return node_dict
+
+POSITION_FIELDS = ('lineno', 'col_offset', 'end_lineno', 'end_col_offset')
+IDENTIFIER_FIELDS = frozenset(('name', 'id', 'arg'))
+# AST fields stored under another key: ExceptHandler.type would overwrite the node's own 'type'
+RENAMED_FIELDS = {'type': 'exc_type'}
+
+# Per-node-class (handler, type name, fields) entries, filled in on first use
+_DISPATCH: Dict[type, Tuple[Optional[Callable[[ast.AST], Dict[str, Any]]], str, Tuple[Tuple[str, str], ...]]] = {}
+
+def node_spec(cls: type) -> Tuple[Optional[Callable[[ast.AST], Dict[str, Any]]], str, Tuple[Tuple[str, str], ...]]:
+    """
+    Return the cached (handler, type name, fields) dispatch entry for an AST node class.
+    The handler is None for classes without a specific ASTNodeHandler method; fields are
+    (attribute, dictionary key) pairs.
+    """
+    spec = _DISPATCH.get(cls)
+    if spec is None:
+        type_name = cls.__name__
+        handler = getattr(ASTNodeHandler, f"handle_{type_name.lower()}", None)
+        fields = tuple((f, RENAMED_FIELDS.get(f, f)) for f in cls._fields if f not in POSITION_FIELDS)
+        spec = _DISPATCH[cls] = (handler, type_name, fields)
+    return spec
 
 def ast_to_dict(node) -> dict:
     """
-    Recursively convert AST nodes to dictionaries.
+    Convert AST nodes to dictionaries.
     - Identifiers (name, id, arg) are left as strings.
     - Primitives are left as-is.
     - AST nodes are converted to dicts.
+    Uses an explicit stack rather than recursion, so arbitrarily deep trees
+    (long operator chains, deeply nested literals) do not hit the recursion limit.
     """
     if not isinstance(node, ast.AST):
         return node  # Just return the value as-is (string, int, etc.)
-    handler_name = f"handle_{type(node).__name__.lower()}"
-    handler = getattr(ASTNodeHandler, handler_name, None)
-    if handler:
-        node_dict = handler(node)
-    else:
-        node_dict = ASTNodeHandler.get_node_attributes(node)
-    # Iterate over all fields in the AST node
-    for field, value in ast.iter_fields(node):
-        # Skip fields that are not relevant to the AST node
-        if field in ['lineno', 'col_offset', 'end_lineno', 'end_col_offset']:
-            continue
-        if value is None:
-            continue
-        # For identifier fields, keep as string
-        if field in ['name', 'id', 'arg']:
-            node_dict[field] = value
-            continue
-        # For list fields, recursively convert each item
-        if isinstance(value, list):
-            node_dict[field] = [ast_to_dict(v) for v in value]
+    AST = ast.AST
+    root = [None]
+    # Each entry is (ast node, container, key): the converted dict is stored at container[key]
+    stack = [(node, root, 0)]
+    pop = stack.pop
+    push = stack.append
+    missing = object()
+    while stack:
+        current, container, key = pop()
+        handler, type_name, fields = _DISPATCH.get(current.__class__) or node_spec(current.__class__)
+        if handler is not None:
+            node_dict = handler(current)
         else:
-            node_dict[field] = ast_to_dict(value)
-    return node_dict 
\ No newline at end of file
+            node_dict = {
+                "type": type_name,
+                "lineno": getattr(current, 'lineno', None),
+                "col_offset": getattr(current, 'col_offset', None),
+                "end_lineno": getattr(current, 'end_lineno', None),
+                "end_col_offset": getattr(current, 'end_col_offset', None)
+            }
+        container[key] = node_dict
+        for field, field_key in fields:
+            value = getattr(current, field, missing)
+            if value is None or value is missing:
+                continue
+            # For identifier fields, keep as string
+            if field in IDENTIFIER_FIELDS:
+                node_dict[field_key] = value
+            elif isinstance(value, list):
+                items = value[:]
+                node_dict[field_key] = items
+                for i, item in enumerate(items):
+                    if isinstance(item, AST):
+                        push((item, items, i))
+            elif isinstance(value, AST):
+                # Reserve the key now so the dict keeps the field order
+                node_dict[field_key] = None
+                push((value, node_dict, field_key))
+            else:
+                node_dict[field_key] = value
+    return root[0]
@@ -2,20 +2,49 @@ import ast
 import json
 from typing import Any, Dict, List, Optional, Union
 from ast_handlers import ASTNodeHandler, ast_to_dict
+from compact_ast import CompactAST
+from profiling import NULL_PROFILER, Profiler
 
-def parse_code(code: str) -> dict:
+# Besides syntax errors, untrusted source can nest too deeply for the parser (RecursionError),
+# exhaust memory (MemoryError) or contain null bytes (ValueError)
+PARSE_ERRORS = (SyntaxError, RecursionError, MemoryError, ValueError)
+
+def parse_error(e: Exception) -> dict:
+    """The error dictionary for an exception in PARSE_ERRORS, e.g. {"error": "SyntaxError: ..."}."""
+    name = 'SyntaxError' if isinstance(e, SyntaxError) else type(e).__name__
+    return {"error": f"{name}: {e}"}
+
+def parse_code(code: str, profiler: Profiler = NULL_PROFILER) -> dict:
     """
     Parse Python code to an AST dictionary.
 
     Args:
         code (str): A string containing valid Python code.
+        profiler (Profiler): Records the 'parse' and 'ast_to_dict' stages when enabled.
 
     Returns:
         dict: A nested dictionary representation of the AST, or an error message if parsing fails.
     """
     try:
-        tree = ast.parse(code)
-        return ast_to_dict(tree)
-    except SyntaxError as e:
-        return {"error": f"SyntaxError: {e}"}
+        with profiler.stage('parse'):
+            tree = ast.parse(code)
+        with profiler.stage('ast_to_dict'):
+            return ast_to_dict(tree)
+    except PARSE_ERRORS as e:
+        return parse_error(e)
+
+def parse_code_compact(code: str, profiler: Profiler = NULL_PROFILER) -> Union[CompactAST, dict]:
+    """
+    Parse Python code to a CompactAST, for callers that keep many ASTs in memory.
 
+    Returns:
+        CompactAST: The columnar form of the AST dictionary (see compact_ast), built straight
+        from the parsed tree, or the same error dictionary as parse_code if parsing fails.
+    """
+    try:
+        with profiler.stage('parse'):
+            tree = ast.parse(code)
+        with profiler.stage('compact'):
+            return CompactAST.from_ast(tree)
+    except PARSE_ERRORS as e:
+        return parse_error(e)
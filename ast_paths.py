@@ -0,0 +1,80 @@
+import base64
+import hashlib
+import re
+from typing import List, Union
+
+from detail import is_node
+
+# Stable node addressing: a path is the dotted list of fields and list indices that
+# leads from the module to a node, e.g. "body.3.body.0" is the first statement of the
+# fourth top-level statement. The root's path is "".
+
+TOP_LEVEL_ID = re.compile(r'n\.body\.\d+')
+
+
+def join_path(path: str, field: str, index: int = None) -> str:
+    """Path of the child stored in node[field] (or node[field][index] for list fields)."""
+    child = field if index is None else f"{field}.{index}"
+    return f"{path}.{child}" if path else child
+
+
+def split_path(path: str) -> List[Union[str, int]]:
+    """Split a path into field names and integer list indices."""
+    if not path:
+        return []
+    return [int(part) if part.isdigit() else part for part in path.split('.')]
+
+
+def resolve_path(ast_dict: dict, path: str) -> dict:
+    """
+    Return the node at path inside an AST dictionary.
+    Raises KeyError when the path does not lead to a node.
+    """
+    node = ast_dict
+    for part in split_path(path):
+        try:
+            node = node[part]
+        except (KeyError, IndexError, TypeError):
+            raise KeyError(f"No AST node at path '{path}'") from None
+    if not is_node(node):
+        raise KeyError(f"No AST node at path '{path}'")
+    return node
+
+
+# DOT node IDs. "n" is the module and "n.body.3" its fourth statement; every node below a
+# top-level statement is "n.body.3." plus a fixed-size hash chained from its parent's, over the
+# field and list index that lead to it. IDs are therefore as stable as paths but do not grow with
+# depth, and a statement that moves to another index keeps its descendants' hashes (only the
+# "n.body.N" prefix changes; see incremental.move_fragment and live.rename_top_level).
+NODE_ID_BYTES = 9
+
+
+def _id_hash(text: str) -> str:
+    return base64.urlsafe_b64encode(hashlib.blake2b(text.encode('utf-8'), digest_size=NODE_ID_BYTES).digest()).decode('ascii')
+
+
+def child_node_id(node_id: str, field: str, index: int = None) -> str:
+    """DOT node ID of the child stored in node[field] (or node[field][index]) of the node with node_id."""
+    part = field if index is None else f"{field}.{index}"
+    if node_id == 'n':
+        return f"n.{part}" if field == 'body' and index is not None else f"n.{_id_hash(part)}"
+    match = TOP_LEVEL_ID.match(node_id)
+    if match is None:  # Below a module-level field other than body
+        return f"n.{_id_hash(node_id[2:] + '/' + part)}"
+    head, chain = match.group(0), node_id[match.end() + 1:]
+    return f"{head}.{_id_hash(chain + '/' + part)}"
+
+
+def path_node_id(path: str) -> str:
+    """DOT node ID for the node at path; identical across renders and fragments of the same source."""
+    node_id = 'n'
+    parts = split_path(path)
+    position = 0
+    while position < len(parts):
+        if position + 1 < len(parts) and isinstance(parts[position + 1], int):
+            node_id = child_node_id(node_id, parts[position], parts[position + 1])
+            position += 2
+        else:
+            node_id = child_node_id(node_id, parts[position])
+            position += 1
+    return node_id
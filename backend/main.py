@@ -1,13 +1,113 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse, JSONResponse
+from pydantic import BaseModel
+from typing import Callable, Dict, Optional, Tuple, Union
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.convertors import Convertor, register_url_convertor
+import json
 import os
-from ast_parser import parse_code
-from dot_render import generate_dot
+import time
+import graphviz
+from render_cache import LRUCache, RenderCache, SourceChanged, config_hash, source_hash
+from render_store import default_store
+from layout import (LayoutLimitExceeded, LayoutPool, LAYOUT_FORMATS, POSITIONED_FORMAT, adaptive_layout, graph_size,
+                    layout_plan, merge_options)
+from dot_render import iter_dot_chunks
+from detail import collapse_tree
+from prune import parse_prune
+from ast_paths import path_node_id, resolve_path
+from compact_ast import CompactAST, NodeView, json_default
+from http_cache import choose_encoding, compress, encoded_etag, is_compressible, make_etag, match_etag
+from project_index import OVERVIEW_DETAILS, ProjectIndex, overview_dot
+from live import LiveSession
+from ast_diff import AstDiff, diff_dot
+from cfg import cfg_dot
+from viz_config import DIFF_COLORS
+from jobs import JOB_FORMATS, TERMINAL_STATES, JobManager, QueueFull
+from profiling import MetricsRegistry, NULL_PROFILER, Profiler
+from file_index import DEFAULT_PAGE_SIZE, FileIndex
+from submissions import (SUBMIT_MAX_NODES, SUBMIT_MAX_SOURCE_BYTES, SUBMIT_TIMEOUT, Coalescer, DeadlineProfiler,
+                         TooManySubmissions)
+
+try:  # MessagePack output for /api/ast is optional
+    import msgpack
+except ImportError:
+    msgpack = None
 
 PYTHON_EXAMPLES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../python_examples'))
 
-app = FastAPI()
+# On-disk store shared by every worker process and the CLI (CODEVIZ_STORE_DIR, CODEVIZ_STORE_MAX_MB; off with CODEVIZ_STORE=0)
+render_store = default_store()
+
+# Parsed ASTs and DOT text are cached by content hash; limits are configurable per deployment
+render_cache = RenderCache(
+    max_entries=int(os.environ.get('CODEVIZ_CACHE_MAX_ENTRIES', '512')),
+    max_bytes=int(os.environ.get('CODEVIZ_CACHE_MAX_MB', '128')) * 1024 * 1024,
+    store=render_store,
+)
+
+# Graphviz layouts run in worker processes and are cached by DOT hash
+layout_pool = LayoutPool(max_workers=int(os.environ.get('CODEVIZ_LAYOUT_WORKERS', '0')) or None, store=render_store)
+
+# Background render jobs: a bounded process pool plus a bounded queue; beyond that, POST /api/jobs answers 429
+job_manager = JobManager(
+    max_workers=int(os.environ.get('CODEVIZ_JOB_WORKERS', '0')) or None,
+    max_queued=int(os.environ.get('CODEVIZ_JOB_QUEUE', '32')),
+)
+# How often the progress stream checks a job for changes
+JOB_EVENT_INTERVAL = 0.05
+
+# Live editing (/ws/live): edits arriving within LIVE_DEBOUNCE seconds of each other are rendered once
+LIVE_DEBOUNCE = float(os.environ.get('CODEVIZ_LIVE_DEBOUNCE', '0.05'))
+LIVE_MAX_SOURCE_BYTES = int(os.environ.get('CODEVIZ_LIVE_MAX_KB', '512')) * 1024
+
+# Pasted source (POST /api/render): identical submissions in flight share one render (CODEVIZ_SUBMIT_* limits)
+submissions = Coalescer()
+SUBMIT_FORMATS = {'dot': "text/plain; charset=utf-8", **{fmt: LAYOUT_FORMATS[fmt] for fmt in ('svg', 'json', 'xdot', 'scene')}}
+
+# Recursive listing of the examples with per-file metadata, kept current by a background thread
+# (every CODEVIZ_FILE_INDEX_INTERVAL seconds) so /api/files never walks the tree per request
+# Per-file summaries for /api/overview, in the cache dir unless CODEVIZ_INDEX_PATH is set (opened on first use);
+# re-indexed from the file index's thread whenever a refresh sees added, changed or removed files
+project_index = ProjectIndex()
+overview_indexed_at: Optional[float] = None
+
+def refresh_overview_index(stats=None) -> Dict[str, float]:
+    global overview_indexed_at
+    result = project_index.update(PYTHON_EXAMPLES_DIR)
+    overview_indexed_at = time.time()
+    return result
+
+file_index = FileIndex(PYTHON_EXAMPLES_DIR, on_change=refresh_overview_index)
+
+# Compressed (and encoded AST) bodies by (ETag, content-coding); plain DOT/SVG already live in the caches above
+encoded_bodies = LRUCache(
+    max_entries=int(os.environ.get('CODEVIZ_CACHE_MAX_ENTRIES', '512')),
+    max_bytes=int(os.environ.get('CODEVIZ_ENCODED_CACHE_MAX_MB', '64')) * 1024 * 1024,
+)
+
+# Clients may store responses but must revalidate; unchanged files then cost a stat() and a 304
+CACHE_CONTROL = 'no-cache'
+
+AST_FORMATS = {'json': 'application/json', 'msgpack': 'application/msgpack', 'binary': 'application/octet-stream'}
+
+# Per-stage timing is opt-in (CODEVIZ_PROFILE=1), and tracemalloc peaks on top of it (CODEVIZ_PROFILE_MEMORY=1)
+PROFILING_ENABLED = os.environ.get('CODEVIZ_PROFILE', '0') == '1'
+PROFILE_MEMORY = os.environ.get('CODEVIZ_PROFILE_MEMORY', '0') == '1'
+metrics = MetricsRegistry()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    file_index.start()
+    yield
+    file_index.stop()
+    layout_pool.shutdown()
+    job_manager.shutdown()
+    project_index.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for local frontend
 app.add_middleware(
@@ -18,20 +118,702 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.get("/api/list-python-files")
-def list_python_files():
-    files = [f for f in os.listdir(PYTHON_EXAMPLES_DIR) if f.endswith('.py')]
-    return JSONResponse(files)
+class PythonFileConvertor(Convertor):
+    """A file path ending in .py, possibly with directories: /api/pages/{filename:pyfile}/{page} then
+    tells "pkg/mod.py/overview" (a page) from "pkg/mod.py" (the listing)."""
+    regex = r".+?\.py(?=/|$)"
 
-@app.get("/api/dot/{filename}")
-def get_dot(filename: str):
+    def convert(self, value: str) -> str:
+        return value
+
+    def to_string(self, value: str) -> str:
+        return value
+
+register_url_convertor("pyfile", PythonFileConvertor())
+
+@app.exception_handler(SourceChanged)
+def source_changed(request: Request, exc: SourceChanged) -> JSONResponse:
+    # The file was edited between computing the ETag and building the body; a retry sees the new version
+    return JSONResponse({"detail": "File changed while rendering; retry"}, status_code=409)
+
+def resolve_example(filename: str) -> str:
+    """Validate a requested filename (relative, possibly nested) and return its path inside PYTHON_EXAMPLES_DIR."""
     if not filename.endswith('.py'):
         raise HTTPException(status_code=400, detail="Invalid file type")
-    file_path = os.path.join(PYTHON_EXAMPLES_DIR, filename)
+    file_path = os.path.realpath(os.path.join(PYTHON_EXAMPLES_DIR, filename))
+    if not file_path.startswith(PYTHON_EXAMPLES_DIR + os.sep):
+        raise HTTPException(status_code=404, detail="File not found")
     if not os.path.isfile(file_path):
         raise HTTPException(status_code=404, detail="File not found")
-    with open(file_path, 'r') as f:
-        code = f.read()
-    ast_dict = parse_code(code)
-    dot = generate_dot(ast_dict)
-    return PlainTextResponse(str(dot)) 
\ No newline at end of file
+    return file_path
+
+def new_profiler() -> Profiler:
+    return Profiler(trace_memory=PROFILE_MEMORY) if PROFILING_ENABLED else NULL_PROFILER
+
+def finish(response: Response, profiler: Profiler) -> Response:
+    """Attach the profiler's stages as a Server-Timing header and record them in /api/metrics."""
+    if profiler.stages:
+        response.headers['Server-Timing'] = profiler.server_timing()
+        response.headers['Timing-Allow-Origin'] = '*'
+        metrics.observe(profiler)
+    return response
+
+def source_etag(file_path: str, kind: str, **options) -> Tuple[str, Tuple[str, Optional[str]]]:
+    """
+    (ETag, source) for a representation of file_path: the ETag is its content hash plus the kind and
+    render options, and source the loaded version, which the body must be built from (source=...).
+    """
+    source = render_cache.load(file_path)
+    return make_etag(kind, source[0], config_hash(**options)), source
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response if the client already holds this representation, else None."""
+    matched = match_etag(request.headers.get('if-none-match'), etag)
+    if matched is None:
+        return None
+    return Response(status_code=304, headers={'ETag': matched, 'Cache-Control': CACHE_CONTROL,
+                                              'Vary': 'Accept-Encoding'})
+
+def send(request: Request, etag: str, media_type: str, build: Callable[[], Union[str, bytes]],
+         profiler: Profiler, cache_identity: bool = False) -> Response:
+    """
+    Build (or reuse) a body and send it with validators, compressed with the best coding the
+    client accepts. Compressed bodies are cached by (ETag, coding); cache_identity also caches
+    the uncompressed body, for representations no other cache holds.
+    """
+    encoding = choose_encoding(request.headers.get('accept-encoding'))
+    key = (etag, encoding)
+    cached = encoded_bodies.get(key) if encoding or cache_identity else None
+    if cached is None:
+        body = build()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        used = None
+        if encoding and is_compressible(media_type, len(body)):
+            with profiler.stage('compress') as stage:
+                body = compress(body, encoding)
+                stage.count(bytes=len(body))
+            used = encoding
+        cached = (body, used)
+        if encoding or cache_identity:
+            encoded_bodies.put(key, cached, len(body))
+    body, used = cached
+    headers = {'ETag': encoded_etag(etag, used), 'Cache-Control': CACHE_CONTROL, 'Vary': 'Accept-Encoding'}
+    if used:
+        headers['Content-Encoding'] = used
+    return finish(Response(content=body, media_type=media_type, headers=headers), profiler)
+
+def lod_options(max_depth: Optional[int], node_budget: Optional[int], prune: Optional[str] = None) -> dict:
+    """
+    Level-of-detail options for the DOT emitter; unset values are left out so they share cache keys.
+    prune is a pruning preset or rule spec (see prune.parse_prune); 'full' is the same as none.
+    """
+    if (max_depth is not None and max_depth < 0) or (node_budget is not None and node_budget < 1):
+        raise HTTPException(status_code=400, detail="max_depth must be >= 0 and node_budget >= 1")
+    if prune is not None:
+        try:
+            if parse_prune(prune).is_identity():
+                prune = None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return {k: v for k, v in (("max_depth", max_depth), ("node_budget", node_budget), ("prune", prune))
+            if v is not None}
+
+def run_pooled_layout(dot_source: Optional[str], fmt: str, profiler: Profiler,
+                      render_dot: Optional[Callable[..., str]] = None, timeout: Optional[float] = None) -> bytes:
+    """
+    Lay out DOT in the worker pool, turning Graphviz failures into HTTP errors.
+    With render_dot instead of dot_source (see layout.adaptive_layout) the engine is chosen by
+    graph size and layouts that hit the time or memory limit degrade to cheaper variants.
+    timeout bounds the wait for each layout (TimeoutError); the pool's own limits still apply.
+    """
+    def run(source: str, fmt: str, engine: str = 'dot') -> bytes:
+        with profiler.stage('layout'):
+            return layout_pool.render(source, fmt, engine, timeout)
+    try:
+        if render_dot is None:
+            return run(dot_source, fmt)
+        return adaptive_layout(render_dot, fmt, run)[0]
+    except graphviz.ExecutableNotFound:
+        raise HTTPException(status_code=503, detail="Graphviz is not installed on the server")
+    except graphviz.CalledProcessError as e:
+        raise HTTPException(status_code=500, detail=f"Graphviz layout failed: {e}")
+    except LayoutLimitExceeded as e:
+        raise HTTPException(status_code=503, detail=f"Graph too large to lay out: {e}")
+
+def render_layout(request: Request, filename: str, fmt: str, options: dict) -> Response:
+    file_path = resolve_example(filename)
+    etag, source = source_etag(file_path, 'layout', format=fmt, **options)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+
+    def render_dot(**extra) -> str:
+        return render_cache.get_dot(file_path, profiler, source, **merge_options(options, extra))[1]
+
+    def build() -> bytes:
+        return run_pooled_layout(None, fmt, profiler, render_dot)
+    return send(request, etag, LAYOUT_FORMATS[fmt], build, profiler)
+
+@app.get("/api/list-python-files")
+def list_python_files():
+    """Every Python file under the examples directory (relative paths, sorted), from the file index."""
+    return JSONResponse(file_index.paths())
+
+@app.get("/api/files")
+def list_files(prefix: str = '', q: str = '', cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    One page of the file index: paths starting with prefix (e.g. "pkg/") and containing q
+    (case-insensitive), after cursor, with size, mtime, content hash, AST node count and how
+    far the file has been rendered ('rendered', 'parsed', 'stored' or null). Pass next_cursor
+    back as cursor for the following page; hash and nodes are null until the background
+    thread has read a new or edited file.
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be >= 1")
+    try:
+        result = file_index.query(prefix=prefix, search=q, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for entry in result["files"]:
+        entry["render"] = render_cache.render_status(entry["hash"]) if entry["hash"] else None
+    return JSONResponse(result)
+
+@app.get("/api/dot/{filename:path}")
+def get_dot(request: Request, filename: str, stream: bool = False, max_depth: Optional[int] = None,
+            node_budget: Optional[int] = None, prune: Optional[str] = None):
+    file_path = resolve_example(filename)
+    options = lod_options(max_depth, node_budget, prune)
+    etag, source = source_etag(file_path, 'dot', **options)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+    if stream:
+        # Large graphs: write DOT straight from the cached AST without holding the text (not compressed)
+        _, ast_dict = render_cache.get_ast(file_path, profiler, source)
+        response = StreamingResponse(iter_dot_chunks(ast_dict, **options), media_type="text/plain",
+                                     headers={'ETag': etag, 'Cache-Control': CACHE_CONTROL})
+        return finish(response, profiler)
+    return send(request, etag, "text/plain; charset=utf-8",
+                lambda: render_cache.get_dot(file_path, profiler, source, **options)[1], profiler)
+
+@app.get("/api/svg/{filename:path}")
+def get_svg(request: Request, filename: str, max_depth: Optional[int] = None, node_budget: Optional[int] = None,
+            prune: Optional[str] = None):
+    return render_layout(request, filename, 'svg', lod_options(max_depth, node_budget, prune))
+
+@app.get("/api/layout/{filename:path}")
+def get_layout(request: Request, filename: str, format: str = 'json', max_depth: Optional[int] = None,
+               node_budget: Optional[int] = None, prune: Optional[str] = None):
+    """
+    Positioned graph as Graphviz json or xdot, or as a scene: drawing operations per cluster,
+    node and edge (layout.layout_scene) that the frontend draws without a layout engine. All
+    formats, like /api/svg, are exported from one cached layout of the graph.
+    """
+    if format not in ('json', 'xdot', 'scene'):
+        raise HTTPException(status_code=400, detail="format must be 'json', 'xdot' or 'scene'")
+    return render_layout(request, filename, format, lod_options(max_depth, node_budget, prune))
+
+def encode_ast(tree: CompactAST, fmt: str) -> bytes:
+    if fmt == 'json':
+        return ''.join(tree.iter_json()).encode('utf-8')
+    if fmt == 'msgpack':
+        return msgpack.packb(tree.to_dict(), default=repr, use_bin_type=True)
+    return tree.to_bytes()
+
+@app.get("/api/ast/{filename:path}/subtree")
+def get_subtree(request: Request, filename: str, path: str = '', depth: Optional[int] = 3, format: str = 'dot',
+                node: Optional[str] = None):
+    """
+    Return one subtree of the cached AST, expanded `depth` levels below the requested node
+    (deeper subtrees are summary nodes). The node is given by its path, or by its DOT node ID
+    (`node`, as clicked in a rendered graph). Node IDs depend only on the node's place in the
+    tree, so fragments fetched while drilling down line up with each other and with the full graph.
+    """
+    if format not in ('dot', 'json'):
+        raise HTTPException(status_code=400, detail="format must be 'dot' or 'json'")
+    if node is not None and node != 'n' and not node.startswith('n.'):
+        raise HTTPException(status_code=400, detail="node must be a node ID such as 'n.body.0'")
+    if depth is not None and depth < 0:
+        raise HTTPException(status_code=400, detail="depth must be >= 0")
+    file_path = resolve_example(filename)
+    options = lod_options(depth, None)
+    etag, source = source_etag(file_path, 'subtree', format=format, path=path, node=node, **options)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+
+    def build() -> str:
+        nonlocal path
+        try:
+            if node is not None:
+                _, spans = render_cache.get_spans(file_path, profiler, source)
+                if spans is None:
+                    raise HTTPException(status_code=422, detail="Could not parse file")
+                path = spans.path_of(spans.index_of_id(node))
+            if format == 'json':
+                _, ast_dict = render_cache.get_ast(file_path, profiler, source)
+                subtree = collapse_tree(resolve_path(ast_dict, path), **options)
+                content = {"path": path, "id": path_node_id(path), "node": subtree}
+                # The cached AST is a CompactAST; json_default turns its NodeViews into objects
+                return json.dumps(content, default=json_default, separators=(',', ':'))
+            return render_cache.get_dot(file_path, profiler, source, root_path=path, legend_mode='none',
+                                        **options)[1]
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+    media_type = "application/json" if format == 'json' else "text/plain; charset=utf-8"
+    return send(request, etag, media_type, build, profiler)
+
+@app.get("/api/ast/{filename:path}")
+def get_ast(request: Request, filename: str, format: str = 'json'):
+    """
+    The whole AST as JSON (the ast_to_dict structure), MessagePack (same structure; needs the
+    optional msgpack package) or binary (CompactAST.to_bytes: length-prefixed frames holding
+    the raw columns, for loading straight into typed arrays).
+    """
+    if format not in AST_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(AST_FORMATS)}")
+    if format == 'msgpack' and msgpack is None:
+        raise HTTPException(status_code=406, detail="MessagePack is not available on the server")
+    file_path = resolve_example(filename)
+    etag, source = source_etag(file_path, 'ast', format=format)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+    _, root = render_cache.get_ast(file_path, profiler, source)
+    if not isinstance(root, NodeView):
+        raise HTTPException(status_code=422, detail=root.get('error', 'Could not parse file'))
+
+    def build() -> bytes:
+        with profiler.stage('encode') as stage:
+            body = encode_ast(root.tree, format)
+            stage.count(bytes=len(body))
+        return body
+    return send(request, etag, AST_FORMATS[format], build, profiler, cache_identity=True)
+
+@app.get("/api/cfg/{filename:path}")
+def get_cfg(request: Request, filename: str, function: Optional[str] = None, format: str = 'dot'):
+    """
+    Control-flow graphs instead of the AST: basic blocks with branch, loop and jump edges for
+    module-level code and every function, or only for function (a qualified name such as
+    'Game.update', or an AST path). Usually many times smaller than the AST graph.
+    """
+    if format not in ('dot', 'svg', 'json'):
+        raise HTTPException(status_code=400, detail="format must be 'dot', 'svg' or 'json'")
+    file_path = resolve_example(filename)
+    etag, source = source_etag(file_path, 'cfg', format=format, function=function)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+
+    def build() -> Union[str, bytes]:
+        try:
+            _, graphs = render_cache.get_cfg(file_path, profiler, function, source)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=e.args[0])
+        if graphs is None:
+            raise HTTPException(status_code=422, detail="Could not parse file")
+        if format == 'json':
+            return json.dumps([{**graph.as_dict(), "stats": graph.stats()} for graph in graphs])
+        with profiler.stage('dot'):
+            dot_source = cfg_dot(graphs)
+        return dot_source if format == 'dot' else run_pooled_layout(dot_source, 'svg', profiler)
+    media_type = {'dot': "text/plain; charset=utf-8", 'json': "application/json", 'svg': LAYOUT_FORMATS['svg']}[format]
+    return send(request, etag, media_type, build, profiler)
+
+# Overview pages link to the other pages relative to their own URL (/api/pages/{filename}/{page})
+PAGE_LINK = "{name}?format=svg"
+
+def get_pages_or_error(file_path: str, source: Tuple[str, Optional[str]], profiler: Profiler, **options) -> list:
+    _, pages = render_cache.get_pages(file_path, profiler, link=PAGE_LINK, source=source, **options)
+    if pages is None:
+        raise HTTPException(status_code=422, detail="Could not parse file")
+    return pages
+
+@app.get("/api/pages/{filename:pyfile}")
+def list_pages(request: Request, filename: str):
+    """
+    The module split into pages (pages.split_pages): an overview plus one graph per top-level
+    function and class. Listing the pages queues their layouts in the worker pool, so they are
+    laid out in parallel; pages whose DOT is unchanged since an earlier version of the file
+    reuse their cached layout.
+    """
+    file_path = resolve_example(filename)
+    etag, source = source_etag(file_path, 'pages')
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+
+    def build() -> str:
+        pages = get_pages_or_error(file_path, source, profiler)
+        for page in pages:
+            # Same engine as the first step of adaptive_layout, so page requests join these jobs
+            engine, _ = layout_plan(*graph_size(page.dot_source)[:2])[0]
+            layout_pool.submit(page.dot_source, POSITIONED_FORMAT, engine)
+        return json.dumps({"file": filename, "pages": [
+            {**page.as_dict(), "url": f"/api/pages/{filename}/{page.name}"} for page in pages]})
+    return send(request, etag, "application/json", build, profiler)
+
+@app.get("/api/pages/{filename:pyfile}/{page}")
+def get_page(request: Request, filename: str, page: str, format: str = 'svg'):
+    """One page as DOT or laid out (svg, or any /api/layout format); the overview is 'overview'."""
+    if format != 'dot' and format not in LAYOUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be 'dot' or one of: {', '.join(LAYOUT_FORMATS)}")
+    file_path = resolve_example(filename)
+    etag, source = source_etag(file_path, 'page', page=page, format=format)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+
+    def render_dot(**extra) -> str:
+        for candidate in get_pages_or_error(file_path, source, profiler, **extra):
+            if candidate.name == page:
+                return candidate.dot_source
+        raise HTTPException(status_code=404, detail=f"No page named {page!r}")
+
+    def build() -> Union[str, bytes]:
+        return render_dot() if format == 'dot' else run_pooled_layout(None, format, profiler, render_dot)
+    media_type = "text/plain; charset=utf-8" if format == 'dot' else LAYOUT_FORMATS[format]
+    return send(request, etag, media_type, build, profiler)
+
+@app.get("/api/locate")
+def locate(request: Request, file: str, line: Optional[int] = None, col: int = 0, node: Optional[str] = None):
+    """
+    Map between source positions and AST nodes, for editor integration:
+    - line/col (1-based line, 0-based UTF-8 column as in the AST) -> the innermost node there
+    - node (a DOT node ID such as "n.body.3") -> that node's source span
+    Both answer from a SpanIndex cached with the parsed tree, without scanning it.
+    """
+    if (line is None) == (node is None):
+        raise HTTPException(status_code=400, detail="Pass either line (and col) or node")
+    if line is not None and (line < 1 or col < 0):
+        raise HTTPException(status_code=400, detail="line must be >= 1 and col >= 0")
+    if node is not None and node != 'n' and not node.startswith('n.'):
+        raise HTTPException(status_code=400, detail="node must be a node ID such as 'n.body.0'")
+    file_path = resolve_example(file)
+    etag, source = source_etag(file_path, 'locate', line=line, col=col, node=node)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+
+    def build() -> str:
+        _, spans = render_cache.get_spans(file_path, profiler, source)
+        if spans is None:
+            raise HTTPException(status_code=422, detail="Could not parse file")
+        with profiler.stage('locate'):
+            if node is not None:
+                try:
+                    index = spans.index_of_id(node)
+                except KeyError as e:
+                    raise HTTPException(status_code=404, detail=e.args[0])
+            else:
+                index = spans.locate(line, col)
+                if index is None:
+                    raise HTTPException(status_code=404, detail=f"No AST node at line {line}, column {col}")
+            return json.dumps(spans.describe(index), default=json_default)
+    return send(request, etag, "application/json", build, profiler)
+
+@app.get("/api/diff")
+def get_diff(request: Request, old: str, new: str, format: str = 'dot', unchanged: bool = False):
+    """
+    Structural diff of two example files (old -> new) as one graph: inserted, deleted, updated
+    and moved nodes are coloured (viz_config.DIFF_COLORS) and, unless unchanged is set, subtrees
+    without changes are collapsed. format=json returns the statistics and the list of changes.
+    """
+    if format not in ('dot', 'svg', 'json'):
+        raise HTTPException(status_code=400, detail="format must be 'dot', 'svg' or 'json'")
+    old_path, new_path = resolve_example(old), resolve_example(new)
+    old_source = render_cache.load(old_path)
+    new_source = render_cache.load(new_path)
+    options = {} if format == 'json' else {"unchanged": unchanged, "diff_colors": DIFF_COLORS}
+    etag = make_etag('diff', old_source[0], new_source[0], config_hash(format=format, **options))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = new_profiler()
+
+    def build() -> Union[str, bytes]:
+        _, old_ast = render_cache.get_ast(old_path, profiler, old_source)
+        _, new_ast = render_cache.get_ast(new_path, profiler, new_source)
+        for name, tree in ((old, old_ast), (new, new_ast)):
+            if not isinstance(tree, NodeView):
+                raise HTTPException(status_code=422, detail=f"Could not parse {name}: {tree.get('error')}")
+        with profiler.stage('diff') as stage:
+            diff = AstDiff(old_ast, new_ast)
+            stage.count(**diff.stats())
+        if format == 'json':
+            return json.dumps({"stats": diff.stats(), "changes": diff.changes()}, default=json_default)
+        with profiler.stage('dot'):
+            dot_source = diff_dot(diff, collapse_unchanged=not unchanged)
+        return dot_source if format == 'dot' else run_pooled_layout(dot_source, 'svg', profiler)
+    media_type = {'dot': "text/plain; charset=utf-8", 'json': "application/json", 'svg': LAYOUT_FORMATS['svg']}[format]
+    return send(request, etag, media_type, build, profiler)
+
+@app.get("/api/overview")
+def get_overview(request: Request, format: str = 'dot', detail: str = 'modules', external: bool = False):
+    """
+    Overview of every file under the examples directory: modules, their classes/functions
+    (detail) and the imports between them, built from the SQLite summary index. The file index's
+    background thread keeps the summaries current; a request only re-indexes when that never
+    happened yet (or the thread is not running and the last refresh is older than its interval).
+    """
+    if format not in ('dot', 'svg', 'json'):
+        raise HTTPException(status_code=400, detail="format must be 'dot', 'svg' or 'json'")
+    if detail not in OVERVIEW_DETAILS:
+        raise HTTPException(status_code=400, detail=f"detail must be one of: {', '.join(OVERVIEW_DETAILS)}")
+    profiler = new_profiler()
+    if overview_indexed_at is None or (not file_index.running and time.time() - overview_indexed_at > file_index.interval):
+        with profiler.stage('index') as stage:
+            stats = refresh_overview_index()
+            stage.count(files=stats['files'], summarized=stats['summarized'])
+    options = {} if format == 'json' else {"detail": detail, "external": external}
+    etag = make_etag('overview', project_index.fingerprint(PYTHON_EXAMPLES_DIR), config_hash(format=format, **options))
+    response = not_modified(request, etag)
+    if response is not None:
+        return finish(response, profiler)
+
+    def build() -> Union[str, bytes]:
+        overview = project_index.overview(PYTHON_EXAMPLES_DIR)
+        if format == 'json':
+            return json.dumps(overview, separators=(',', ':'))
+        with profiler.stage('dot'):
+            dot_source = overview_dot(overview, detail, external)
+        return dot_source if format == 'dot' else run_pooled_layout(dot_source, 'svg', profiler)
+    media_type = {'dot': "text/plain; charset=utf-8", 'json': "application/json", 'svg': LAYOUT_FORMATS['svg']}[format]
+    return send(request, etag, media_type, build, profiler)
+
+class RenderJobRequest(BaseModel):
+    filename: str
+    format: str = 'svg'
+    max_depth: Optional[int] = None
+    node_budget: Optional[int] = None
+    prune: Optional[str] = None
+
+def get_job_or_404(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/jobs", status_code=202)
+def submit_job(body: RenderJobRequest):
+    """
+    Queue a render in the background and return its job ID at once. A request identical to a job
+    that is still queued or running (same file contents, format and options) joins that job.
+    """
+    if body.format not in JOB_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(JOB_FORMATS)}")
+    file_path = resolve_example(body.filename)
+    options = lod_options(body.max_depth, body.node_budget, body.prune)
+    digest, _ = render_cache.load(file_path)
+    try:
+        job, deduplicated = job_manager.submit(file_path, body.format, options, digest)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Render queue is full ({e})", headers={'Retry-After': '1'})
+    content = {"id": job.id, "status": job.status, "deduplicated": deduplicated}
+    return JSONResponse(content, status_code=202, headers={'Location': f"/api/jobs/{job.id}"})
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    return JSONResponse(get_job_or_404(job_id).snapshot())
+
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Server-sent events: one 'progress' event per change of the job, ending with its final state."""
+    job = get_job_or_404(job_id)
+
+    async def events():
+        version = -1
+        while True:
+            if job.version != version:
+                version = job.version
+                yield f"event: progress\ndata: {json.dumps(job.snapshot())}\n\n"
+                if job.status in TERMINAL_STATES:
+                    return
+            await asyncio.sleep(JOB_EVENT_INTERVAL)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={'Cache-Control': 'no-cache'})
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(request: Request, job_id: str):
+    job = get_job_or_404(job_id)
+    if job.status == 'cancelled':
+        raise HTTPException(status_code=410, detail="Job was cancelled")
+    if job.status == 'failed':
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != 'done':
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    etag = make_etag('job', *job.key)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    return send(request, etag, job.media_type, lambda: job.result, new_profiler())
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a job: queued jobs never start, running ones stop at their next stage boundary."""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(job.snapshot())
+
+class SubmitRequest(BaseModel):
+    code: str
+    format: str = 'svg'
+    max_depth: Optional[int] = None
+    node_budget: Optional[int] = None
+    prune: Optional[str] = None
+
+def render_submission(code: str, fmt: str, options: dict, profiler: DeadlineProfiler) -> bytes:
+    """Parse, render and lay out submitted source (in a worker thread), within the node and time limits."""
+    _, root = render_cache.get_source_ast(code, profiler)
+    if not isinstance(root, NodeView):
+        error = root.get('error', 'Could not parse source')
+        # Source the parser ran out of memory on is too large; anything else cannot be parsed
+        raise HTTPException(status_code=413 if error.startswith('MemoryError') else 422, detail=error)
+    if len(root.tree) > SUBMIT_MAX_NODES:
+        raise HTTPException(status_code=413, detail=f"Source has {len(root.tree)} AST nodes (limit {SUBMIT_MAX_NODES})")
+
+    def render_dot(**extra) -> str:
+        return render_cache.get_source_dot(code, profiler, **merge_options(options, extra))[1]
+    if fmt == 'dot':
+        body = render_dot().encode('utf-8')
+    else:
+        body = run_pooled_layout(None, fmt, profiler, render_dot, timeout=profiler.remaining())
+    profiler.checkpoint()
+    return body
+
+@app.post("/api/render")
+async def render_source(request: Request):
+    """
+    Render pasted source text ({"code": ..., "format": "svg", "max_depth", "node_budget", "prune"})
+    without a file. Bodies over the size limit are refused before they are read in full, sources
+    over the node limit after parsing, and renders stop at the time limit (413, 413, 504). Source
+    that does not parse, including nesting too deep for the parser, gets 422 (413 if the parser
+    runs out of memory). The work
+    runs in a thread; concurrent submissions of the same source and options share one render
+    (X-Render-Coalesced: true on the responses that joined it), and results are cached by content
+    hash like the example files'.
+    """
+    # JSON escaping can double the source's size; anything larger cannot be within the limit
+    max_body = 2 * SUBMIT_MAX_SOURCE_BYTES + 4096
+    if int(request.headers.get('content-length') or 0) > max_body:
+        raise HTTPException(status_code=413, detail=f"Source exceeds {SUBMIT_MAX_SOURCE_BYTES // 1024} KB")
+    raw = bytearray()
+    async for chunk in request.stream():
+        raw += chunk
+        if len(raw) > max_body:
+            raise HTTPException(status_code=413, detail=f"Source exceeds {SUBMIT_MAX_SOURCE_BYTES // 1024} KB")
+    try:
+        body = SubmitRequest.model_validate_json(bytes(raw))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if body.format not in SUBMIT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(SUBMIT_FORMATS)}")
+    if len(body.code.encode('utf-8')) > SUBMIT_MAX_SOURCE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Source exceeds {SUBMIT_MAX_SOURCE_BYTES // 1024} KB")
+    options = lod_options(body.max_depth, body.node_budget, body.prune)
+    key = (source_hash(body.code), body.format, config_hash(**options))
+    etag = make_etag('render', *key)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    profiler = DeadlineProfiler(SUBMIT_TIMEOUT, trace_memory=PROFILE_MEMORY and PROFILING_ENABLED)
+    try:
+        result, joined = await submissions.run(key, render_submission, body.code, body.format, options, profiler,
+                                               timeout=SUBMIT_TIMEOUT)
+    except TooManySubmissions as e:
+        raise HTTPException(status_code=429, detail=f"Too many renders in progress ({e})", headers={'Retry-After': '1'})
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Render took longer than {SUBMIT_TIMEOUT:g}s")
+    # Only the submission that ran the render reports its stages; compression also stays off the loop
+    response = await asyncio.to_thread(send, request, etag, SUBMIT_FORMATS[body.format], lambda: result,
+                                       NULL_PROFILER if joined or not PROFILING_ENABLED else profiler)
+    response.headers['X-Render-Coalesced'] = 'true' if joined else 'false'
+    return response
+
+def live_reply(session: LiveSession, text: str) -> dict:
+    """Render one live edit message ({"seq": n, "code": "...", "reset": false}) and build the reply."""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict) or not isinstance(message.get('code'), str):
+        return {"type": "error", "seq": None, "error": "Expected a JSON object with a 'code' string"}
+    seq = message.get('seq')
+    code = message['code']
+    if len(code.encode('utf-8')) > LIVE_MAX_SOURCE_BYTES:
+        return {"type": "error", "seq": seq, "error": f"Source exceeds {LIVE_MAX_SOURCE_BYTES // 1024} KB"}
+    if message.get('reset'):
+        session.reset()
+    profiler = new_profiler()
+    try:
+        dot_source, delta = session.update(code, profiler)
+    except SyntaxError as e:
+        # Typing passes through invalid states; the client keeps showing the last good graph
+        return {"type": "error", "seq": seq, "error": f"SyntaxError: {e.msg}", "line": e.lineno}
+    except (RecursionError, MemoryError, ValueError) as e:
+        # Source too deeply nested or too large to render; the session starts over with the next edit
+        return {"type": "error", "seq": seq, "error": f"{type(e).__name__}: {e}"}
+    if profiler.stages:
+        metrics.observe(profiler)
+    if delta is None:
+        return {"type": "snapshot", "seq": seq, "dot": dot_source, **session.snapshot()}
+    return {"type": "delta", "seq": seq, **delta.as_message()}
+
+@app.websocket("/ws/live")
+async def live_edit(websocket: WebSocket):
+    """
+    Live editing: the client sends the module's source after (debounced) edits and gets back
+    the full DOT once, then only the node/edge/cluster changes of each edit (see live.LiveSession).
+    Messages that arrive while an edit is being rendered are coalesced; only the newest is rendered.
+    """
+    await websocket.accept()
+    session = LiveSession()
+    latest: Optional[str] = None
+    arrived = asyncio.Event()
+
+    async def receive():
+        nonlocal latest
+        while True:
+            latest = await websocket.receive_text()
+            arrived.set()
+
+    reader = asyncio.create_task(receive())
+    try:
+        while True:
+            waiter = asyncio.create_task(arrived.wait())
+            done, _ = await asyncio.wait({reader, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if reader in done:
+                waiter.cancel()
+                break
+            await asyncio.sleep(LIVE_DEBOUNCE)
+            arrived.clear()
+            text, latest = latest, None
+            await websocket.send_json(await asyncio.to_thread(live_reply, session, text))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+
+@app.get("/api/metrics")
+def get_metrics():
+    return JSONResponse(metrics.snapshot())
+
+@app.get("/api/cache-stats")
+def get_cache_stats():
+    stats = render_cache.stats()
+    stats["layout"] = layout_pool.cache.stats()
+    stats["encoded"] = encoded_bodies.stats()
+    stats["jobs"] = job_manager.stats()
+    stats["submissions"] = submissions.stats()
+    if render_store is not None:
+        stats["store"] = render_store.stats()
+    return JSONResponse(stats)
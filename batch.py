@@ -0,0 +1,345 @@
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence
+
+from ast_parser import parse_code
+from dot_render import iter_dot, write_dot
+from layout import layout_once, merge_options
+from pages import split_pages
+from profiling import Profiler
+from render_cache import config_hash, source_hash
+from render_store import default_store
+
+MANIFEST_NAME = '.codeviz-manifest.json'
+REPORT_NAME = 'codeviz-report.json'
+OUTPUT_FORMATS = ('png', 'svg', 'pdf', 'dot')
+# Written next to paged outputs (see render_pages): each page's DOT digest, so unchanged pages are skipped
+PAGE_MANIFEST_SUFFIX = '.pages.json'
+
+
+def collect_inputs(patterns: List[str]) -> List[str]:
+    """
+    Expand CLI inputs into a sorted list of Python files.
+    Directories are searched recursively; glob patterns support '**'.
+    """
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '__pycache__']
+                found.update(os.path.join(dirpath, f) for f in filenames if f.endswith('.py'))
+        elif glob.has_magic(pattern):
+            found.update(p for p in glob.glob(pattern, recursive=True) if p.endswith('.py') and os.path.isfile(p))
+        else:
+            found.add(pattern)
+    return sorted(os.path.abspath(p) for p in found)
+
+
+def output_base(source: str, root: str, out_dir: str) -> str:
+    """Output path without extension, mirroring the source layout under out_dir."""
+    relative = os.path.relpath(source, root)
+    return os.path.join(out_dir, os.path.splitext(relative)[0])
+
+
+def load_manifest(out_dir: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def render_file(source: str, out_base: str, fmt: str, known_hash: Optional[str] = None,
+                options: Optional[dict] = None, use_store: bool = True) -> dict:
+    """
+    Render one file; runs in a worker process. Never raises: failures are reported in the result.
+    known_hash is the manifest's hash for this file; a match means the output is still current.
+    options are passed through to the DOT emitter (e.g. max_depth, node_budget).
+    With use_store, DOT text and layouts come from (and go to) the shared render store.
+    The result's "stat" is the file's [mtime_ns, size] as of the read, for the manifest.
+    """
+    options = options or {}
+    result = {"source": source, "status": "ok", "error": None, "seconds": 0.0, "stages": {}}
+    start = time.perf_counter()
+    try:
+        with open(source) as f:
+            # Taken before reading: an edit made while rendering leaves a stat that no longer matches
+            st = os.fstat(f.fileno())
+            result["stat"] = [st.st_mtime_ns, st.st_size]
+            code = f.read()
+        result["hash"] = source_hash(code)
+        if known_hash is not None and known_hash == result["hash"]:
+            result["status"] = "skipped"
+            return result
+        if not code.strip():
+            raise ValueError("The input file is empty.")
+        profiler = Profiler()
+        store = default_store() if use_store else None
+        os.makedirs(os.path.dirname(out_base) or '.', exist_ok=True)
+        stats = {}
+        dot_source = None
+        if store is not None:
+            dot_key = store.key('dot', result["hash"], **options)
+            with profiler.stage('store'):
+                dot_source = store.get_text(dot_key)
+        if dot_source is None:
+            ast_dict = parse_code(code, profiler)
+            if "error" in ast_dict:
+                raise ValueError(ast_dict["error"])
+            if fmt == 'dot' and store is None:
+                with profiler.stage('dot') as stage, open(out_base + '.dot', 'w') as out:
+                    write_dot(ast_dict, out, stats=stats, **options)
+                    stage.count(**stats)
+            else:
+                with profiler.stage('dot') as stage:
+                    dot_source = ''.join(iter_dot(ast_dict, stats=stats, **options))
+                    stage.count(**stats)
+                if store is not None:
+                    store.put_text(dot_key, dot_source)
+        if fmt == 'dot':
+            if dot_source is not None:
+                with open(out_base + '.dot', 'w') as out:
+                    out.write(dot_source)
+            result["output"] = out_base + '.dot'
+        else:
+            def render_dot(**extra) -> str:
+                if not extra:
+                    return dot_source
+                return ''.join(iter_dot(parse_code(code), **merge_options(options, extra)))
+            # The engine (and any fallback) depends only on the DOT text and the limits; the
+            # positioned graph is stored too, so other formats are later exported without a layout
+            with profiler.stage('layout'):
+                outputs, steps = layout_once(render_dot, [fmt], store)
+            image = outputs[fmt]
+            if steps:
+                result["layout"] = steps
+            result["output"] = f"{out_base}.{fmt}"
+            with open(result["output"], 'wb') as out:
+                out.write(image)
+        result["stages"] = {s.name: round(s.seconds * 1000, 3) for s in profiler.stages}
+        result["nodes"] = stats.get("nodes")
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def run_batch(patterns: List[str], out_dir: str, fmt: str = 'png', jobs: Optional[int] = None,
+              force: bool = False, progress=print, max_depth: Optional[int] = None,
+              node_budget: Optional[int] = None, prune: Optional[str] = None, use_store: bool = True) -> dict:
+    """
+    Render every Python file matched by patterns into out_dir across a process pool.
+    - Files whose (mtime, size) and content hash match the manifest are skipped unless force is set.
+    - One bad file never aborts the run; failures are collected in the report.
+    - Writes the updated manifest and a JSON report into out_dir and returns the report.
+    - max_depth / node_budget render level-of-detail overviews and prune (a preset or rule spec, see
+      prune.parse_prune) leaves out low-information nodes; they are part of the config hash.
+    - use_store shares DOT text and layouts with every other run through the render store.
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError("jobs must be at least 1")
+    sources = collect_inputs(patterns)
+    if not sources:
+        raise ValueError("No Python files matched the given inputs")
+    root = os.path.commonpath([os.path.dirname(s) for s in sources])
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {} if force else load_manifest(out_dir)
+    options = {k: v for k, v in (("max_depth", max_depth), ("node_budget", node_budget), ("prune", prune))
+               if v is not None}
+    render_config = config_hash(format=fmt, **options)
+
+    results: List[dict] = []
+    tasks = []
+    for source in sources:
+        entry = manifest.get(source)
+        if entry and entry.get("config") == render_config and os.path.exists(entry.get("output", "")):
+            st = os.stat(source)
+            if [st.st_mtime_ns, st.st_size] == entry.get("stat"):
+                results.append({"source": source, "status": "skipped", "error": None, "seconds": 0.0,
+                                "hash": entry["hash"], "output": entry["output"], "stat": entry["stat"]})
+                continue
+            known_hash = entry.get("hash")
+        else:
+            known_hash = None
+        tasks.append((source, output_base(source, root, out_dir), fmt, known_hash, options, use_store))
+
+    start = time.perf_counter()
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            results.append(render_file(*task))
+            progress(_progress_line(results[-1], len(results), len(sources)))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(render_file, *task): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:  # e.g. a worker process died
+                    result = {"source": futures[future][0], "status": "failed",
+                              "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                results.append(result)
+                progress(_progress_line(result, len(results), len(sources)))
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        source = result["source"]
+        if result["status"] == "failed":
+            manifest.pop(source, None)
+            continue
+        if result["status"] == "ok":
+            manifest[source] = {"hash": result["hash"], "config": render_config, "output": result["output"]}
+        else:
+            result.setdefault("output", manifest[source]["output"])
+        # Record the stat signature of the version read, so the next run can skip it without reading it
+        manifest[source]["stat"] = result["stat"]
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    results.sort(key=lambda r: r["source"])
+    report = {
+        "format": fmt,
+        "jobs": jobs,
+        "elapsed_seconds": round(elapsed, 3),
+        "total": len(results),
+        "rendered": sum(r["status"] == "ok" for r in results),
+        "skipped": sum(r["status"] == "skipped" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "files": results,
+    }
+    with open(os.path.join(out_dir, REPORT_NAME), 'w') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def _progress_line(result: dict, done: int, total: int) -> str:
+    line = f"[{done}/{total}] {result['status']:<7} {result['source']} ({result['seconds']:.2f}s)"
+    if result["error"]:
+        line += f": {result['error']}"
+    return line
+
+
+def page_outputs(out_base: str, page: str, formats: Sequence[str], extensions: Dict[str, str]) -> Dict[str, str]:
+    return {fmt: f"{out_base}.{page}.{extensions.get(fmt, fmt)}" for fmt in formats}
+
+
+def render_page(code: str, page: str, dot_source: str, outputs: Dict[str, str], link: Optional[str] = None,
+                options: Optional[dict] = None, use_store: bool = True) -> dict:
+    """
+    Lay out one page into outputs ({format: path}); runs in a worker process and never raises.
+    Layouts that hit their limits re-split the module with the fallback's options (see
+    layout.adaptive_layout), which is why the source travels with the page's DOT.
+    """
+    result = {"page": page, "status": "ok", "error": None, "seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        def render_dot(**extra) -> str:
+            if not extra:
+                return dot_source
+            pages = split_pages(parse_code(code), link=link, **merge_options(options or {}, extra))
+            return next(p.dot_source for p in pages if p.name == page)
+        store = default_store() if use_store else None
+        rendered, steps = layout_once(render_dot, list(outputs), store)
+        for fmt, path in outputs.items():
+            with open(path, 'wb') as f:
+                f.write(rendered[fmt])
+        if steps:
+            result["layout"] = steps
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def render_pages(code: str, out_base: str, formats: Sequence[str] = ('svg',), jobs: Optional[int] = None,
+                 extensions: Optional[Dict[str, str]] = None, force: bool = False, options: Optional[dict] = None,
+                 use_store: bool = True) -> dict:
+    """
+    Render a module as pages into out_base.<page>.<ext>, laying pages out in parallel across a
+    process pool.
+    - A manifest (out_base + PAGE_MANIFEST_SUFFIX) records each page's DOT digest; pages whose
+      digest and outputs are unchanged are skipped, so after an edit only the pages it touched
+      are laid out again. Outputs of pages that no longer exist are removed.
+    - With svg among the formats, the overview's summary nodes link to the pages' SVG files.
+    - options are passed to split_pages (e.g. max_depth, node_budget); they are part of the manifest.
+    Returns a report with per-page results; a SyntaxError in code raises ValueError.
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError("jobs must be at least 1")
+    extensions = extensions or {}
+    options = options or {}
+    ast_dict = parse_code(code)
+    if "error" in ast_dict:
+        raise ValueError(ast_dict["error"])
+    link = f"{os.path.basename(out_base)}.{{name}}.{extensions.get('svg', 'svg')}" if 'svg' in formats else None
+    pages = split_pages(ast_dict, link=link, **options)
+    manifest_path = out_base + PAGE_MANIFEST_SUFFIX
+    manifest = {}
+    if not force:
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            pass
+    render_config = config_hash(formats=list(formats), **options)
+    previous = manifest.get("pages", {})
+    known = previous if manifest.get("config") == render_config else {}
+    os.makedirs(os.path.dirname(out_base) or '.', exist_ok=True)
+
+    results: List[dict] = []
+    tasks = []
+    for page in pages:
+        outputs = page_outputs(out_base, page.name, formats, extensions)
+        entry = known.get(page.name)
+        if entry and entry.get("hash") == page.digest and all(os.path.exists(p) for p in outputs.values()):
+            results.append({"page": page.name, "status": "skipped", "error": None, "seconds": 0.0})
+        else:
+            tasks.append((code, page.name, page.dot_source, outputs, link, options, use_store))
+
+    start = time.perf_counter()
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) <= 1:
+        results.extend(render_page(*task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+            futures = {executor.submit(render_page, *task): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:  # e.g. a worker process died
+                    results.append({"page": futures[future][1], "status": "failed",
+                                    "error": f"{type(e).__name__}: {e}", "seconds": 0.0})
+    elapsed = time.perf_counter() - start
+
+    status = {result["page"]: result["status"] for result in results}
+    current = {page.name for page in pages}
+    removed = set(previous) - current
+    for name in removed:
+        for path in previous[name].get("outputs", {}).values():
+            if os.path.exists(path):
+                os.remove(path)
+    manifest = {"config": render_config, "formats": list(formats), "pages": {
+        page.name: {**page.as_dict(), "outputs": page_outputs(out_base, page.name, formats, extensions)}
+        for page in pages if status[page.name] != "failed"}}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    order = {page.name: i for i, page in enumerate(pages)}
+    results.sort(key=lambda r: order[r["page"]])
+    return {
+        "jobs": jobs,
+        "elapsed_seconds": round(elapsed, 3),
+        "total": len(pages),
+        "rendered": sum(r["status"] == "ok" for r in results),
+        "skipped": sum(r["status"] == "skipped" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "removed": len(removed),
+        "pages": results,
+    }
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Benchmark ast_handlers.ast_to_dict against the previous recursive implementation.
+
+Usage:
+  python benchmarks/bench_ast_to_dict.py                 # stdlib corpus
+  python benchmarks/bench_ast_to_dict.py path/to/dir -r 5
+"""
+import argparse
+import ast
+import os
+import sys
+import sysconfig
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ast_handlers import POSITION_FIELDS, RENAMED_FIELDS, ASTNodeHandler, ast_to_dict
+
+
+def recursive_ast_to_dict(node) -> dict:
+    """The original recursive converter, kept as the reference for output and speed."""
+    if not isinstance(node, ast.AST):
+        return node
+    handler_name = f"handle_{type(node).__name__.lower()}"
+    handler = getattr(ASTNodeHandler, handler_name, None)
+    if handler:
+        node_dict = handler(node)
+    else:
+        node_dict = ASTNodeHandler.get_node_attributes(node)
+    for field, value in ast.iter_fields(node):
+        if field in ['lineno', 'col_offset', 'end_lineno', 'end_col_offset']:
+            continue
+        if value is None:
+            continue
+        if field in ['name', 'id', 'arg']:
+            node_dict[field] = value
+            continue
+        if isinstance(value, list):
+            node_dict[field] = [recursive_ast_to_dict(v) for v in value]
+        else:
+            node_dict[field] = recursive_ast_to_dict(value)
+    return node_dict
+
+
+def with_renamed_fields(tree):
+    """
+    The recursive version's output with fields moved as ast_to_dict stores them (RENAMED_FIELDS):
+    there, ExceptHandler.type overwrote the node's own 'type' in place.
+    """
+    stack = [tree]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, list):
+            stack.extend(value)
+            continue
+        if not isinstance(value, dict):
+            continue
+        if not isinstance(value['type'], str):
+            fields = {key: item for key, item in value.items() if key != 'type' and key not in POSITION_FIELDS}
+            node_type = value['type']
+            positions = {key: value[key] for key in POSITION_FIELDS}
+            value.clear()
+            value.update(type='ExceptHandler', **positions, **{RENAMED_FIELDS['type']: node_type}, **fields)
+        stack.extend(value.values())
+    return tree
+
+
+def load_corpus(root: str):
+    """Parse every readable .py file under root; returns a list of (path, tree)."""
+    trees = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != 'site-packages']
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    trees.append((path, ast.parse(f.read())))
+            except (SyntaxError, UnicodeDecodeError, ValueError, OSError):
+                continue
+    return trees
+
+
+def time_converter(convert, trees, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _, tree in trees:
+            convert(tree)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ast_to_dict (nodes/second)")
+    parser.add_argument("corpus", nargs='?', default=sysconfig.get_paths()['stdlib'],
+                        help="Directory of Python files (default: the local stdlib)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs per converter; the best is reported")
+    args = parser.parse_args()
+
+    trees = load_corpus(args.corpus)
+    node_count = sum(sum(1 for _ in ast.walk(tree)) for _, tree in trees)
+    print(f"Corpus: {args.corpus} ({len(trees)} files, {node_count} nodes)")
+
+    # Output must be identical; files too deep for the recursive version are skipped for comparison
+    comparable = []
+    for path, tree in trees:
+        try:
+            expected = with_renamed_fields(recursive_ast_to_dict(tree))
+        except RecursionError:
+            print(f"  recursive version hits RecursionError on {path}")
+            continue
+        # repr() also compares key order, which generate_dot depends on
+        if repr(ast_to_dict(tree)) != repr(expected):
+            print(f"Output mismatch for {path}")
+            sys.exit(1)
+        comparable.append((path, tree))
+    comparable_nodes = sum(sum(1 for _ in ast.walk(tree)) for _, tree in comparable)
+
+    # Deeply nested generated code: a long operator chain
+    chain = ast.parse(" + ".join(["a"] * 2000))
+    for label, convert in (("recursive", recursive_ast_to_dict), ("iterative", ast_to_dict)):
+        try:
+            convert(chain)
+            print(f"{label:>10}: 2000-term expression chain converted")
+        except RecursionError:
+            print(f"{label:>10}: 2000-term expression chain raises RecursionError")
+
+    for label, convert in (("recursive", recursive_ast_to_dict), ("iterative", ast_to_dict)):
+        elapsed = time_converter(convert, comparable, args.repeat)
+        print(f"{label:>10}: {elapsed:8.3f}s  {comparable_nodes / elapsed:12,.0f} nodes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+Benchmark the render pipeline stage by stage and check it against a stored baseline.
+
+Each corpus (the synthetic shapes from corpora.py plus a sample of the local stdlib) goes
+through parse_code (stages 'parse' and 'ast_to_dict'), generate_dot and, when Graphviz is
+installed, an SVG layout. Times are the best of --repeat runs; peak memory comes from one
+extra run under tracemalloc.
+
+Usage:
+  python benchmarks/bench_pipeline.py                      # compare with benchmarks/baseline.json
+  python benchmarks/bench_pipeline.py --save-baseline      # record a new baseline
+  python benchmarks/bench_pipeline.py --scale 4 --no-layout --baseline none
+
+Exits with status 1 when any stage is slower (or uses more memory) than the baseline by more
+than the threshold. Baselines are machine-specific: record one on the machine that checks it.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import sysconfig
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ast_parser import parse_code
+from dot_render import generate_dot
+from layout import run_layout
+from profiling import Profiler
+from corpora import synthetic_corpus
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+STAGES = ('parse', 'ast_to_dict', 'generate_dot', 'layout')
+
+# Stages faster than this in both runs are too noisy to compare
+MIN_COMPARED_MS = 5.0
+
+
+def stdlib_sources(count: int) -> List[Tuple[str, str]]:
+    """An evenly spaced, deterministic sample of `count` parseable files from the local stdlib."""
+    root = sysconfig.get_paths()['stdlib']
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in ('site-packages', '__pycache__'))
+        paths.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith('.py'))
+    step = max(1, len(paths) // count) if count else 1
+    sources = []
+    for path in paths[::step]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                code = f.read()
+            compile(code, path, 'exec', flags=0x400, dont_inherit=True)  # PyCF_ONLY_AST
+        except (SyntaxError, UnicodeDecodeError, ValueError, OSError):
+            continue
+        sources.append((os.path.relpath(path, root), code))
+        if len(sources) == count:
+            break
+    return sources
+
+
+def run_corpus(sources: List[str], layout: bool, layout_max_nodes: int,
+               trace_memory: bool = False) -> Tuple[Dict[str, dict], int]:
+    """
+    Run every source through the pipeline once. Returns ({stage: {'seconds', 'peak_bytes'}}, nodes):
+    times are summed over the sources, peaks are the largest single one.
+    """
+    stages: Dict[str, dict] = {}
+    nodes = 0
+    for code in sources:
+        profiler = Profiler(trace_memory=trace_memory)
+        ast_dict = parse_code(code, profiler)
+        if "error" in ast_dict:
+            raise ValueError(ast_dict["error"])
+        stats = {}
+        with profiler.stage('generate_dot'):
+            graph = generate_dot(ast_dict, stats=stats)
+        nodes += stats.get('nodes', 0)
+        if layout and stats.get('nodes', 0) <= layout_max_nodes:
+            with profiler.stage('layout'):
+                run_layout(graph.source, 'svg')
+        for stage in profiler.stages:
+            record = stages.setdefault(stage.name, {'seconds': 0.0, 'peak_bytes': None})
+            record['seconds'] += stage.seconds
+            if stage.peak_bytes is not None:
+                record['peak_bytes'] = max(record['peak_bytes'] or 0, stage.peak_bytes)
+    return stages, nodes
+
+
+def measure(sources: List[str], repeat: int, layout: bool, layout_max_nodes: int) -> dict:
+    best: Dict[str, float] = {}
+    nodes = 0
+    for _ in range(repeat):
+        stages, nodes = run_corpus(sources, layout, layout_max_nodes)
+        for name, record in stages.items():
+            best[name] = min(best.get(name, float('inf')), record['seconds'])
+    # Peak memory is measured separately: tracemalloc slows every stage down
+    traced, _ = run_corpus(sources, layout, layout_max_nodes, trace_memory=True)
+    tracemalloc.stop()
+    return {
+        "files": len(sources),
+        "nodes": nodes,
+        "stages": {
+            name: {"ms": round(best[name] * 1000, 3),
+                   "peak_kib": round(traced[name]['peak_bytes'] / 1024, 1) if name in traced else None}
+            for name in STAGES if name in best
+        },
+    }
+
+
+def compare(results: dict, baseline: dict, time_threshold: float, memory_threshold: float) -> List[str]:
+    """Describe every stage that regressed past its threshold relative to the baseline."""
+    regressions = []
+    for corpus, result in results.items():
+        expected = baseline.get(corpus)
+        if expected is None:
+            continue
+        for stage, current in result["stages"].items():
+            previous = expected["stages"].get(stage)
+            if previous is None:
+                continue
+            if max(current["ms"], previous["ms"]) >= MIN_COMPARED_MS and \
+                    current["ms"] > previous["ms"] * (1 + time_threshold):
+                regressions.append(f"{corpus}/{stage}: {current['ms']:.1f} ms vs {previous['ms']:.1f} ms baseline "
+                                   f"(+{(current['ms'] / previous['ms'] - 1) * 100:.0f}%)")
+            if current["peak_kib"] and previous.get("peak_kib") and \
+                    current["peak_kib"] > previous["peak_kib"] * (1 + memory_threshold):
+                regressions.append(f"{corpus}/{stage}: peak {current['peak_kib']:.0f} KiB vs "
+                                   f"{previous['peak_kib']:.0f} KiB baseline "
+                                   f"(+{(current['peak_kib'] / previous['peak_kib'] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_table(results: dict, baseline: Optional[dict]) -> None:
+    print(f"{'corpus':<16} {'stage':<13} {'time (ms)':>10} {'baseline':>10} {'peak (KiB)':>11} {'baseline':>10}")
+    for corpus, result in results.items():
+        expected = (baseline or {}).get(corpus, {}).get("stages", {})
+        for stage, current in result["stages"].items():
+            previous = expected.get(stage, {})
+            base_ms = f"{previous['ms']:.1f}" if 'ms' in previous else '-'
+            peak = f"{current['peak_kib']:.0f}" if current['peak_kib'] is not None else '-'
+            base_peak = f"{previous['peak_kib']:.0f}" if previous.get('peak_kib') is not None else '-'
+            print(f"{corpus:<16} {stage:<13} {current['ms']:>10.1f} {base_ms:>10} {peak:>11} {base_peak:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse/ast_to_dict/generate_dot/layout against a baseline")
+    parser.add_argument("--scale", type=float, default=1.0, help="Size multiplier for the synthetic corpora")
+    parser.add_argument("--stdlib-files", type=int, default=100,
+                        help="Number of stdlib files in the real-world corpus (0 to skip it)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timed runs per corpus; the best is kept")
+    parser.add_argument("--no-layout", action="store_true", help="Skip the Graphviz layout stage")
+    parser.add_argument("--layout-max-nodes", type=int, default=5000,
+                        help="Only lay out graphs up to this many nodes (layout time grows superlinearly)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="Baseline JSON file, or 'none' to skip the comparison")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--time-threshold", type=float, default=0.25,
+                        help="Allowed slowdown per stage as a fraction (default: 0.25 = 25%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.10,
+                        help="Allowed growth of peak memory per stage as a fraction (default: 0.10)")
+    args = parser.parse_args()
+
+    layout = not args.no_layout and shutil.which('dot') is not None
+    if not args.no_layout and not layout:
+        print("Graphviz 'dot' not found; skipping the layout stage")
+    settings = {"scale": args.scale, "stdlib_files": args.stdlib_files, "layout_max_nodes": args.layout_max_nodes}
+
+    corpora = [(name, [code]) for name, code in synthetic_corpus(args.scale)]
+    if args.stdlib_files:
+        corpora.append(('stdlib', [code for _, code in stdlib_sources(args.stdlib_files)]))
+
+    results = {}
+    for name, sources in corpora:
+        results[name] = measure(sources, args.repeat, layout, args.layout_max_nodes)
+        print(f"  {name}: {results[name]['files']} file(s), {results[name]['nodes']} nodes", file=sys.stderr)
+
+    baseline = None
+    if args.baseline != 'none' and not args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            if stored.get("settings") != settings:
+                sys.exit(f"Baseline {args.baseline} was recorded with {stored.get('settings')}, not {settings}")
+            baseline = stored["corpora"]
+        else:
+            print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({"python": platform.python_version(), "platform": platform.platform(),
+                       "settings": settings, "corpora": results}, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions beyond the thresholds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Synthetic Python sources of controlled size and shape for the benchmarks.
+
+Every generator is deterministic and takes a size argument, so a corpus can be scaled up
+to find where a stage stops scaling linearly. `synthetic_corpus(scale)` returns the
+standard set used by bench_pipeline.py.
+"""
+from typing import Callable, Dict, List, Tuple
+
+# Python's tokenizer rejects more than 100 indentation levels
+MAX_BLOCK_DEPTH = 90
+
+
+def deep_nesting(blocks: int, depth: int = MAX_BLOCK_DEPTH) -> str:
+    """`blocks` functions, each a chain of `depth` nested if statements with a statement per level."""
+    depth = min(depth, MAX_BLOCK_DEPTH)
+    lines = []
+    for b in range(blocks):
+        lines.append(f"def nested_{b}(x):")
+        for level in range(depth):
+            indent = '    ' * (level + 1)
+            lines.append(f"{indent}y{level} = x + {level}")
+            lines.append(f"{indent}if y{level} > {level * 2}:")
+        lines.append('    ' * (depth + 1) + "return x")
+        lines.append("")
+    return '\n'.join(lines) + '\n'
+
+
+def wide_module(functions: int) -> str:
+    """A flat module of `functions` small top-level functions."""
+    lines = []
+    for f in range(functions):
+        lines.append(f"def func_{f}(a, b={f}, *args, **kwargs):")
+        lines.append(f"    total = a + b * {f}")
+        lines.append(f"    for item in args:")
+        lines.append(f"        total += item")
+        lines.append(f"    return total if total > {f} else kwargs.get('default', {f})")
+        lines.append("")
+    return '\n'.join(lines) + '\n'
+
+
+def long_expression(terms: int) -> str:
+    """One assignment whose value is a left-leaning chain of `terms` binary operations."""
+    operators = ('+', '-', '*', '//', '%')
+    parts = ["value = a0"]
+    for t in range(1, terms):
+        parts.append(f" {operators[t % len(operators)]} a{t % 50}")
+    return ''.join(parts) + '\n'
+
+
+def many_classes(classes: int, methods: int = 6) -> str:
+    """`classes` decorated classes with attributes, properties and `methods` methods each."""
+    lines = ["import dataclasses", ""]
+    for c in range(classes):
+        base = f"Class{c - 1}" if c else "object"
+        lines.append("@dataclasses.dataclass")
+        lines.append(f"class Class{c}({base}):")
+        lines.append(f"    '''Generated class {c}.'''")
+        lines.append(f"    field_{c}: int = {c}")
+        lines.append("")
+        lines.append("    @property")
+        lines.append(f"    def doubled(self) -> int:")
+        lines.append(f"        return self.field_{c} * 2")
+        for m in range(methods):
+            lines.append("")
+            lines.append(f"    def method_{m}(self, value: int, *, scale: float = 1.0) -> float:")
+            lines.append(f"        result = [v * scale for v in range(value) if v % {m + 2}]")
+            lines.append(f"        return sum(result) + self.field_{c} + len(f'{{value}}-{m}')")
+        lines.append("")
+    return '\n'.join(lines) + '\n'
+
+
+# name -> (generator, size at scale 1)
+SYNTHETIC_SHAPES: Dict[str, Tuple[Callable[[int], str], int]] = {
+    'deep_nesting': (deep_nesting, 20),
+    'wide_module': (wide_module, 400),
+    'long_expression': (long_expression, 5000),
+    'many_classes': (many_classes, 100),
+}
+
+
+def synthetic_corpus(scale: float = 1.0) -> List[Tuple[str, str]]:
+    """(name, source) pairs for every shape, each sized by scale."""
+    return [(name, generator(max(1, int(size * scale))))
+            for name, (generator, size) in SYNTHETIC_SHAPES.items()]
@@ -0,0 +1,468 @@
+import html
+import sys
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ast_paths import join_path, path_node_id
+from detail import child_fields, is_node
+from dot_render import (DEFAULT_EDGE_ATTRS, NODE_DEFAULTS, _attr_line, _edge_line, _graph_attr_line, _node_line,
+                        _subgraph_head, _subgraph_tail, get_node_color, main_label_content)
+from graphviz.quoting import quote
+
+FUNCTION_TYPES = ('FunctionDef', 'AsyncFunctionDef')
+MODULE_NAME = '<module>'
+
+# Source lines longer than this are cut in block labels
+MAX_STATEMENT_TEXT = 60
+
+CFG_GRAPH_ATTRS = {'rankdir': 'TB', 'ranksep': '0.3', 'nodesep': '0.3', 'compound': 'true'}
+ENTRY_EXIT_ATTRS = {'shape': 'oval', 'style': 'filled', 'fillcolor': 'grey90', 'width': '0.5'}
+# Edges by label: jumps back to a loop header are dashed, exceptional ones red
+EDGE_STYLES = {
+    'loop': {'style': 'dashed'},
+    'continue': {'style': 'dashed'},
+    'raise': {'color': 'firebrick', 'fontcolor': 'firebrick'},
+    'except': {'color': 'firebrick', 'fontcolor': 'firebrick', 'style': 'dashed'},
+}
+
+# A statement of a block: (AST path, node type, first line or None, label text as HTML)
+Statement = Tuple[str, str, Optional[int], str]
+
+
+class BasicBlock:
+    """A run of statements executed in sequence; kind is 'entry', 'exit' or 'block'."""
+    __slots__ = ('index', 'kind', 'statements', 'reachable')
+
+    def __init__(self, index: int, kind: str = 'block'):
+        self.index = index
+        self.kind = kind
+        self.statements: List[Statement] = []
+        self.reachable = True
+
+
+class ControlFlowGraph:
+    """Basic blocks of one function (or of module-level code) and the labelled edges between them."""
+    __slots__ = ('name', 'path', 'blocks', 'edges', 'ast_nodes')
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.blocks: List[BasicBlock] = []
+        self.edges: List[Tuple[int, int, Optional[str]]] = []
+        self.ast_nodes = 0
+
+    def add_block(self, kind: str = 'block') -> BasicBlock:
+        block = BasicBlock(len(self.blocks), kind)
+        self.blocks.append(block)
+        return block
+
+    def add_edge(self, tail: BasicBlock, head: BasicBlock, label: Optional[str] = None) -> None:
+        self.edges.append((tail.index, head.index, label))
+
+    def block_id(self, index: int) -> str:
+        """DOT node ID of a block; prefixed with the function's node ID so graphs can share one file."""
+        return f"{path_node_id(self.path)}#b{index}"
+
+    def stats(self) -> Dict[str, int]:
+        return {"blocks": len(self.blocks), "edges": len(self.edges), "ast_nodes": self.ast_nodes,
+                "statements": sum(len(block.statements) for block in self.blocks)}
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "blocks": [{"index": block.index, "kind": block.kind, "reachable": block.reachable,
+                        "statements": [{"path": path, "type": node_type, "lineno": lineno}
+                                       for path, node_type, lineno, _ in block.statements]}
+                       for block in self.blocks],
+            "edges": [[tail, head, label] for tail, head, label in self.edges],
+        }
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the graph, for cache accounting."""
+        statements = sum(sys.getsizeof(text) + 64 for block in self.blocks for _, _, _, text in block.statements)
+        return statements + 120 * len(self.blocks) + 80 * len(self.edges)
+
+
+def statement_text(node, lines: Optional[Sequence[str]]) -> str:
+    """
+    HTML label text for a statement: its first source line (the header of compound statements)
+    when the source is available, otherwise the node's regular label.
+    """
+    lineno = node.get('lineno')
+    if lines is None or not lineno or lineno > len(lines):
+        return main_label_content(node)
+    text = lines[lineno - 1][node.get('col_offset') or 0:].strip()
+    if len(text) > MAX_STATEMENT_TEXT:
+        text = text[:MAX_STATEMENT_TEXT - 1] + '…'
+    return html.escape(text)
+
+
+def is_constant_true(test) -> bool:
+    """`while True:` / `while 1:`, loops that only end through break."""
+    return test.get('type') == 'Constant' and test.get('value') in (True, 1)
+
+
+class CFGBuilder:
+    """
+    Builds the ControlFlowGraph of one function body from its AST dictionary (or NodeView).
+    - Compound statements end their block: If branches on True/False, While and For loop back
+      from the end of their body (dashed 'loop' edges) and leave on False/'done' (through their
+      else block), Match branches to one block per case, With opens a block for its body, and
+      Try enters each handler from the start of its body ('except' edges).
+    - return, raise, break and continue jump to the exit block, the innermost handlers (or the
+      exit), the loop's successor and the loop header; statements after them start blocks
+      that are marked unreachable.
+    - finally blocks are entered from normal completion of the try body, else block and
+      handlers, and from jumps out of them, which continue from the end of the finally block.
+    - Nested functions and classes are single statements here; they get their own graph.
+    Blocks left empty by joins are removed afterwards. Recursion follows statement nesting,
+    which Python's tokenizer caps at 100 levels.
+    """
+    def __init__(self, name: str, path: str, lines: Optional[Sequence[str]] = None):
+        self.graph = ControlFlowGraph(name, path)
+        self.lines = lines
+        self.entry = self.graph.add_block('entry')
+        self.exit = self.graph.add_block('exit')
+        # Jump targets, each with the number of enclosing finally blocks where it was set up
+        self.loops: List[Tuple[BasicBlock, BasicBlock, int]] = []  # (continue target, break target, depth)
+        self.handlers: List[Tuple[List[BasicBlock], int]] = []  # handler blocks of the enclosing try statements
+        # finally blocks being built, innermost last, with the jumps they pass on: (target, label, depth)
+        self.finals: List[Tuple[BasicBlock, Dict[Tuple[int, str], Tuple[BasicBlock, str, int]]]] = []
+        self.incoming: Dict[int, int] = {}
+
+    def build(self, body: list, field: str = 'body') -> ControlFlowGraph:
+        start = self.new_block()
+        self.edge(self.entry, start)
+        end = self.visit_body(body, start, self.graph.path, field)
+        if end is not None:
+            self.edge(end, self.exit)
+        self._remove_empty_blocks()
+        self._mark_reachable()
+        return self.graph
+
+    def new_block(self) -> BasicBlock:
+        return self.graph.add_block()
+
+    def edge(self, tail: BasicBlock, head: BasicBlock, label: Optional[str] = None) -> None:
+        self.graph.add_edge(tail, head, label)
+        self.incoming[head.index] = self.incoming.get(head.index, 0) + 1
+
+    def jump(self, block: BasicBlock, target: BasicBlock, label: str, depth: int = 0) -> None:
+        """Edge for a jump to a target set up outside `depth` finally blocks: through the innermost finally still in between."""
+        if len(self.finals) > depth:
+            final, pending = self.finals[-1]
+            self.edge(block, final, label)
+            pending[(target.index, label)] = (target, label, depth)
+        else:
+            self.edge(block, target, label)
+
+    def add_statement(self, block: BasicBlock, node, path: str) -> None:
+        block.statements.append((path, node['type'], node.get('lineno'), statement_text(node, self.lines)))
+
+    def join(self, *ends: Optional[BasicBlock]) -> Optional[BasicBlock]:
+        """A new block reached from every end that falls through, or None if none does."""
+        ends = [end for end in ends if end is not None]
+        if not ends:
+            return None
+        after = self.new_block()
+        for end in ends:
+            self.edge(end, after)
+        return after
+
+    def visit_body(self, statements: list, block: Optional[BasicBlock], path: str, field: str) -> Optional[BasicBlock]:
+        """Add statements[i] (at path.field.i) after block; returns the block where control continues."""
+        for i, node in enumerate(statements):
+            if block is None:
+                block = self.new_block()  # unreachable code after a jump
+            visit = getattr(self, f"visit_{node['type']}", None)
+            node_path = join_path(path, field, i)
+            if visit is None:
+                self.add_statement(block, node, node_path)
+            else:
+                block = visit(node, block, node_path)
+        return block
+
+    def visit_If(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        self.add_statement(block, node, path)
+        then_block = self.new_block()
+        self.edge(block, then_block, 'True')
+        then_end = self.visit_body(node['body'], then_block, path, 'body')
+        if not node.get('orelse'):
+            after = self.join(then_end)
+            if after is None:
+                after = self.new_block()
+            self.edge(block, after, 'False')
+            return after
+        else_block = self.new_block()
+        self.edge(block, else_block, 'False')
+        else_end = self.visit_body(node['orelse'], else_block, path, 'orelse')
+        return self.join(then_end, else_end)
+
+    def _loop(self, node, block: BasicBlock, path: str, enter: str, leave: Optional[str]) -> Optional[BasicBlock]:
+        header = self.new_block()
+        self.edge(block, header)
+        self.add_statement(header, node, path)
+        body = self.new_block()
+        self.edge(header, body, enter)
+        after = self.new_block()
+        self.loops.append((header, after, len(self.finals)))
+        end = self.visit_body(node['body'], body, path, 'body')
+        self.loops.pop()
+        if end is not None:
+            self.edge(end, header, 'loop')
+        if leave is not None:
+            if node.get('orelse'):
+                else_block = self.new_block()
+                self.edge(header, else_block, leave)
+                else_end = self.visit_body(node['orelse'], else_block, path, 'orelse')
+                if else_end is not None:
+                    self.edge(else_end, after)
+            else:
+                self.edge(header, after, leave)
+        return after if self.incoming.get(after.index) else None
+
+    def visit_While(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        return self._loop(node, block, path, 'True', None if is_constant_true(node['test']) else 'False')
+
+    def visit_For(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        return self._loop(node, block, path, 'next', 'done')
+
+    visit_AsyncFor = visit_For
+
+    def visit_With(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        self.add_statement(block, node, path)
+        body = self.new_block()
+        self.edge(block, body, 'with')
+        return self.join(self.visit_body(node['body'], body, path, 'body'))
+
+    visit_AsyncWith = visit_With
+
+    def visit_Try(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        body = self.new_block()
+        self.edge(block, body)
+        self.add_statement(body, node, path)
+        handlers = []
+        for i, handler in enumerate(node.get('handlers') or ()):
+            handler_block = self.new_block()
+            self.add_statement(handler_block, handler, join_path(path, 'handlers', i))
+            handlers.append(handler_block)
+            self.edge(body, handler_block, 'except')
+        final = self.new_block() if node.get('finalbody') else None
+        if final is not None:
+            self.finals.append((final, {}))
+        self.handlers.append((handlers, len(self.finals)))
+        end = self.visit_body(node['body'], body, path, 'body')
+        self.handlers.pop()
+        if end is not None and node.get('orelse'):
+            else_block = self.new_block()
+            self.edge(end, else_block, 'else')
+            end = self.visit_body(node['orelse'], else_block, path, 'orelse')
+        ends = [end] + [self.visit_body(handler['body'], handler_block, join_path(path, 'handlers', i), 'body')
+                        for i, (handler, handler_block) in enumerate(zip(node.get('handlers') or (), handlers))]
+        if final is None:
+            return self.join(*ends)
+        _, pending = self.finals.pop()
+        falls_through = False
+        for end in ends:
+            if end is not None:
+                self.edge(end, final, 'finally')
+                falls_through = True
+        end = self.visit_body(node['finalbody'], final, path, 'finalbody')
+        if end is None:
+            return None
+        # Jumps that went through the finally block continue to their targets from its end
+        for target, label, depth in pending.values():
+            self.jump(end, target, label, depth)
+        return end if falls_through else None
+
+    visit_TryStar = visit_Try
+
+    def visit_Match(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        self.add_statement(block, node, path)
+        ends = []
+        exhaustive = False
+        for i, case in enumerate(node['cases']):
+            case_block = self.new_block()
+            pattern = case['pattern']
+            self.edge(block, case_block, f"case {html.unescape(statement_text(pattern, self.lines)).rstrip(':')}")
+            ends.append(self.visit_body(case['body'], case_block, join_path(path, 'cases', i), 'body'))
+            # `case _:` (or a bare capture) without a guard matches everything
+            exhaustive |= pattern['type'] == 'MatchAs' and pattern.get('pattern') is None and case.get('guard') is None
+        after = self.join(*ends)
+        if not exhaustive:
+            if after is None:
+                after = self.new_block()
+            self.edge(block, after, 'no match')
+        return after
+
+    def visit_Return(self, node, block: BasicBlock, path: str) -> None:
+        self.add_statement(block, node, path)
+        self.jump(block, self.exit, 'return')
+
+    def visit_Raise(self, node, block: BasicBlock, path: str) -> None:
+        self.add_statement(block, node, path)
+        # The innermost try statement with except clauses catches it; try/finally statements
+        # without any only pass it on (through their finally block, see jump())
+        handlers, depth = next(((h, d) for h, d in reversed(self.handlers) if h), ([self.exit], 0))
+        for handler in handlers:
+            self.jump(block, handler, 'raise', depth)
+
+    def visit_Break(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        self.add_statement(block, node, path)
+        if not self.loops:
+            return block  # a syntax error Python reports at compile time, not in the AST
+        _, after, depth = self.loops[-1]
+        self.jump(block, after, 'break', depth)
+
+    def visit_Continue(self, node, block: BasicBlock, path: str) -> Optional[BasicBlock]:
+        self.add_statement(block, node, path)
+        if not self.loops:
+            return block
+        header, _, depth = self.loops[-1]
+        self.jump(block, header, 'continue', depth)
+
+    def _remove_empty_blocks(self) -> None:
+        """Drop statement-less blocks that just fall through to one successor, and renumber the rest."""
+        graph = self.graph
+        outgoing: Dict[int, List[Tuple[int, Optional[str]]]] = {}
+        for tail, head, label in graph.edges:
+            outgoing.setdefault(tail, []).append((head, label))
+        forward = {}
+        for block in graph.blocks:
+            edges = outgoing.get(block.index, [])
+            if block.kind == 'block' and not block.statements and len(edges) <= 1 \
+                    and all(label is None for _, label in edges):
+                forward[block.index] = edges[0][0] if edges else None
+
+        def target(index: int) -> Optional[int]:
+            seen = set()
+            while index in forward and index not in seen:
+                seen.add(index)
+                index = forward[index]
+                if index is None:
+                    return None
+            return index
+
+        kept = [block for block in graph.blocks if block.index not in forward]
+        numbers = {block.index: i for i, block in enumerate(kept)}
+        edges = {}
+        for tail, head, label in graph.edges:
+            if tail in forward:
+                continue
+            head = target(head)
+            if head is not None:
+                edges[(numbers[tail], numbers[head], label)] = None
+        for block in kept:
+            block.index = numbers[block.index]
+        graph.blocks = kept
+        graph.edges = list(edges)
+
+    def _mark_reachable(self) -> None:
+        graph = self.graph
+        successors: Dict[int, List[int]] = {}
+        for tail, head, _ in graph.edges:
+            successors.setdefault(tail, []).append(head)
+        reached = {self.entry.index}
+        stack = [self.entry.index]
+        while stack:
+            for head in successors.get(stack.pop(), ()):
+                if head not in reached:
+                    reached.add(head)
+                    stack.append(head)
+        for block in graph.blocks:
+            block.reachable = block.index in reached or block.kind == 'exit'
+
+
+def iter_functions(ast_dict) -> Iterator[Tuple[str, str, object]]:
+    """Yield (qualified name, AST path, node) for module-level code and every function, in source order."""
+    yield MODULE_NAME, '', ast_dict
+    # (node, path, qualified name prefix of what it defines)
+    stack = [(ast_dict, '', '')]
+    while stack:
+        node, path, prefix = stack.pop()
+        if node['type'] in FUNCTION_TYPES:
+            yield f"{prefix}{node['name']}", path, node
+            prefix = f"{prefix}{node['name']}.<locals>."
+        elif node['type'] == 'ClassDef':
+            prefix = f"{prefix}{node['name']}."
+        children = []
+        for field, value in child_fields(node):
+            if isinstance(value, list):
+                children.extend((item, join_path(path, field, i), prefix) for i, item in enumerate(value) if is_node(item))
+            else:
+                children.append((value, join_path(path, field), prefix))
+        stack.extend(reversed(children))
+
+
+def count_nodes(node) -> int:
+    """Number of AST nodes under node (inclusive), for comparing graph sizes."""
+    count = 0
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        count += 1
+        for _, value in child_fields(current):
+            if isinstance(value, list):
+                stack.extend(item for item in value if is_node(item))
+            else:
+                stack.append(value)
+    return count
+
+
+def build_cfgs(ast_dict, lines: Optional[Sequence[str]] = None, function: Optional[str] = None) -> List[ControlFlowGraph]:
+    """
+    Control-flow graphs of module-level code and of every function in ast_dict, or only of
+    function, given as a qualified name ('Game.update', '<module>') or an AST path ('body.3').
+    lines (the source split into lines) gives blocks their source text. Raises KeyError when
+    no function matches.
+    """
+    graphs = []
+    for name, path, node in iter_functions(ast_dict):
+        if function is not None and function not in (name, path):
+            continue
+        graph = CFGBuilder(name, path, lines).build(node['body'])
+        graph.ast_nodes = count_nodes(node)
+        graphs.append(graph)
+    if function is not None and not graphs:
+        raise KeyError(f"No function '{function}'")
+    return graphs
+
+
+def _block_label(block: BasicBlock, graph: ControlFlowGraph) -> str:
+    if block.kind != 'block':
+        return f"<<B>{html.escape(graph.name) if block.kind == 'entry' else 'exit'}</B>>"
+    rows = ''.join(
+        f"<TR><TD ALIGN='RIGHT' BGCOLOR='{get_node_color(node_type)}'><FONT POINT-SIZE='7' COLOR='grey40'>"
+        f"{lineno or ''}</FONT></TD><TD ALIGN='LEFT' BGCOLOR='{get_node_color(node_type)}'>{text}</TD></TR>"
+        for _, node_type, lineno, text in block.statements)
+    return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='2'>{rows}</TABLE>>"
+
+
+def iter_cfg_dot(graphs: List[ControlFlowGraph], name: str = 'cfg') -> Iterator[str]:
+    """
+    Yield DOT for control-flow graphs: one cluster per function, one node per basic block
+    listing its statements (each row coloured by statement type as in the AST view), and
+    labelled branch, loop and jump edges. Unreachable blocks are dashed.
+    """
+    yield f"digraph {quote(name)} {{\n"
+    yield _attr_line(0, 'node', **{**NODE_DEFAULTS, 'margin': '0.05'})
+    yield _attr_line(0, 'graph', **CFG_GRAPH_ATTRS)
+    yield _attr_line(0, 'edge', **DEFAULT_EDGE_ATTRS)
+    for graph in graphs:
+        yield _subgraph_head(0, f"cluster_cfg_{path_node_id(graph.path)}")
+        yield _graph_attr_line(1, label=f"<<B>{html.escape(graph.name)}</B>>", style='rounded', color='grey60',
+                               labeljust='l')
+        for block in graph.blocks:
+            attrs = dict(ENTRY_EXIT_ATTRS) if block.kind != 'block' else {}
+            if not block.reachable:
+                attrs['style'] = 'dashed'
+            yield _node_line(1, graph.block_id(block.index), _block_label(block, graph), **attrs)
+        for tail, head, label in graph.edges:
+            yield _edge_line(1, graph.block_id(tail), graph.block_id(head), label=label,
+                             **EDGE_STYLES.get(label, {}))
+        yield _subgraph_tail(0)
+    yield "}\n"
+
+
+def cfg_dot(graphs: List[ControlFlowGraph], name: str = 'cfg') -> str:
+    return ''.join(iter_cfg_dot(graphs, name))
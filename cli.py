@@ -1,26 +1,160 @@
 import argparse
+import glob
+import json
+import os
+import time
 from ast_parser import parse_code
-from dot_render import generate_dot
+import sys
+from batch import OUTPUT_FORMATS, render_pages, run_batch
+from dot_render import generate_dot, iter_dot, write_dot
+from layout import POSITIONED_FORMAT, export_layout, graph_size, layout_once, layout_plan, merge_options, run_layout
+from render_cache import source_hash
+from render_store import default_store
+from incremental import IncrementalRenderer, iter_changes
+from project_index import OVERVIEW_DETAILS, ProjectIndex, overview_dot
+from profiling import NULL_PROFILER, Profiler
+from ast_diff import AstDiff, diff_dot
+from cfg import build_cfgs, cfg_dot
+from pages import split_pages
+from prune import parse_prune
+
+# Single-file outputs with -o; 'scene' is the JSON scene the web frontend draws without a layout engine
+EXPORT_FORMATS = ('png', 'svg', 'pdf', 'xdot', 'scene')
+EXPORT_EXTENSIONS = {'scene': 'scene.json'}
+
+def parse_export_formats(value):
+    formats = [fmt.strip() for fmt in value.split(',') if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(f"formats must be among: {', '.join(EXPORT_FORMATS)}")
+    return formats
 
 def main():
     parser = argparse.ArgumentParser(
         description="Python AST Parser\n\n"
                     "Examples:\n"
                     "  python cli.py example.py\n"
-                    "  python cli.py example.py -o output_ast\n\n"
-                    "Input: A valid Python file (e.g., example.py).\n"
-                    "Output: A Graphviz DOT file or PNG (if -o is specified).",
+                    "  python cli.py example.py -o output_ast\n"
+                    "  python cli.py example.py -o output_ast --profile\n"
+                    "  python cli.py example.py -o output_ast --export svg,png,scene\n"
+                    "  python cli.py example.py -o output_ast --watch\n"
+                    "  python cli.py src/ 'lib/**/*.py' --out-dir docs/ast -j 8 -f svg\n"
+                    "  python cli.py src/ --overview classes -o overview -f svg\n"
+                    "  python cli.py new.py --diff old.py -o changes\n"
+                    "  python cli.py example.py --cfg Game.update -o update_cfg\n\n"
+                    "Input: A valid Python file (e.g., example.py), or directories/globs for batch mode.\n"
+                    "Output: A Graphviz DOT file or PNG (if -o is specified).\n"
+                    "Batch mode writes one output per file plus codeviz-report.json into --out-dir.",
         formatter_class=argparse.RawTextHelpFormatter
     )
-    parser.add_argument("file", help="Python file to parse")
+    parser.add_argument("files", nargs='+', metavar="file",
+                        help="Python file to parse (several files, directories or glob patterns enable batch mode)")
     parser.add_argument("-o", "--output", 
                         help="Output file name (without extension)",
                         required=False)
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timings and graph size to stderr")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="With --profile, also trace each stage's peak memory (tracemalloc; slows the run)")
+    parser.add_argument("--out-dir", help="Batch mode: directory for outputs, manifest and report (default: codeviz_out)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Batch and overview mode: number of worker processes (default: CPU count)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default='png',
+                        help="Batch and overview mode: output format (default: png)")
+    parser.add_argument("--force", action="store_true",
+                        help="Batch mode: re-render files even if the manifest says they are unchanged")
+    parser.add_argument("--max-depth", type=int, default=None,
+                        help="Collapse subtrees below this depth into summary nodes")
+    parser.add_argument("--node-budget", type=int, default=None,
+                        help="Render at most about this many nodes; larger subtrees collapse into summary nodes")
+    parser.add_argument("--watch", action="store_true",
+                        help="Re-render whenever the file is saved, redoing only the top-level statements that changed")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Do not read or write the shared render store (CODEVIZ_STORE_DIR)")
+    parser.add_argument("--overview", nargs='?', const='modules', choices=OVERVIEW_DETAILS,
+                        help="Project overview of a directory: modules and the imports between them, "
+                             "optionally with their classes or functions (default: modules)")
+    parser.add_argument("--index", help="Overview: SQLite summary index to use (default: the one in the codeviz "
+                                         "cache directory, shared with the backend; CODEVIZ_INDEX_PATH)")
+    parser.add_argument("--external-imports", action="store_true",
+                        help="Overview: also show imported packages from outside the project")
+    parser.add_argument("--diff", metavar="OLD_FILE",
+                        help="Structural diff: draw the changes from OLD_FILE to the given file")
+    parser.add_argument("--show-unchanged", action="store_true",
+                        help="Diff mode: draw unchanged subtrees in full instead of collapsing them")
+    parser.add_argument("--diff-json", action="store_true",
+                        help="Diff mode: print the diff statistics and changes as JSON instead of a graph")
+    parser.add_argument("--cfg", nargs='?', const='', metavar="FUNCTION",
+                        help="Control-flow graph instead of the AST: of FUNCTION (qualified name such as "
+                             "Game.update, or <module>) or, without it, of module-level code and every function")
+    parser.add_argument("--export", type=parse_export_formats, default=['png'], metavar="FORMATS",
+                        help="With -o: comma-separated output formats, all exported from one layout "
+                             f"({', '.join(EXPORT_FORMATS)}; default: png)")
+    parser.add_argument("--prune", metavar="SPEC",
+                        help="Leave out low-information nodes before layout: a preset (full, compact, skeleton) "
+                             "optionally followed by rules, e.g. 'compact,drop=Import|ImportFrom,elide=Return'")
+    parser.add_argument("--pages", action="store_true",
+                        help="Split the module into one graph per top-level function/class plus an overview page "
+                             "linking them. With -o, pages are laid out in parallel into OUTPUT.<page>.<format> "
+                             "(see --export) and only pages that changed are rendered again; without, list the pages")
     args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.max_depth is not None and args.max_depth < 0:
+        parser.error("--max-depth must be at least 0")
+    if args.node_budget is not None and args.node_budget < 1:
+        parser.error("--node-budget must be at least 1")
+    if args.prune is not None:
+        try:
+            if parse_prune(args.prune).is_identity():
+                args.prune = None
+        except ValueError as e:
+            parser.error(f"--prune: {e}")
+
+    if args.cfg is not None:
+        if len(args.files) > 1 or args.watch or args.out_dir or args.overview or args.diff:
+            parser.error("--cfg takes a single file and does not support --watch, --out-dir, --overview or --diff")
+        cfg_main(args)
+        return
+
+    if args.diff:
+        if len(args.files) > 1 or args.watch or args.out_dir or args.overview:
+            parser.error("--diff takes a single file and does not support --watch, --out-dir or --overview")
+        diff_main(args)
+        return
+
+    if args.overview:
+        if len(args.files) > 1 or not os.path.isdir(args.files[0]) or args.watch or args.out_dir:
+            parser.error("--overview takes a single directory and does not support --watch or --out-dir")
+        overview_main(args)
+        return
+
+    if args.pages:
+        if len(args.files) > 1 or args.out_dir or args.overview or (args.watch and not args.output):
+            parser.error("--pages takes a single file and does not support --out-dir or --overview; "
+                         "--watch needs -o")
+        pages_main(args)
+        return
+
+    if args.watch:
+        if len(args.files) > 1 or args.out_dir or args.max_depth is not None or args.node_budget is not None:
+            parser.error("--watch takes a single file and does not support --out-dir, --max-depth or --node-budget")
+        watch_main(args)
+        return
+
+    if args.out_dir or len(args.files) > 1 or any(os.path.isdir(f) or glob.has_magic(f) for f in args.files):
+        batch_main(args)
+        return
+
+    lod = lod_options(args)
+    args.file = args.files[0]
+    profiler = new_profiler(args)
+    store = None if args.no_store else default_store()
 
     try:
         with open(args.file) as f:
-            code = f.read().strip()
+            raw = f.read()
+            code = raw.strip()
     except FileNotFoundError:
         print(f"Error: The file '{args.file}' does not exist.")
         exit(1)
@@ -32,20 +166,245 @@ def main():
         print("Error: The input file is empty.")
         exit(1)
 
-    ast_dict = parse_code(code)
-    if "error" in ast_dict:
-        print(f"Error: {ast_dict['error']}")
-        exit(1)
+    dot_source = None
+    if store is not None:
+        # Stripping leading whitespace shifts line numbers; otherwise the output is that of the raw
+        # file, so it is keyed by the raw file's hash and shares entries with the backend
+        dot_key = store.key('dot', source_hash(code if raw[:1].isspace() else raw), **lod)
+        with profiler.stage('store'):
+            dot_source = store.get_text(dot_key)
+
+    if dot_source is None:
+        ast_dict = parse_code(code, profiler)
+        if "error" in ast_dict:
+            print(f"Error: {ast_dict['error']}")
+            exit(1)
+
+        stats = {}
+        with profiler.stage('dot') as stage:
+            if store is None and not args.output:
+                # Stream the DOT text instead of building the whole graph in memory
+                write_dot(ast_dict, sys.stdout, stats=stats, **lod)
+            elif args.output:
+                dot_source = generate_dot(ast_dict, stats=stats, **lod).source
+            else:
+                dot_source = ''.join(iter_dot(ast_dict, stats=stats, **lod))
+            stage.count(**stats)
+        if store is not None:
+            store.put_text(dot_key, dot_source)
 
-    dot = generate_dot(ast_dict)
     if args.output:
+        def render_dot(**extra):
+            if not extra:
+                return dot_source
+            return ''.join(iter_dot(parse_code(code), **merge_options(lod, extra)))
         try:
-            dot.render(args.output, cleanup=True)
+            with profiler.stage('layout'):
+                outputs, steps = layout_once(render_dot, args.export, store)
+            if len(steps) > 1:
+                print(f"Layout degraded: {'; '.join(steps)}", file=sys.stderr)
+            for fmt, output in outputs.items():
+                with open(f"{args.output}.{EXPORT_EXTENSIONS.get(fmt, fmt)}", 'wb') as f:
+                    f.write(output)
         except Exception as e:
             print(f"Error: Failed to render the output file. {e}")
             exit(1)
+    elif dot_source is not None:
+        sys.stdout.write(dot_source)
+
+    if profiler.enabled:
+        print(profiler.report(), file=sys.stderr)
+
+def new_profiler(args):
+    """Profiler for one run: on with --profile, tracing memory only with --profile-memory too."""
+    return Profiler(trace_memory=args.profile_memory) if args.profile else NULL_PROFILER
+
+def lod_options(args):
+    """Level-of-detail and pruning options for the DOT emitter; unset values are left out of store keys."""
+    return {k: v for k, v in (("max_depth", args.max_depth), ("node_budget", args.node_budget),
+                              ("prune", args.prune)) if v is not None}
+
+def watch_main(args):
+    renderer = IncrementalRenderer(prune=args.prune)
+    store = None if args.no_store else default_store()
+    print(f"Watching {args.files[0]} (Ctrl-C to stop)", file=sys.stderr)
+    try:
+        for code in iter_changes(args.files[0]):
+            profiler = new_profiler(args)
+            start = time.perf_counter()
+            try:
+                dot_source = renderer.render(code.strip(), profiler)
+                if args.output:
+                    def render_dot(**extra):
+                        if not extra:
+                            return dot_source
+                        return ''.join(iter_dot(renderer.ast_dict, **merge_options(lod_options(args), extra)))
+                    with profiler.stage('layout'):
+                        outputs, steps = layout_once(render_dot, ['png'], store)
+                    if len(steps) > 1:
+                        print(f"Layout degraded: {'; '.join(steps)}", file=sys.stderr)
+                    with open(f"{args.output}.png", 'wb') as f:
+                        f.write(outputs['png'])
+                else:
+                    sys.stdout.write(dot_source)
+                    sys.stdout.flush()
+            except Exception as e:
+                # Keep watching: the next save may fix it
+                print(f"Error: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"Rendered in {elapsed:.1f} ms ({renderer.stats['nodes']} nodes)", file=sys.stderr)
+            if profiler.enabled:
+                print(profiler.report(), file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+
+def pages_main(args):
+    lod = lod_options(args)
+    if not args.output:
+        pages = split_pages(read_source(args.files[0]), **lod)
+        json.dump([page.as_dict() for page in pages], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    if args.watch:
+        print(f"Watching {args.files[0]} (Ctrl-C to stop)", file=sys.stderr)
+        sources = iter_changes(args.files[0])
+    else:
+        sources = [read_text(args.files[0])]
+    try:
+        for code in sources:
+            try:
+                report = render_pages(code.strip(), args.output, args.export, jobs=args.jobs,
+                                      extensions=EXPORT_EXTENSIONS, force=args.force, options=lod,
+                                      use_store=not args.no_store)
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                if not args.watch:
+                    exit(1)
+                continue
+            for result in report['pages']:
+                if result['error']:
+                    print(f"Error: page {result['page']}: {result['error']}", file=sys.stderr)
+            print(f"{report['total']} pages: {report['rendered']} rendered, {report['skipped']} unchanged, "
+                  f"{report['failed']} failed, {report['removed']} removed in {report['elapsed_seconds']:.2f}s",
+                  file=sys.stderr)
+            if report['failed'] and not args.watch:
+                exit(1)
+    except KeyboardInterrupt:
+        pass
+
+def overview_main(args):
+    root = args.files[0]
+    index = ProjectIndex(args.index)
+    try:
+        stats = index.update(root, jobs=args.jobs)
+        print(f"Indexed {stats['files']} files: {stats['summarized']} summarized, {stats['reused']} reused, "
+              f"{stats['unchanged']} unchanged, {stats['removed']} removed in {stats['seconds']:.2f}s",
+              file=sys.stderr)
+        dot_source = overview_dot(index.overview(root), args.overview, args.external_imports)
+    finally:
+        index.close()
+    if not args.output:
+        sys.stdout.write(dot_source)
+        return
+    try:
+        if args.format == 'dot':
+            with open(args.output + '.dot', 'w') as f:
+                f.write(dot_source)
+        else:
+            # The overview has no reduced variants: past the size limits only the engine changes
+            outputs, steps = layout_once(lambda **extra: dot_source, [args.format],
+                                         None if args.no_store else default_store())
+            if len(steps) > 1:
+                print(f"Layout degraded: {'; '.join(steps)}", file=sys.stderr)
+            with open(f"{args.output}.{EXPORT_EXTENSIONS.get(args.format, args.format)}", 'wb') as f:
+                f.write(outputs[args.format])
+    except Exception as e:
+        print(f"Error: Failed to render the output file. {e}")
+        exit(1)
+
+def read_text(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (FileNotFoundError, IOError) as e:
+        print(f"Error: Unable to read the file '{path}'. {e}")
+        exit(1)
+
+def read_source(path):
+    ast_dict = parse_code(read_text(path).strip())
+    if "error" in ast_dict:
+        print(f"Error: {path}: {ast_dict['error']}")
+        exit(1)
+    return ast_dict
+
+def diff_main(args):
+    profiler = new_profiler(args)
+    old_ast, new_ast = read_source(args.diff), read_source(args.files[0])
+    with profiler.stage('diff') as stage:
+        diff = AstDiff(old_ast, new_ast)
+        stats = diff.stats()
+        stage.count(**stats)
+    print(f"{stats['inserted']} inserted, {stats['deleted']} deleted, {stats['updated']} updated, "
+          f"{stats['moved']} moved ({stats['old_nodes']} -> {stats['new_nodes']} nodes)", file=sys.stderr)
+    if args.diff_json:
+        json.dump({"stats": stats, "changes": diff.changes()}, sys.stdout, indent=2)
+        sys.stdout.write("\n")
     else:
-        print(dot.source)
+        with profiler.stage('dot'):
+            dot_source = diff_dot(diff, collapse_unchanged=not args.show_unchanged)
+        write_graph(dot_source, args.output, profiler, args.export)
+    if profiler.enabled:
+        print(profiler.report(), file=sys.stderr)
+
+def cfg_main(args):
+    profiler = new_profiler(args)
+    ast_dict = read_source(args.files[0])
+    with open(args.files[0]) as f:
+        lines = f.read().strip().splitlines()
+    try:
+        with profiler.stage('cfg') as stage:
+            graphs = build_cfgs(ast_dict, lines, args.cfg or None)
+            stage.count(functions=len(graphs), blocks=sum(len(g.blocks) for g in graphs))
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
+        exit(1)
+    with profiler.stage('dot'):
+        dot_source = cfg_dot(graphs)
+    write_graph(dot_source, args.output, profiler, args.export)
+    if profiler.enabled:
+        print(profiler.report(), file=sys.stderr)
+
+def write_graph(dot_source, output, profiler, formats=('png',)):
+    """Write DOT to stdout, or lay it out once into output.<format>; for graphs without clusters (diffs, CFGs)."""
+    if not output:
+        sys.stdout.write(dot_source)
+        return
+    try:
+        # Without clusters only the engine depends on the graph's size
+        engine, _ = layout_plan(*graph_size(dot_source)[:2])[0]
+        with profiler.stage('layout'):
+            positioned = run_layout(dot_source, POSITIONED_FORMAT, engine)
+            for fmt in formats:
+                with open(f"{output}.{EXPORT_EXTENSIONS.get(fmt, fmt)}", 'wb') as f:
+                    f.write(export_layout(positioned, fmt))
+    except Exception as e:
+        print(f"Error: Failed to render the output file. {e}")
+        exit(1)
+
+def batch_main(args):
+    out_dir = args.out_dir or 'codeviz_out'
+    try:
+        report = run_batch(args.files, out_dir, fmt=args.format, jobs=args.jobs, force=args.force,
+                           max_depth=args.max_depth, node_budget=args.node_budget, prune=args.prune,
+                           use_store=not args.no_store)
+    except ValueError as e:
+        print(f"Error: {e}")
+        exit(1)
+    print(f"{report['rendered']} rendered, {report['skipped']} unchanged, {report['failed']} failed "
+          f"in {report['elapsed_seconds']:.2f}s (report: {os.path.join(out_dir, 'codeviz-report.json')})")
+    if report['failed']:
+        exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,548 @@
+import ast
+import json
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Tuple
+
+from ast_handlers import POSITION_FIELDS, node_spec
+
+# Slot/list item kinds; the value column holds a string id, a values index, a node index or a list id
+KIND_STR, KIND_VALUE, KIND_NODE, KIND_LIST, KIND_NONE = range(5)
+
+# Position columns store None as -1 (real lines and columns are never negative)
+NO_POSITION = -1
+
+# Binary serialisation (CompactAST.to_bytes)
+MAGIC = b'CAST'
+FORMAT_VERSION = 1
+
+
+def encode_value(value: Any) -> list:
+    """Tag a constant for JSON: [kind, payload]. Unknown types fall back to their repr."""
+    if isinstance(value, bool):
+        return ['bool', value]
+    if isinstance(value, int):
+        return ['int', str(value)]  # as text: Python ints are unbounded
+    if isinstance(value, float):
+        return ['float', repr(value)]
+    if isinstance(value, complex):
+        return ['complex', [repr(value.real), repr(value.imag)]]
+    if isinstance(value, bytes):
+        return ['bytes', value.hex()]
+    if isinstance(value, str):
+        return ['str', value]
+    if value is Ellipsis:
+        return ['ellipsis', None]
+    return ['repr', repr(value)]
+
+
+def decode_value(tagged: list) -> Any:
+    kind, payload = tagged
+    if kind == 'int':
+        return int(payload)
+    if kind == 'float':
+        return float(payload)
+    if kind == 'complex':
+        return complex(float(payload[0]), float(payload[1]))
+    if kind == 'bytes':
+        return bytes.fromhex(payload)
+    if kind == 'ellipsis':
+        return Ellipsis
+    return payload
+
+
+class CompactAST:
+    """
+    Columnar, array-backed form of an ast_to_dict tree, for holding many ASTs in memory.
+    - One row per node, in pre-order (a subtree is a contiguous range of rows): type id,
+      parent, first child, next sibling and the four position fields, as `array`s.
+    - The remaining keys of each node are slots in flat arrays (key id, kind, value);
+      list-valued keys point into a flat list-item table.
+    - Strings (type names, keys, identifiers, string constants) are interned once in
+      `strings`; other constants are interned in `values`.
+    Nodes are read through NodeView, a read-only Mapping with the same keys, order and
+    values as the dict ast_to_dict would have produced.
+    """
+    __slots__ = ('strings', 'string_ids', 'values', 'value_ids', 'types', 'parents', 'first_child',
+                 'next_sibling', 'positions', 'slot_start', 'slot_key', 'slot_kind', 'slot_value',
+                 'list_start', 'item_kind', 'item_value', 'type_slots')
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.string_ids: Dict[str, int] = {}
+        self.values: List[Any] = []
+        self.value_ids: Dict[Tuple[type, Any], int] = {}
+        self.types = array('I')
+        self.parents = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.positions = {field: array('i') for field in POSITION_FIELDS}
+        self.slot_start = array('I', [0])
+        self.slot_key = array('I')
+        self.slot_kind = array('B')
+        self.slot_value = array('i')
+        self.list_start = array('I', [0])
+        self.item_kind = array('B')
+        self.item_value = array('i')
+        # Nodes whose 'type' key holds something other than their type name
+        self.type_slots: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    @property
+    def root(self) -> "NodeView":
+        return NodeView(self, 0)
+
+    def node(self, index: int) -> "NodeView":
+        return NodeView(self, index)
+
+    def intern(self, text: str) -> int:
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def _intern_value(self, value: Any) -> int:
+        try:
+            # Keyed by type as well, so 1, 1.0 and True stay distinct
+            key = (type(value), value)
+            value_id = self.value_ids.get(key)
+            if value_id is None:
+                value_id = self.value_ids[key] = len(self.values)
+                self.values.append(value)
+            return value_id
+        except TypeError:  # unhashable constant
+            self.values.append(value)
+            return len(self.values) - 1
+
+    @classmethod
+    def from_dict(cls, ast_dict: dict) -> "CompactAST":
+        """Build a CompactAST from an ast_to_dict tree (iteratively, in pre-order)."""
+        tree = cls()
+        # (node dict, parent index, column to patch with the node's index, position in that column)
+        stack = [(ast_dict, -1, None, 0)]
+        last_child: Dict[int, int] = {}
+        while stack:
+            node, parent, patch, patch_at = stack.pop()
+            index = len(tree.types)
+            if patch is not None:
+                patch[patch_at] = index
+            type_value = node['type']
+            tree.types.append(tree.intern(type_value if isinstance(type_value, str) else ''))
+            tree.parents.append(parent)
+            tree.first_child.append(-1)
+            tree.next_sibling.append(-1)
+            if parent >= 0:
+                previous = last_child.get(parent)
+                if previous is None:
+                    tree.first_child[parent] = index
+                else:
+                    tree.next_sibling[previous] = index
+                last_child[parent] = index
+            for field in POSITION_FIELDS:
+                value = node.get(field)
+                tree.positions[field].append(NO_POSITION if value is None else value)
+
+            children = []
+            for key, value in node.items():
+                if key in POSITION_FIELDS or (key == 'type' and isinstance(value, str)):
+                    continue
+                if key == 'type':
+                    tree.type_slots[index] = len(tree.slot_key)
+                tree.slot_key.append(tree.intern(key))
+                if isinstance(value, list):
+                    tree.slot_kind.append(KIND_LIST)
+                    tree.slot_value.append(len(tree.list_start) - 1)
+                    for item in value:
+                        tree._append_value(tree.item_kind, tree.item_value, item, index, children)
+                    tree.list_start.append(len(tree.item_kind))
+                else:
+                    tree._append_value(tree.slot_kind, tree.slot_value, value, index, children)
+            tree.slot_start.append(len(tree.slot_key))
+            # Pushed in reverse so children are numbered in field order
+            stack.extend(reversed(children))
+        return tree
+
+    @classmethod
+    def from_ast(cls, node: ast.AST) -> "CompactAST":
+        """
+        Build a CompactAST straight from a parsed `ast` tree, with the same rows, slots and
+        values as from_dict(ast_to_dict(node)) but without materialising the dict tree first.
+        Node handling (handlers, field order, renamed fields) comes from ast_handlers.node_spec,
+        the same dispatch ast_to_dict uses.
+        """
+        tree = cls()
+        types, parents, first_child, next_sibling = tree.types, tree.parents, tree.first_child, tree.next_sibling
+        position_columns = [(field, tree.positions[field]) for field in POSITION_FIELDS]
+        slot_key, slot_kind, slot_value, slot_start = tree.slot_key, tree.slot_kind, tree.slot_value, tree.slot_start
+        item_kind, item_value, list_start = tree.item_kind, tree.item_value, tree.list_start
+        intern, append_value = tree.intern, tree._append_value
+        skipped = ('type', *POSITION_FIELDS)
+        stack = [(node, -1, None, 0)]
+        last_child: Dict[int, int] = {}
+        while stack:
+            current, parent, patch, patch_at = stack.pop()
+            index = len(types)
+            if patch is not None:
+                patch[patch_at] = index
+            handler, type_name, fields = node_spec(current.__class__)
+            types.append(intern(type_name))
+            parents.append(parent)
+            first_child.append(-1)
+            next_sibling.append(-1)
+            if parent >= 0:
+                previous = last_child.get(parent)
+                if previous is None:
+                    first_child[parent] = index
+                else:
+                    next_sibling[previous] = index
+                last_child[parent] = index
+            for field, column in position_columns:
+                value = getattr(current, field, None)
+                column.append(NO_POSITION if value is None else value)
+
+            # Same keys, in the same order, as the dict ast_to_dict builds: handler keys, then fields
+            slots = {} if handler is None else {key: value for key, value in handler(current).items()
+                                                   if key not in skipped}
+            for field, key in fields:
+                value = getattr(current, field, None)
+                if value is not None:
+                    slots[key] = value
+            children = []
+            for key, value in slots.items():
+                slot_key.append(intern(key))
+                if isinstance(value, list):
+                    slot_kind.append(KIND_LIST)
+                    slot_value.append(len(list_start) - 1)
+                    for item in value:
+                        append_value(item_kind, item_value, item, index, children, ast.AST)
+                    list_start.append(len(item_kind))
+                else:
+                    append_value(slot_kind, slot_value, value, index, children, ast.AST)
+            slot_start.append(len(slot_key))
+            stack.extend(reversed(children))
+        return tree
+
+    def _append_value(self, kinds: array, values: array, value: Any, index: int, children: list,
+                      node_class: type = dict) -> None:
+        if isinstance(value, node_class):
+            kinds.append(KIND_NODE)
+            values.append(-1)
+            children.append((value, index, values, len(values) - 1))
+        elif value is None:
+            kinds.append(KIND_NONE)
+            values.append(0)
+        elif type(value) is str:
+            kinds.append(KIND_STR)
+            values.append(self.intern(value))
+        else:
+            kinds.append(KIND_VALUE)
+            values.append(self._intern_value(value))
+
+    def decode(self, kind: int, value: int) -> Any:
+        if kind == KIND_NODE:
+            return NodeView(self, value)
+        if kind == KIND_STR:
+            return self.strings[value]
+        if kind == KIND_VALUE:
+            return self.values[value]
+        if kind == KIND_LIST:
+            item_kind, item_value, decode = self.item_kind, self.item_value, self.decode
+            return [decode(item_kind[i], item_value[i]) for i in range(self.list_start[value], self.list_start[value + 1])]
+        return None
+
+    def subtree_end(self, index: int) -> int:
+        """One past the last row of index's subtree (rows are in pre-order)."""
+        while True:
+            sibling = self.next_sibling[index]
+            if sibling >= 0:
+                return sibling
+            index = self.parents[index]
+            if index < 0:
+                return len(self.types)
+
+    def children(self, index: int) -> Iterator[int]:
+        child = self.first_child[index]
+        while child >= 0:
+            yield child
+            child = self.next_sibling[child]
+
+    def to_dict(self, index: int = 0) -> dict:
+        """Materialise the subtree at index as plain ast_to_dict dicts (iteratively)."""
+        root: list = [None]
+        stack = [(index, root, 0)]
+        while stack:
+            i, container, key = stack.pop()
+            node = {}
+            for field, value in NodeView(self, i).items():
+                if isinstance(value, NodeView):
+                    node[field] = None
+                    stack.append((value.index, node, field))
+                elif isinstance(value, list):
+                    node[field] = value
+                    for n, item in enumerate(value):
+                        if isinstance(item, NodeView):
+                            stack.append((item.index, value, n))
+                else:
+                    node[field] = value
+            container[key] = node
+        return root[0]
+
+    def iter_json(self, index: int = 0, chunk_parts: int = 4096) -> Iterator[str]:
+        """
+        Yield the subtree at index as JSON text in chunks, straight from the columns and
+        without materialising dicts; the output matches json.dumps(ast_to_dict(...)).
+        Values JSON cannot represent (bytes, complex, Ellipsis) are written as their repr.
+        """
+        buffer: List[str] = []
+        # Stack entries are either a str (literal text) or the index of a node to write
+        stack: list = [index]
+        while stack:
+            task = stack.pop()
+            if isinstance(task, str):
+                buffer.append(task)
+                if len(buffer) >= chunk_parts:
+                    yield ''.join(buffer)
+                    buffer.clear()
+                continue
+            out: list = []
+            separator = '{'
+            for field, value in NodeView(self, task).items():
+                prefix = separator + _json_key(field)
+                separator = ', '
+                if isinstance(value, NodeView):
+                    out.append(prefix)
+                    out.append(value.index)
+                elif isinstance(value, list) and any(isinstance(item, NodeView) for item in value):
+                    out.append(prefix + '[')
+                    for m, item in enumerate(value):
+                        if m:
+                            out.append(', ')
+                        out.append(item.index if isinstance(item, NodeView) else _json_scalar(item))
+                    out.append(']')
+                else:
+                    out.append(prefix + _json_scalar(value))
+            out.append('}' if out else '{}')
+            stack.extend(reversed(out))
+        if buffer:
+            yield ''.join(buffer)
+
+    def columns(self) -> List[Tuple[str, array]]:
+        """(name, array) for every column, in serialisation order."""
+        return [('types', self.types), ('parents', self.parents), ('first_child', self.first_child),
+                ('next_sibling', self.next_sibling), *self.positions.items(), ('slot_start', self.slot_start),
+                ('slot_key', self.slot_key), ('slot_kind', self.slot_kind), ('slot_value', self.slot_value),
+                ('list_start', self.list_start), ('item_kind', self.item_kind), ('item_value', self.item_value)]
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialise to the length-prefixed binary format: MAGIC, then frames of
+        <u32 little-endian length><payload>:
+          1. JSON header: version, node count, column names and typecodes, type slots
+          2. one frame per column: the raw little-endian array
+          3. JSON array of strings
+          4. JSON array of tagged constants (see encode_value)
+        Columns can be read by clients as typed arrays without parsing.
+        """
+        columns = self.columns()
+        header = {
+            'version': FORMAT_VERSION,
+            'nodes': len(self.types),
+            'columns': [[name, column.typecode] for name, column in columns],
+            'type_slots': sorted(self.type_slots.items()),
+        }
+        frames = [json.dumps(header).encode()]
+        for _, column in columns:
+            if sys.byteorder == 'big':
+                column = array(column.typecode, column)
+                column.byteswap()
+            frames.append(column.tobytes())
+        frames.append(json.dumps(self.strings).encode())
+        frames.append(json.dumps([encode_value(v) for v in self.values]).encode())
+        parts = [MAGIC]
+        for frame in frames:
+            parts.append(len(frame).to_bytes(4, 'little'))
+            parts.append(frame)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CompactAST":
+        """
+        Inverse of to_bytes. Raises ValueError for data in another format or version, and for
+        truncated or inconsistent payloads (frame lengths, column names, column sizes).
+        """
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a CompactAST payload")
+        frames = []
+        offset = len(MAGIC)
+        while offset < len(data):
+            if offset + 4 > len(data):
+                raise ValueError("Truncated CompactAST frame header")
+            length = int.from_bytes(data[offset:offset + 4], 'little')
+            if offset + 4 + length > len(data):
+                raise ValueError("Truncated CompactAST frame")
+            frames.append(data[offset + 4:offset + 4 + length])
+            offset += 4 + length
+        if not frames:
+            raise ValueError("Empty CompactAST payload")
+        header = json.loads(frames[0])
+        version = header.get('version') if isinstance(header, dict) else None
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported CompactAST format version {version}")
+        tree = cls()
+        try:
+            names = [name for name, _ in tree.columns()]
+            if [name for name, _ in header['columns']] != names or len(frames) != len(names) + 3:
+                raise ValueError("CompactAST columns do not match this version")
+            for (name, typecode), frame in zip(header['columns'], frames[1:]):
+                column = array(typecode)
+                column.frombytes(frame)
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                if name in tree.positions:
+                    tree.positions[name] = column
+                else:
+                    setattr(tree, name, column)
+            tree.strings = json.loads(frames[-2])
+            tree.values = [decode_value(v) for v in json.loads(frames[-1])]
+            tree.type_slots = {node: slot for node, slot in header['type_slots']}
+            nodes = header['nodes']
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Malformed CompactAST payload: {e!r}") from e
+        node_columns = [tree.types, tree.parents, tree.first_child, tree.next_sibling, *tree.positions.values()]
+        if (any(len(column) != nodes for column in node_columns) or len(tree.slot_start) != nodes + 1
+                or not len(tree.slot_key) == len(tree.slot_kind) == len(tree.slot_value) == tree.slot_start[-1]
+                or not len(tree.item_kind) == len(tree.item_value) == tree.list_start[-1]):
+            raise ValueError("CompactAST column sizes are inconsistent")
+        tree.string_ids = {text: i for i, text in enumerate(tree.strings)}
+        for i, value in enumerate(tree.values):
+            try:
+                tree.value_ids.setdefault((type(value), value), i)
+            except TypeError:
+                pass
+        return tree
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns, string table and constants."""
+        total = sum(sys.getsizeof(column) for _, column in self.columns())
+        total += sys.getsizeof(self.strings) + sum(sys.getsizeof(s) for s in self.strings)
+        total += sys.getsizeof(self.string_ids) + sys.getsizeof(self.value_ids)
+        total += sys.getsizeof(self.values) + sum(sys.getsizeof(v) for v in self.values)
+        return total
+
+
+_encode_str = json.encoder.encode_basestring_ascii
+_json_keys: Dict[str, str] = {}
+
+
+def _json_key(field: str) -> str:
+    text = _json_keys.get(field)
+    if text is None:
+        text = _json_keys[field] = _encode_str(field) + ': '
+    return text
+
+
+def _json_scalar(value: Any) -> str:
+    # Fast paths for the common cases; everything else goes through json.dumps
+    if value is None:
+        return 'null'
+    kind = type(value)
+    if kind is str:
+        return _encode_str(value)
+    if kind is int:
+        return int.__repr__(value)
+    if kind is bool:
+        return 'true' if value else 'false'
+    return json.dumps(value, default=repr)
+
+
+def json_default(value: Any) -> Any:
+    """`default` hook for json.dumps: NodeViews become objects, other unsupported values their repr."""
+    if isinstance(value, NodeView):
+        return dict(value.items())
+    return repr(value)
+
+
+_MISSING = object()
+
+
+class NodeView(Mapping):
+    """
+    Read-only Mapping over one CompactAST row, interchangeable with an ast_to_dict node dict:
+    keys are 'type', the position fields, then the node's own fields, in dict order.
+    Child nodes are returned as NodeViews and list fields as fresh lists.
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree: CompactAST, index: int):
+        self.tree = tree
+        self.index = index
+
+    def _slots(self) -> range:
+        return range(self.tree.slot_start[self.index], self.tree.slot_start[self.index + 1])
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Looked up directly rather than through Mapping.get, which costs a KeyError per missing key
+        tree = self.tree
+        if key == 'type':
+            slot = tree.type_slots.get(self.index)
+            if slot is None:
+                return tree.strings[tree.types[self.index]]
+            return tree.decode(tree.slot_kind[slot], tree.slot_value[slot])
+        column = tree.positions.get(key)
+        if column is not None:
+            value = column[self.index]
+            return None if value == NO_POSITION else value
+        key_id = tree.string_ids.get(key)
+        if key_id is not None:
+            slot_key = tree.slot_key
+            for slot in range(tree.slot_start[self.index], tree.slot_start[self.index + 1]):
+                if slot_key[slot] == key_id:
+                    return tree.decode(tree.slot_kind[slot], tree.slot_value[slot])
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        if key == 'type' or key in self.tree.positions:
+            return True
+        key_id = self.tree.string_ids.get(key)
+        return key_id is not None and key_id in self.tree.slot_key[self.tree.slot_start[self.index]:
+                                                                   self.tree.slot_start[self.index + 1]]
+
+    def __iter__(self) -> Iterator[str]:
+        yield 'type'
+        yield from POSITION_FIELDS
+        strings, slot_key = self.tree.strings, self.tree.slot_key
+        type_slot = self.tree.type_slots.get(self.index)
+        for slot in self._slots():
+            if slot != type_slot:
+                yield strings[slot_key[slot]]
+
+    def __len__(self) -> int:
+        return 1 + len(POSITION_FIELDS) + len(self._slots()) - (self.index in self.tree.type_slots)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        tree = self.tree
+        index = self.index
+        strings, slot_key, slot_kind, slot_value, decode = (tree.strings, tree.slot_key, tree.slot_kind,
+                                                           tree.slot_value, tree.decode)
+        type_slot = tree.type_slots.get(index)
+        yield 'type', strings[tree.types[index]] if type_slot is None else decode(slot_kind[type_slot],
+                                                                                 slot_value[type_slot])
+        for field, column in tree.positions.items():
+            value = column[index]
+            yield field, None if value == NO_POSITION else value
+        for slot in range(tree.slot_start[index], tree.slot_start[index + 1]):
+            if slot != type_slot:
+                yield strings[slot_key[slot]], decode(slot_kind[slot], slot_value[slot])
+
+    def __repr__(self) -> str:
+        return f"<NodeView {self['type']!r} #{self.index}>"
@@ -0,0 +1,121 @@
+from collections import deque
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+from compact_ast import NodeView
+
+# Keys that hold node metadata rather than rendered children (matches dot_render.NON_CHILD_FIELDS)
+NON_CHILD_FIELDS = {'type', 'lineno', 'col_offset', 'end_lineno', 'end_col_offset', 'ctx'}
+
+
+# AST nodes are either ast_to_dict dicts or views into a CompactAST
+NODE_TYPES = (dict, NodeView)
+
+
+def is_node(value) -> bool:
+    return isinstance(value, NODE_TYPES) and 'type' in value
+
+
+def node_key(node) -> Hashable:
+    """Identity of a node that stays valid while the tree exists (NodeViews are created on access)."""
+    return ('row', node.index) if type(node) is NodeView else id(node)
+
+
+def child_fields(node: dict) -> Iterator[Tuple[str, object]]:
+    """Yield (field, value) for every field of node that holds rendered child nodes."""
+    for field, value in node.items():
+        if field in NON_CHILD_FIELDS or value is None:
+            continue
+        if isinstance(value, list):
+            if any(is_node(item) for item in value):
+                yield field, value
+        elif is_node(value):
+            yield field, value
+
+
+def subtree_sizes(ast_dict: dict) -> Dict[Hashable, int]:
+    """Return {node_key(node): number of rendered nodes in its subtree}, computed without recursion."""
+    sizes: Dict[Hashable, int] = {}
+    stack: List[Tuple[dict, bool]] = [(ast_dict, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            # 'arguments' nodes are never drawn (their children attach to the parent)
+            total = 0 if node['type'] == 'arguments' else 1
+            for _, value in child_fields(node):
+                for child in (value if isinstance(value, list) else (value,)):
+                    if is_node(child):
+                        total += sizes[node_key(child)]
+            sizes[node_key(node)] = total
+            continue
+        stack.append((node, True))
+        for _, value in child_fields(node):
+            for child in (value if isinstance(value, list) else (value,)):
+                if is_node(child):
+                    stack.append((child, False))
+    return sizes
+
+
+def drawn_child_count(node) -> int:
+    """Number of child nodes drawn under node; an 'arguments' child contributes its own children instead."""
+    count = 0
+    for _, value in child_fields(node):
+        for child in (value if isinstance(value, list) else (value,)):
+            if is_node(child):
+                count += drawn_child_count(child) if child['type'] == 'arguments' else 1
+    return count
+
+
+def _copy_children(original, copy: dict, pending: list) -> None:
+    """Give copy fresh copies of original's children, appending each drawn (original, copy) pair to pending."""
+    for field, value in child_fields(original):
+        if isinstance(value, list):
+            copy[field] = [_copy_child(item, pending) if is_node(item) else item for item in value]
+        else:
+            copy[field] = _copy_child(value, pending)
+
+
+def _copy_child(node, pending: list) -> dict:
+    child = dict(node)
+    if node['type'] == 'arguments':
+        # Not drawn: its children attach to the owning FunctionDef/Lambda and are expanded with it
+        _copy_children(node, child, pending)
+    else:
+        pending.append((node, child))
+    return child
+
+
+def collapse_tree(ast_dict: dict, max_depth: Optional[int] = None, node_budget: Optional[int] = None) -> dict:
+    """
+    Return a level-of-detail copy of an AST dictionary for overview rendering.
+    - Nodes are expanded breadth-first; a node whose children would exceed node_budget,
+      or that sits at max_depth, becomes a summary node: its children are dropped and
+      'collapsed' records how many nodes were hidden below it.
+    - Deep expression subtrees therefore collapse first; with small budgets whole
+      function and class bodies collapse too. The root is always expanded one level.
+    - 'arguments' nodes are never drawn, so they are never collapsed on their own: their
+      children count towards, and collapse with, the owning FunctionDef/Lambda.
+    The input is not modified; untouched scalar fields are shared with it.
+    """
+    if not is_node(ast_dict) or (max_depth is None and not node_budget):
+        return ast_dict
+    sizes = subtree_sizes(ast_dict)
+    root = dict(ast_dict)
+    used = 1
+    queue = deque([(ast_dict, root, 0)])
+    while queue:
+        original, copy, depth = queue.popleft()
+        child_count = drawn_child_count(original)
+        if not child_count:
+            continue
+        too_deep = max_depth is not None and depth >= max_depth
+        # The root's own children are always shown; a lone summary node is no overview
+        over_budget = node_budget is not None and depth > 0 and used + child_count > node_budget
+        if too_deep or over_budget:
+            for field, _ in list(child_fields(original)):
+                del copy[field]
+            copy['collapsed'] = sizes[node_key(original)] - 1
+            continue
+        used += child_count
+        pending: List[Tuple[dict, dict]] = []
+        _copy_children(original, copy, pending)
+        queue.extend((child, child_copy, depth + 1) for child, child_copy in pending)
+    return root
@@ -1,215 +1,387 @@
 #!/usr/bin/env python
+import html
+from typing import IO, Iterator, List, Tuple
 from graphviz import Digraph
+from graphviz.quoting import a_list, attr_list, quote, quote_edge
 from viz_config import NODE_COLORS, LEGEND
+from detail import NODE_TYPES, NON_CHILD_FIELDS, collapse_tree
+from ast_paths import child_node_id, path_node_id, resolve_path
+from prune import prune_tree, resolve_prune
 
-def generate_dot(ast_dict, name='ast', graph_attrs=None, node_attrs=None, edge_attrs=None, legend_mode='full') -> Digraph:
+CONTAINER_FIELDS = {'body', 'args', 'arguments', 'keywords', 'bases', 'decorator_list', 'orelse', 'targets', 'values', 'elts', 'items', 'handlers', 'finalbody', 'test', 'iter', 'ifs', 'ops', 'comparators'}
+
+PRIMARY_CLUSTER_NODE_TYPES = {
+    'Module', 'FunctionDef', 'AsyncFunctionDef', 'ClassDef',
+     'AsyncFor','AsyncWith','Try', 'TryStar', 'ExceptHandler'
+}
+
+NODE_DEFAULTS = {'shape': 'box', 'fontname': 'Consolas', 'margin': '0,0.2', 'fontsize': '10', 'fixedsize': 'false', 'width': '1'}
+DEFAULT_GRAPH_ATTRS = {'rankdir': 'TB', 'ranksep': '0.25', 'nodesep': '0.25', 'compound': 'true'}
+DEFAULT_EDGE_ATTRS = {'fontname': 'Consolas', 'fontsize': '10'}
+
+def get_node_color(node_type: str) -> str:
+    return NODE_COLORS.get(node_type, 'white')
+
+def line_text(node_dict, line_offset=0) -> str:
+    """Raw line range string like "l#: 1-5" (counted from line line_offset + 1), or "" when the node has no position."""
+    raw_line_text = ""
+    if node_dict.get('lineno', ''):
+        raw_line_text = f"l#: {node_dict.get('lineno') - line_offset}"
+        if node_dict.get('end_lineno') and node_dict.get('end_lineno') != node_dict.get('lineno'):
+            raw_line_text += f"-{node_dict.get('end_lineno') - line_offset}"
+    return raw_line_text
+
+def label_text(value) -> str:
+    """A value as text for an HTML-like label: markup characters escaped, line breaks as <BR/>."""
+    return '<BR/>'.join(html.escape(line, quote=False) for line in str(value).splitlines() or [''])
+
+def main_label_content(node_dict) -> str:
+    """The type-specific part of a node label (HTML-like, without the line numbers)."""
+    content = _type_label_content(node_dict)
+    folded = node_dict.get('folded')
+    if folded:
+        # Operators folded into this node by prune.prune_tree
+        content += f" <FONT COLOR='darkorange'><B>{html.escape(folded)}</B></FONT>"
+    return content
+
+def _type_label_content(node_dict) -> str:
+    t = node_dict['type']
+    if t == 'FunctionDef': return f"<B>FunctionDef</B><BR/>name: {node_dict.get('name', '')}"
+    elif t == 'AsyncFunctionDef': return f"<B>AsyncFunctionDef</B><BR/>name: {node_dict.get('name', '')}"
+    elif t == 'ClassDef': return f"<B>ClassDef</B><BR/>name: {node_dict.get('name', '')}"
+    elif t == 'arg': return f"arg: {node_dict.get('arg', '')}"
+    elif t == 'Return': return f"<B>Return</B>"
+    elif t == 'BinOp':
+        return f"<B>BinOp</B>"
+    elif t == 'Name':
+        ctx_value = node_dict.get('ctx')
+        ctx_type_str = ''
+        if isinstance(ctx_value, NODE_TYPES) and 'type' in ctx_value:
+            ctx_type_str = ctx_value['type']
+        elif isinstance(ctx_value, str) and ctx_value in ['Load', 'Store', 'Del', 'Param']:
+            ctx_type_str = ctx_value
+        name_id_str = node_dict.get('id', '')
+        ctx_suffix_html = ''
+        if ctx_type_str == 'Load': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='lightskyblue'>[Load]</FONT>"
+        elif ctx_type_str == 'Store': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='steelblue'>[Store]</FONT>"
+        elif ctx_type_str == 'Del': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='firebrick'>[Del]</FONT>"
+        elif ctx_type_str == 'Param': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='darkorange'>[Param]</FONT>"
+        return f"Name: {name_id_str}{ctx_suffix_html}"
+    elif t == 'Constant': return f"Constant: {label_text(node_dict.get('value', ''))}"
+    else: return t
+
+def format_label_for_node(node_dict, line_offset=0):
+    raw_line_text = line_text(node_dict, line_offset)
+    main_label = main_label_content(node_dict)
+    if raw_line_text: # If there is line number information
+        return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'><TR><TD ALIGN='LEFT'>{main_label}</TD></TR><TR><TD ALIGN='LEFT'><FONT POINT-SIZE='7' COLOR='grey60'>{raw_line_text}</FONT></TD></TR></TABLE>>"
+    else:
+        return f"<{main_label}>"
+
+def format_label_for_summary(node_dict, line_offset=0):
+    """Label for a collapsed subtree: the node's own label plus how many nodes it hides."""
+    rows = [main_label_content(node_dict)]
+    raw_line_text = line_text(node_dict, line_offset)
+    if raw_line_text:
+        rows.append(f"<FONT POINT-SIZE='7' COLOR='grey60'>{raw_line_text}</FONT>")
+    rows.append(f"<FONT POINT-SIZE='8' COLOR='grey40'>+{node_dict['collapsed']} nodes</FONT>")
+    cells = ''.join(f"<TR><TD ALIGN='LEFT'>{row}</TD></TR>" for row in rows)
+    return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'>{cells}</TABLE>>"
+
+def format_label_for_cluster(node_dict, line_offset=0):
+    t = node_dict['type']
+    raw_line_text_cluster = line_text(node_dict, line_offset)
+
+    main_cluster_label_text = ""
+    if t == 'Module': main_cluster_label_text = "Module"
+    elif t == 'FunctionDef': main_cluster_label_text = f"FunctionDef: {node_dict.get('name', '')}"
+    elif t == 'AsyncFunctionDef': main_cluster_label_text = f"AsyncFunctionDef: {node_dict.get('name', '')}"
+    elif t == 'ClassDef': main_cluster_label_text = f"ClassDef: {node_dict.get('name', '')}"
+    else: main_cluster_label_text = t # Default cluster label is just the type
+
+    if raw_line_text_cluster:
+        return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'><TR><TD ALIGN='LEFT'>{main_cluster_label_text}</TD></TR><TR><TD ALIGN='LEFT'><FONT POINT-SIZE='7' COLOR='grey60'>{raw_line_text_cluster}</FONT></TD></TR></TABLE>>"
+    else:
+        return f"<{main_cluster_label_text}>"
+
+def is_container_field(field):
+    return field in CONTAINER_FIELDS
+
+def legend_table(legend_data_list) -> str:
+    html_table_rows = []
+    for label_text, node_type_legend in legend_data_list:
+        color_hex = get_node_color(node_type_legend)
+        html_table_rows.append(
+            f'<TR><TD WIDTH="15" HEIGHT="15" FIXEDSIZE="TRUE" BGCOLOR="{color_hex}"> </TD> ' \
+            f'<TD ALIGN="LEFT"><FONT POINT-SIZE="7">{label_text}</FONT></TD></TR>'
+        )
+    if not html_table_rows:
+        return ''
+    return '<' + \
+           '<TABLE BORDER="0" CELLBORDER="0" CELLSPACING="1" CELLPADDING="1">' + \
+           ''.join(html_table_rows) + \
+           '</TABLE>' + '>'
+
+TAB = '\t'
+
+# DOT statement lines, formatted exactly as graphviz.Digraph formats them.
+# `depth` is the number of enclosing subgraphs (0 for the top-level graph).
+def _node_line(depth, node_id, label=None, **attrs):
+    return f"{TAB * (depth + 1)}{quote(node_id)}{attr_list(label, kwargs=attrs)}\n"
+
+def _edge_line(depth, tail, head, label=None, **attrs):
+    return f"{TAB * (depth + 1)}{quote_edge(tail)} -> {quote_edge(head)}{attr_list(label, kwargs=attrs)}\n"
+
+def _attr_line(depth, kw, **attrs):
+    return f"{TAB * (depth + 1)}{kw}{attr_list(None, kwargs=attrs)}\n"
+
+def _graph_attr_line(depth, **attrs):
+    return f"{TAB * (depth + 1)}{a_list(None, kwargs=attrs)}\n"
+
+def _subgraph_head(depth, name):
+    return f"{TAB * (depth + 1)}subgraph {quote(name)} {{\n"
+
+def _subgraph_tail(depth):
+    return f"{TAB * (depth + 1)}}}\n"
+
+class DotEmitter:
     """
-    Convert AST dictionary to Graphviz DOT using HTML-like labels.
-    - Uses nested clusters for list fields containing primary cluster nodes
-    - Uses dashed style for true containers with >1 non-empty child list
-    - Line numbers are shown in smaller font under the main label
-    - Adds a color legend at the bottom of the graph
+    Walks an AST dictionary iteratively (explicit stack, no recursion) and yields the
+    DOT body line by line.
+    - Uses nested clusters for PRIMARY_CLUSTER_NODE_TYPES
+    - Skips 'arguments' nodes and attaches their children to the parent
+    - Node IDs are derived from each node's AST path (see ast_paths), so they are stable
+      across renders and fragments rendered from root_path can be merged by the client; they
+      are computed from the parent's ID, so they have a fixed size however deep the node is
+    - With max_depth/node_budget, subtrees are collapsed into summary nodes first (see detail.collapse_tree)
+    - With clusters=False, PRIMARY_CLUSTER_NODE_TYPES are drawn as ordinary nodes; the graph is then
+      much cheaper to lay out and suits engines without cluster support (sfdp, neato)
+    - With prune (a preset name, a rule spec or PruneRules; see prune.py), the tree is pruned
+      before anything else; pruned nodes keep the IDs they have in the full graph
+    - With line_offset, line numbers are shown relative to line line_offset + 1 (see pages.py)
     """
-    dot = Digraph(name=name, format='png')
-    dot.attr('node', shape='box', fontname='Consolas', margin='0,0.2', fontsize='10', fixedsize='false', width='1')
-    dot.attr('graph', **(graph_attrs or {'rankdir': 'TB', 'ranksep': '0.25', 'nodesep': '0.25', 'compound': 'true'}))
-    dot.attr('edge', **(edge_attrs or {'fontname': 'Consolas', 'fontsize': '10'}))
-    
-    node_counter = [0]
-    CONTAINER_FIELDS = {'body', 'args', 'arguments', 'keywords', 'bases', 'decorator_list', 'orelse', 'targets', 'values', 'elts', 'items', 'handlers', 'finalbody', 'test', 'iter', 'ifs', 'ops', 'comparators'}
-
-    PRIMARY_CLUSTER_NODE_TYPES = {
-        'Module', 'FunctionDef', 'AsyncFunctionDef', 'ClassDef',
-         'AsyncFor','AsyncWith','Try', 'TryStar', 'ExceptHandler'
-    }
-
-    def get_unique_id():
-        node_counter[0] += 1
-        return f"node_{node_counter[0]}"
-
-    def get_node_color(node_type: str) -> str:
-        return NODE_COLORS.get(node_type, 'white')
-
-    def format_label_for_node(node_dict):
-        t = node_dict['type']
-        raw_line_text = "" # Store raw line string like "ln#: 1-5"
-        if node_dict.get('lineno', ''):
-            raw_line_text = f"l#: {node_dict.get('lineno', '')}"
-            if node_dict.get('end_lineno') and node_dict.get('end_lineno') != node_dict.get('lineno'):
-                raw_line_text += f"-{node_dict.get('end_lineno')}"
-        
-        main_label_content = "" # This will be built by the type-specific logic below
-
-        if t == 'FunctionDef': main_label_content = f"<B>FunctionDef</B><BR/>name: {node_dict.get('name', '')}"
-        elif t == 'AsyncFunctionDef': main_label_content = f"<B>AsyncFunctionDef</B><BR/>name: {node_dict.get('name', '')}"
-        elif t == 'ClassDef': main_label_content = f"<B>ClassDef</B><BR/>name: {node_dict.get('name', '')}"
-        elif t == 'arg': main_label_content = f"arg: {node_dict.get('arg', '')}"
-        elif t == 'Return': main_label_content = f"<B>Return</B>"
-        elif t == 'BinOp':
-            # op = node_dict.get('op', ''); # Ensure this line is commented or removed
-            # if isinstance(op, dict) and 'type' in op: op = op['type'] # Ensure this line is commented or removed
-            main_label_content = f"<B>BinOp</B>" # Corrected label
-        elif t == 'Name':
-            ctx_value = node_dict.get('ctx')
-            ctx_type_str = ''
-            if isinstance(ctx_value, dict) and 'type' in ctx_value:
-                ctx_type_str = ctx_value['type']
-            elif isinstance(ctx_value, str) and ctx_value in ['Load', 'Store', 'Del', 'Param']:
-                ctx_type_str = ctx_value
-            name_id_str = node_dict.get('id', '')
-            ctx_suffix_html = ''
-            if ctx_type_str == 'Load': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='lightskyblue'>[Load]</FONT>"
-            elif ctx_type_str == 'Store': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='steelblue'>[Store]</FONT>"
-            elif ctx_type_str == 'Del': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='firebrick'>[Del]</FONT>"
-            elif ctx_type_str == 'Param': ctx_suffix_html = " <FONT POINT-SIZE='8' COLOR='darkorange'>[Param]</FONT>"
-            main_label_content = f"Name: {name_id_str}{ctx_suffix_html}"
-        elif t == 'Constant': main_label_content = f"Constant: {node_dict.get('value', '')}"
-        elif t in NODE_COLORS: main_label_content = t 
-        else: main_label_content = t
-
-        if raw_line_text: # If there is line number information
-            return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'><TR><TD ALIGN='LEFT'>{main_label_content}</TD></TR><TR><TD ALIGN='LEFT'><FONT POINT-SIZE='7' COLOR='grey60'>{raw_line_text}</FONT></TD></TR></TABLE>>"
-        else:
-            return f"<{main_label_content}>"
-
-    def format_label_for_cluster(node_dict):
-        t = node_dict['type']
-        raw_line_text_cluster = ""
-        if node_dict.get('lineno', ''):
-            raw_line_text_cluster = f"l#: {node_dict.get('lineno', '')}"
-            if node_dict.get('end_lineno') and node_dict.get('end_lineno') != node_dict.get('lineno'):
-                raw_line_text_cluster += f"-{node_dict.get('end_lineno')}"
-        
-        main_cluster_label_text = ""
-        if t == 'Module': main_cluster_label_text = "Module"
-        elif t == 'FunctionDef': main_cluster_label_text = f"FunctionDef: {node_dict.get('name', '')}"
-        elif t == 'AsyncFunctionDef': main_cluster_label_text = f"AsyncFunctionDef: {node_dict.get('name', '')}"
-        elif t == 'ClassDef': main_cluster_label_text = f"ClassDef: {node_dict.get('name', '')}"
-        else: main_cluster_label_text = t # Default cluster label is just the type
-
-        if raw_line_text_cluster:
-            return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'><TR><TD ALIGN='LEFT'>{main_cluster_label_text}</TD></TR><TR><TD ALIGN='LEFT'><FONT POINT-SIZE='7' COLOR='grey60'>{raw_line_text_cluster}</FONT></TD></TR></TABLE>>"
-        else:
-            return f"<{main_cluster_label_text}>"
-
-    def is_container_field(field):
-        return field in CONTAINER_FIELDS
-
-    def add_legend(main_dot_graph: Digraph, legend_data_list, get_color_func_internal, anchor_for_positioning) -> None:
-        html_table_rows = []
-        for label_text, node_type_legend in legend_data_list:
-            color_hex = get_color_func_internal(node_type_legend)
-            html_table_rows.append(
-                f'<TR><TD WIDTH="15" HEIGHT="15" FIXEDSIZE="TRUE" BGCOLOR="{color_hex}"> </TD> ' \
-                f'<TD ALIGN="LEFT"><FONT POINT-SIZE="7">{label_text}</FONT></TD></TR>'
-            )
-        
-        html_table_string = ''
-        if html_table_rows:
-            html_table_string = '<' + \
-                                '<TABLE BORDER="0" CELLBORDER="0" CELLSPACING="1" CELLPADDING="1">' + \
-                                ''.join(html_table_rows) + \
-                                '</TABLE>' + '>'
+    def __init__(self, name='ast', graph_attrs=None, node_attrs=None, edge_attrs=None, legend_mode='full',
+                 max_depth=None, node_budget=None, root_path='', clusters=True, prune=None, line_offset=0):
+        self.name = name
+        self.graph_attrs = graph_attrs or DEFAULT_GRAPH_ATTRS
+        self.node_attrs = node_attrs or NODE_DEFAULTS
+        self.edge_attrs = edge_attrs or DEFAULT_EDGE_ATTRS
+        self.legend_mode = legend_mode
+        self.max_depth = max_depth
+        self.node_budget = node_budget
+        self.root_path = root_path
+        self.clusters = clusters
+        self.prune = resolve_prune(prune)
+        self.line_offset = line_offset
+        # Graph size, for instrumentation and layout decisions
+        self.node_count = 0
+        self.edge_count = 0
+        self.cluster_count = 0
 
-        if not html_table_string: return # Don't create legend if table is empty
+    def stats(self) -> dict:
+        return {'nodes': self.node_count, 'edges': self.edge_count, 'clusters': self.cluster_count}
 
-        legend_cluster_name = 'cluster_html_legend'
-        with main_dot_graph.subgraph(name=legend_cluster_name) as legend_cluster:
-            legend_cluster.attr(label=html_table_string,
-                                labelloc='b', # b=bottom, c=center, t=top
-                                labeljust='r', # r=right, c=center, l=left
-                                style='invis', # Makes the cluster bounding box invisible
-                                group='legend_group' # Try to group it with the anchor
-                                )
-            # Add a single invisible node inside the cluster to give it an anchor point for its label
-            # and for connecting to the main graph anchor.
-            internal_legend_node = f'legend_internal_node_{get_unique_id()}' # Requires get_unique_id to be accessible
-            legend_cluster.node(internal_legend_node, style='invis', shape='point', width='0.001', height='0.001')
-            
-            # Connect this cluster's internal node to the overall graph anchor attempt to pull it down
-            if anchor_for_positioning:
-                main_dot_graph.edge(anchor_for_positioning, internal_legend_node, style='invis', constraint='false') 
-
-    def _add_nodes_recursive(current_digraph_obj, ast_node, parent_id_for_edge=None, edge_label_from_parent=None, parent_is_cluster=False):
-        if not isinstance(ast_node, dict) or 'type' not in ast_node:
-            return None
-
-        node_type = ast_node['type']
-
-        # Special case: skip 'arguments' node and connect its children directly to the parent
-        if node_type == 'arguments':
-            for field, value in ast_node.items():
-                if field in ['type', 'lineno', 'col_offset', 'end_lineno', 'end_col_offset', 'ctx']:
-                    continue
-                if value is None:
-                    continue
-                if isinstance(value, list):
-                    for item in value:
-                        _add_nodes_recursive(current_digraph_obj, item, parent_id_for_edge, field, parent_is_cluster)
-                elif isinstance(value, dict) and 'type' in value:
-                    _add_nodes_recursive(current_digraph_obj, value, parent_id_for_edge, field, parent_is_cluster)
-            return None
-
-        # Handle primary cluster nodes
-        if node_type in PRIMARY_CLUSTER_NODE_TYPES:
-            outer_cluster_name = f"cluster_{node_type.lower()}_{get_unique_id()}"
-            with current_digraph_obj.subgraph(name=outer_cluster_name) as outer_cluster:
-                outer_cluster.attr(label=format_label_for_cluster(ast_node),
-                               style='filled',
-                               fillcolor=get_node_color(node_type),
-                               margin='8')
-                if parent_id_for_edge and not parent_is_cluster:
-                    current_digraph_obj.edge(parent_id_for_edge, outer_cluster_name, label=edge_label_from_parent)
-                # Do NOT create edges from the cluster to its children; just recurse so they are visually inside
+    def iter_body(self, ast_dict) -> Iterator[str]:
+        yield from self.iter_head()
+        ast_dict = prune_tree(ast_dict, self.prune, self.root_path)
+        if self.max_depth is not None or self.node_budget:
+            ast_dict = collapse_tree(ast_dict, self.max_depth, self.node_budget)
+        yield from self.iter_nodes(ast_dict, path=self.root_path)
+        yield from self.iter_tail()
+
+    def iter_head(self) -> Iterator[str]:
+        """Default node/graph/edge attribute lines that open the body."""
+        yield _attr_line(0, 'node', **self.node_attrs)
+        yield _attr_line(0, 'graph', **self.graph_attrs)
+        yield _attr_line(0, 'edge', **self.edge_attrs)
+
+    def iter_tail(self) -> Iterator[str]:
+        """Lines that close the body (the legend, when enabled)."""
+        if self.legend_mode == 'full':
+            yield from self.iter_legend()
+
+    def cluster_lines(self, ast_node, path='', depth=0, node_id=None) -> Tuple[str, List[str], str]:
+        """(cluster name, opening lines, closing line) for a node drawn as a cluster (at path, or with node_id)."""
+        cluster_name = f"cluster_{ast_node['type'].lower()}_{node_id or path_node_id(path)}"
+        self.cluster_count += 1
+        opening = [
+            _subgraph_head(depth, cluster_name),
+            _graph_attr_line(depth + 1,
+                             label=format_label_for_cluster(ast_node, self.line_offset),
+                             style='filled',
+                             fillcolor=get_node_color(ast_node['type']),
+                             margin='8'),
+        ]
+        return cluster_name, opening, _subgraph_tail(depth)
+
+    def iter_nodes(self, ast_dict, depth=0, path='') -> Iterator[str]:
+        # Stack entries are either a str (a line to emit once everything pushed above it is done)
+        # or a visit: (node, parent_id_for_edge, edge_label_from_parent, parent_is_cluster, depth, owner_id, owner_label, node_id)
+        # owner_id/owner_label describe the edge a regular parent draws to this child after its subtree.
+        stack = [(ast_dict, None, None, True, depth, None, None, path_node_id(path))]
+        while stack:
+            task = stack.pop()
+            if isinstance(task, str):
+                yield task
+                continue
+            ast_node, parent_id_for_edge, edge_label_from_parent, parent_is_cluster, depth, owner_id, owner_label, node_id = task
+            if not isinstance(ast_node, NODE_TYPES) or 'type' not in ast_node:
+                continue
+            if type(ast_node) is dict:
+                # Pruned trees (plain dicts) carry each node's ID in the unpruned tree
+                node_id = ast_node.get('ast_id', node_id)
+
+            node_type = ast_node['type']
+            children = []
+
+            # Special case: skip 'arguments' node and connect its children directly to the parent
+            if node_type == 'arguments':
                 for field, value in ast_node.items():
-                    if field in ['type', 'lineno', 'col_offset', 'end_lineno', 'end_col_offset', 'ctx']:
-                        continue
-                    if value is None:
+                    if field in NON_CHILD_FIELDS or value is None:
                         continue
                     if isinstance(value, list):
-                        for item in value:
-                            _add_nodes_recursive(outer_cluster, item, None, None, parent_is_cluster=True)
-                    elif isinstance(value, dict) and 'type' in value:
-                        _add_nodes_recursive(outer_cluster, value, None, None, parent_is_cluster=True)
-                return outer_cluster_name
-
-        # Handle regular nodes
-        node_id = get_unique_id()
-        current_digraph_obj.node(node_id,
-                              label=format_label_for_node(ast_node),
-                              style='filled',
-                              fillcolor=get_node_color(node_type))
-        if parent_id_for_edge:
-            current_digraph_obj.edge(parent_id_for_edge, node_id, label=edge_label_from_parent)
-
-        for field, value in ast_node.items():
-            if field in ['type', 'lineno', 'col_offset', 'end_lineno', 'end_col_offset', 'ctx']:
+                        for i, item in enumerate(value):
+                            children.append((item, parent_id_for_edge, field, parent_is_cluster, depth, None, None,
+                                             child_node_id(node_id, field, i)))
+                    elif isinstance(value, NODE_TYPES) and 'type' in value:
+                        children.append((value, parent_id_for_edge, field, parent_is_cluster, depth, None, None,
+                                         child_node_id(node_id, field)))
+                stack.extend(reversed(children))
                 continue
-            if value is None:
+
+            # Handle primary cluster nodes: children are drawn inside the cluster, without edges
+            if node_type in PRIMARY_CLUSTER_NODE_TYPES and 'collapsed' not in ast_node and self.clusters:
+                cluster_name, opening, closing = self.cluster_lines(ast_node, depth=depth, node_id=node_id)
+                if parent_id_for_edge and not parent_is_cluster:
+                    self.edge_count += 1
+                    yield _edge_line(depth, parent_id_for_edge, cluster_name, label=edge_label_from_parent)
+                yield from opening
+                if owner_id:
+                    self.edge_count += 1
+                    stack.append(_edge_line(depth, owner_id, cluster_name, label=owner_label))
+                stack.append(closing)
+                for field, value in ast_node.items():
+                    if field in NON_CHILD_FIELDS or value is None:
+                        continue
+                    if isinstance(value, list):
+                        for i, item in enumerate(value):
+                            children.append((item, None, None, True, depth + 1, None, None,
+                                             child_node_id(node_id, field, i)))
+                    elif isinstance(value, NODE_TYPES) and 'type' in value:
+                        children.append((value, None, None, True, depth + 1, None, None, child_node_id(node_id, field)))
+                stack.extend(reversed(children))
                 continue
-            if isinstance(value, list):
-                for item in value:
-                    child_id = _add_nodes_recursive(current_digraph_obj, item, None, None, parent_is_cluster=False)
-                    if child_id:
-                        current_digraph_obj.edge(node_id, child_id, label=field)
-            elif isinstance(value, dict) and 'type' in value:
-                child_id = _add_nodes_recursive(current_digraph_obj, value, None, None, parent_is_cluster=False)
-                if child_id:
-                    current_digraph_obj.edge(node_id, child_id, label=field)
-        return node_id
-
-    # Initial call
-    _add_nodes_recursive(dot, ast_dict, None, None, parent_is_cluster=True)
-
-    # Add legend if requested
-    if legend_mode == 'full':
-        bottom_anchor_name = f'bottom_anchor_{name}'
-        dot.node(bottom_anchor_name, style='invis', height='0.01', width='0.01', label='', group='legend_group')
-        add_legend(dot, LEGEND, get_node_color, bottom_anchor_name)
-    
-    print("---- DOT SOURCE START ----")
-    print(dot.source)
-    print("---- DOT SOURCE END ----")
-    return dot
 
-# The global add_legend function is now REMOVED from here, as its definition is moved inside generate_dot. 
\ No newline at end of file
+            # Handle regular nodes
+            self.node_count += 1
+            if 'collapsed' in ast_node:
+                # Summary node standing in for a collapsed subtree
+                yield _node_line(depth, node_id,
+                                 label=format_label_for_summary(ast_node, self.line_offset),
+                                 style='filled,dashed',
+                                 fillcolor=get_node_color(node_type))
+            else:
+                yield _node_line(depth, node_id,
+                                 label=format_label_for_node(ast_node, self.line_offset),
+                                 style='filled',
+                                 fillcolor=get_node_color(node_type))
+            if parent_id_for_edge:
+                self.edge_count += 1
+                yield _edge_line(depth, parent_id_for_edge, node_id, label=edge_label_from_parent)
+            if owner_id:
+                self.edge_count += 1
+                stack.append(_edge_line(depth, owner_id, node_id, label=owner_label))
+            for field, value in ast_node.items():
+                if field in NON_CHILD_FIELDS or value is None:
+                    continue
+                if isinstance(value, list):
+                    for i, item in enumerate(value):
+                        children.append((item, None, None, False, depth, node_id, field, child_node_id(node_id, field, i)))
+                elif isinstance(value, NODE_TYPES) and 'type' in value:
+                    children.append((value, None, None, False, depth, node_id, field, child_node_id(node_id, field)))
+            stack.extend(reversed(children))
+
+    def iter_legend(self) -> Iterator[str]:
+        bottom_anchor_name = f'bottom_anchor_{self.name}'
+        yield _node_line(0, bottom_anchor_name, label='', style='invis', height='0.01', width='0.01', group='legend_group')
+        html_table_string = legend_table(LEGEND)
+        if not html_table_string: return # Don't create legend if table is empty
+        # Add a single invisible node inside the cluster to give it an anchor point for its label
+        # and for connecting to the main graph anchor.
+        internal_legend_node = f'legend_internal_node_{self.name}'
+        # Connect this cluster's internal node to the overall graph anchor to pull it down
+        yield _edge_line(0, bottom_anchor_name, internal_legend_node, style='invis', constraint='false')
+        yield _subgraph_head(0, 'cluster_html_legend')
+        yield _graph_attr_line(1, label=html_table_string,
+                               labelloc='b', # b=bottom, c=center, t=top
+                               labeljust='r', # r=right, c=center, l=left
+                               style='invis', # Makes the cluster bounding box invisible
+                               group='legend_group' # Try to group it with the anchor
+                               )
+        yield _node_line(1, internal_legend_node, style='invis', shape='point', width='0.001', height='0.001')
+        yield _subgraph_tail(0)
+
+def iter_dot(ast_dict, name='ast', graph_attrs=None, node_attrs=None, edge_attrs=None, legend_mode='full',
+             stats=None, max_depth=None, node_budget=None, root_path='', clusters=True, prune=None,
+             line_offset=0) -> Iterator[str]:
+    """
+    Yield the complete DOT source for an AST dictionary line by line, without building a Digraph.
+    If a stats dict is given it receives the node/edge/cluster counts once the walk finishes.
+    With root_path, only the subtree at that AST path is rendered (node IDs stay those of the full graph);
+    a path that does not lead to a node raises KeyError before anything is yielded.
+    An invalid prune spec raises ValueError, also before anything is yielded.
+    line_offset is subtracted from the line numbers shown.
+    """
+    if root_path:
+        ast_dict = resolve_path(ast_dict, root_path)
+    emitter = DotEmitter(name, graph_attrs, node_attrs, edge_attrs, legend_mode, max_depth, node_budget, root_path,
+                         clusters, prune, line_offset)
+    yield f"digraph {quote(name)} {{\n"
+    yield from emitter.iter_body(ast_dict)
+    yield "}\n"
+    if stats is not None:
+        stats.update(emitter.stats())
+
+def iter_dot_chunks(ast_dict, chunk_size: int = 64 * 1024, **kwargs) -> Iterator[str]:
+    """Like iter_dot, but batches lines into chunks of roughly chunk_size characters."""
+    buffer = []
+    buffered = 0
+    for line in iter_dot(ast_dict, **kwargs):
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= chunk_size:
+            yield ''.join(buffer)
+            buffer.clear()
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def write_dot(ast_dict, fileobj: IO[str], chunk_size: int = 64 * 1024, **kwargs) -> None:
+    """Stream the DOT source for an AST dictionary to a text file object in chunks."""
+    for chunk in iter_dot_chunks(ast_dict, chunk_size, **kwargs):
+        fileobj.write(chunk)
+
+def generate_dot(ast_dict, name='ast', graph_attrs=None, node_attrs=None, edge_attrs=None, legend_mode='full',
+                 stats=None, max_depth=None, node_budget=None, root_path='', clusters=True, prune=None) -> Digraph:
+    """
+    Convert AST dictionary to Graphviz DOT using HTML-like labels.
+    - Uses nested clusters for list fields containing primary cluster nodes
+    - Uses dashed style for true containers with >1 non-empty child list
+    - Line numbers are shown in smaller font under the main label
+    - Adds a color legend at the bottom of the graph
+    - Level of detail: max_depth and/or node_budget collapse subtrees into dashed summary
+      nodes that show how many nodes they hide
+    - root_path renders only the subtree at that AST path (see iter_dot)
+    - clusters=False draws functions, classes etc. as plain nodes (a cheaper graph to lay out)
+    - prune leaves out low-information nodes first (a preset such as 'compact'; see prune.py)
+    The body is produced by DotEmitter, so the source is identical to iter_dot/write_dot.
+    """
+    if root_path:
+        ast_dict = resolve_path(ast_dict, root_path)
+    dot = Digraph(name=name, format='png')
+    emitter = DotEmitter(name, graph_attrs, node_attrs, edge_attrs, legend_mode, max_depth, node_budget, root_path,
+                         clusters, prune)
+    dot.body.extend(emitter.iter_body(ast_dict))
+    if stats is not None:
+        stats.update(emitter.stats())
+    return dot
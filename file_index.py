@@ -0,0 +1,254 @@
+import ast
+import base64
+import binascii
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from render_cache import source_hash
+
+# Seconds between background refreshes (CODEVIZ_FILE_INDEX_INTERVAL)
+REFRESH_INTERVAL = float(os.environ.get('CODEVIZ_FILE_INDEX_INTERVAL', '2'))
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(path: str) -> str:
+    return base64.urlsafe_b64encode(path.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> str:
+    """The last path of the previous page; raises ValueError for a cursor this module did not write."""
+    try:
+        return base64.b64decode(cursor.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from None
+
+
+def count_nodes(code: str) -> int:
+    return sum(1 for _ in ast.walk(ast.parse(code)))
+
+
+class FileEntry:
+    """One indexed file: stat signature, and content hash and node count once measured."""
+    __slots__ = ('path', 'size', 'mtime_ns', 'digest', 'nodes', 'error')
+
+    def __init__(self, path: str, size: int, mtime_ns: int):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.digest: Optional[str] = None
+        self.nodes: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {"path": self.path, "size": self.size, "mtime": self.mtime_ns / 1e9, "hash": self.digest,
+                "nodes": self.nodes, "error": self.error}
+
+
+class FileIndex:
+    """
+    In-memory index of the Python files under root, so listing and searching never touch the
+    file system per request.
+    - refresh() walks the tree with os.scandir but only re-lists directories whose mtime changed
+      (entries added, removed or renamed); files in the others are only stat()ed for edits.
+      Hidden directories, __pycache__ and symlinked directories are skipped, as in batch mode.
+    - New and edited files are read once by measure() for their content hash and AST node
+      count; both are None until then.
+    - Paths ('/'-separated, relative to root) are kept sorted: a prefix is a bisection, and a
+      pagination cursor is the last path returned, which stays valid while files come and go.
+    - start() refreshes and measures in a background thread every interval seconds, then calls
+      on_change(refresh stats) after the first refresh and after any that found files added,
+      edited or removed, so other indexes of the tree can follow without walking it per request.
+    """
+    def __init__(self, root: str, interval: float = REFRESH_INTERVAL,
+                 on_change: Optional[Callable[[Dict[str, float]], None]] = None):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        # Relative directory -> (mtime_ns, subdirectories, Python file names) as last listed
+        self._dirs: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        self._entries: Dict[str, FileEntry] = {}
+        # Sorted paths, and their lowercase forms for substring search; replaced, never mutated
+        self._paths: List[str] = []
+        self._folded: List[str] = []
+        self._pending: Set[str] = set()
+        self.refreshed_at: Optional[float] = None
+        self.last_refresh: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> Dict[str, float]:
+        """Bring the index up to date with the file system; returns what changed."""
+        start = time.perf_counter()
+        stats = {"dirs": 0, "listed": 0, "files": 0, "added": 0, "changed": 0, "removed": 0}
+        dirs: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        found: Dict[str, Tuple[int, int]] = {}
+        stack = ['']
+        while stack:
+            relative = stack.pop()
+            directory = os.path.join(self.root, relative)
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+                known = self._dirs.get(relative)
+                if known is not None and known[0] == mtime_ns:
+                    subdirs, files = known[1], known[2]
+                else:
+                    subdirs, files = [], []
+                    with os.scandir(directory) as it:
+                        for entry in it:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not entry.name.startswith('.') and entry.name != '__pycache__':
+                                    subdirs.append(entry.name)
+                            elif entry.name.endswith('.py') and entry.is_file():
+                                files.append(entry.name)
+                    stats["listed"] += 1
+            except OSError:  # Removed while we were walking
+                continue
+            dirs[relative] = (mtime_ns, subdirs, files)
+            prefix = relative + '/' if relative else ''
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                found[prefix + name] = (st.st_mtime_ns, st.st_size)
+            stack.extend(prefix + name for name in subdirs)
+
+        with self._lock:
+            for path, (mtime_ns, size) in found.items():
+                entry = self._entries.get(path)
+                if entry is None:
+                    self._entries[path] = FileEntry(path, size, mtime_ns)
+                    stats["added"] += 1
+                elif (entry.mtime_ns, entry.size) != (mtime_ns, size):
+                    entry.mtime_ns, entry.size = mtime_ns, size
+                    entry.digest = entry.nodes = entry.error = None
+                    stats["changed"] += 1
+                else:
+                    continue
+                self._pending.add(path)
+            removed = [path for path in self._entries if path not in found]
+            for path in removed:
+                del self._entries[path]
+                self._pending.discard(path)
+            stats["removed"] = len(removed)
+            if stats["added"] or removed:
+                self._paths = sorted(self._entries)
+                self._folded = [path.lower() for path in self._paths]
+            self._dirs = dirs
+            self.refreshed_at = time.time()
+        stats["dirs"] = len(dirs)
+        stats["files"] = len(found)
+        stats["seconds"] = round(time.perf_counter() - start, 4)
+        self.last_refresh = stats
+        return stats
+
+    def measure(self, limit: Optional[int] = None) -> int:
+        """Read up to limit new or edited files for their content hash and node count; returns how many."""
+        with self._lock:
+            paths = sorted(self._pending)[:limit]
+        for path in paths:
+            digest = nodes = error = signature = None
+            try:
+                full_path = os.path.join(self.root, path)
+                st = os.stat(full_path)
+                signature = (st.st_mtime_ns, st.st_size)
+                with open(full_path) as f:
+                    code = f.read()
+                digest = source_hash(code)
+                nodes = count_nodes(code)
+            except (SyntaxError, ValueError, RecursionError, MemoryError) as e:  # Including UnicodeDecodeError
+                error = f"{type(e).__name__}: {e}"
+            except OSError:
+                pass  # Gone since the refresh; the next one drops it
+            with self._lock:
+                self._pending.discard(path)
+                entry = self._entries.get(path)
+                if entry is None or signature is None:
+                    continue
+                if (entry.mtime_ns, entry.size) != signature:
+                    self._pending.add(path)  # Edited since the refresh; measured again after the next one
+                    continue
+                entry.digest, entry.nodes, entry.error = digest, nodes, error
+        return len(paths)
+
+    @property
+    def running(self) -> bool:
+        """Whether the background refresh thread is started."""
+        return self._thread is not None
+
+    def ensure_current(self) -> None:
+        """Refresh now if the index was never built (or the background thread is not running)."""
+        if self.refreshed_at is None or (not self.running and time.time() - self.refreshed_at > self.interval):
+            self.refresh()
+
+    def query(self, prefix: str = '', search: str = '', cursor: Optional[str] = None,
+              limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        """
+        One page of paths starting with prefix and containing search (case-insensitive), after
+        cursor. Returns {"files": [entry dicts], "total": matches overall, "next_cursor": cursor
+        for the following page or None}. A bad cursor raises ValueError.
+        """
+        self.ensure_current()
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            paths, folded = self._paths, self._folded
+        first = bisect_left(paths, prefix)
+        end = bisect_left(paths, prefix + '\U0010ffff', first) if prefix else len(paths)
+        after = bisect_right(paths, decode_cursor(cursor), first, end) if cursor else first
+        needle = search.lower()
+        if needle:
+            matches = [i for i in range(first, end) if needle in folded[i]]
+            total = len(matches)
+            page = matches[bisect_left(matches, after):][:limit + 1]
+        else:
+            total = end - first
+            page = list(range(after, min(end, after + limit + 1)))
+        more = len(page) > limit
+        page = page[:limit]
+        with self._lock:
+            files = [self._entries[paths[i]].as_dict() for i in page if paths[i] in self._entries]
+        return {"files": files, "total": total,
+                "next_cursor": encode_cursor(paths[page[-1]]) if more and page else None}
+
+    def paths(self) -> List[str]:
+        self.ensure_current()
+        return self._paths
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._entries), "pending": len(self._pending), "dirs": len(self._dirs),
+                    "refreshed_at": self.refreshed_at, "last_refresh": self.last_refresh}
+
+    def _run(self) -> None:
+        notified = False
+        while not self._stop.is_set():
+            try:
+                stats = self.refresh()
+                # Measure in small batches so a huge initial backlog does not delay the next refresh long
+                while self.measure(256) and not self._stop.is_set():
+                    pass
+                if self.on_change is not None and (not notified or stats["added"] or stats["changed"]
+                                                   or stats["removed"]):
+                    notified = True
+                    self.on_change(stats)
+            except Exception:  # Keep polling; a transient error must not stop the index
+                pass
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='file-index', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
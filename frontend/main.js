@@ -1,44 +1,175 @@
-import { Graphviz } from "@hpcc-js/wasm";
 import svgPanZoom from "svg-pan-zoom";
 
 // Make panZoomInstance globally accessible or scoped appropriately
 // to be available for the reset button
 let panZoomInstance;
 
-async function getPythonFiles() {
-  const response = await fetch('http://localhost:8000/api/list-python-files');
-  return await response.json();
+// Files are first shown as an overview capped at this many nodes;
+// "Show full graph" re-renders the current file without the cap
+const OVERVIEW_NODE_BUDGET = 400;
+// Browser layouts run on the main thread without limits: above BROWSER_DOT_MAX_EDGES the
+// cheaper sfdp engine is used, above BROWSER_MAX_EDGES the graph is fetched as an overview
+const BROWSER_DOT_MAX_EDGES = 2000;
+const BROWSER_MAX_EDGES = 10000;
+let currentFile;
+
+// Live editing: edits are sent this long after the last keystroke; the server answers with
+// graph deltas that are applied to a local model of the graph's elements
+const LIVE_DEBOUNCE_MS = 150;
+const TOP_LEVEL_ID = /^((?:cluster_[a-z]+_)?n\.body\.)(\d+)(?=\.|$)/;
+let liveSocket;
+let liveModel;
+let liveSeq = 0;
+
+// The file picker lists one page of the server's file index; typing in the search box narrows it
+const FILE_PAGE_SIZE = 200;
+const FILE_SEARCH_DEBOUNCE_MS = 200;
+
+async function getPythonFiles(query = '') {
+  const params = new URLSearchParams({ limit: FILE_PAGE_SIZE, q: query });
+  const response = await fetch(`http://localhost:8000/api/files?${params}`);
+  return (await response.json()).files;
+}
+
+function fillFileOptions(select, files) {
+  select.replaceChildren(...files.map(f => {
+    const option = document.createElement('option');
+    option.value = f.path;
+    option.textContent = f.nodes == null ? f.path : `${f.path} (${f.nodes} nodes)`;
+    return option;
+  }));
 }
 
 function createFilePicker(pyFiles) {
+  const search = document.createElement('input');
+  search.type = 'search';
+  search.placeholder = 'Filter files';
   const select = document.createElement('select');
-  pyFiles.forEach(f => {
-    const option = document.createElement('option');
-    option.value = f;
-    option.textContent = f;
-    select.appendChild(option);
-  });
+  fillFileOptions(select, pyFiles);
+  document.body.insertBefore(search, document.getElementById('graph'));
   document.body.insertBefore(select, document.getElementById('graph'));
 
   select.addEventListener('change', () => {
     loadAndRenderDot(select.value);
   });
 
+  let searchTimer;
+  search.addEventListener('input', () => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(async () => fillFileOptions(select, await getPythonFiles(search.value)),
+                             FILE_SEARCH_DEBOUNCE_MS);
+  });
+
   // Load the first file by default
   if (pyFiles.length > 0) {
-    loadAndRenderDot(pyFiles[0]);
+    loadAndRenderDot(pyFiles[0].path);
     // Add reset button after the first graph is loaded
     addResetButton();
+    addFullGraphButton();
+    addLiveEditButton();
+    addControlFlowButton();
   }
 }
 
-async function loadAndRenderDot(pyFile) {
-  const response = await fetch(`http://localhost:8000/api/dot/${pyFile}`);
-  const dot = await response.text();
+function edgeCount(dot) {
+  return dot.split(' -> ').length - 1;
+}
+
+// The WASM layout engine is only loaded when the server cannot lay a graph out
+async function layoutInBrowser(dot) {
+  const { Graphviz } = await import("@hpcc-js/wasm");
+  const graphviz = await Graphviz.load();
+  return await graphviz.layout(dot, "svg", edgeCount(dot) > BROWSER_DOT_MAX_EDGES ? "sfdp" : "dot");
+}
+
+function escapeXml(text) {
+  return String(text).replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' })[c]);
+}
+
+// SVG markup for a list of xdot drawing operations (see layout.layout_scene); pen, fill,
+// font and style carry over from one operation to the next, as in Graphviz
+function drawOps(ops) {
+  const state = { pen: 'black', fill: 'none', face: 'Times,serif', size: 14, style: '', fontchar: 0 };
+  const points = pts => pts.map(([x, y]) => `${x},${y}`).join(' ');
+  const parts = [];
+  for (const op of ops) {
+    const dash = state.style.includes('dashed') ? ' stroke-dasharray="5,2"' : state.style.includes('dotted') ? ' stroke-dasharray="1,5"' : '';
+    const stroke = `stroke="${state.pen}"${dash}`;
+    switch (op.op) {
+      case 'c': state.pen = op.color || state.pen; break;
+      case 'C': state.fill = op.color || state.fill; break;
+      case 'S': state.style = op.style; break;
+      case 'F': state.face = op.face; state.size = op.size; break;
+      case 't': state.fontchar = op.fontchar; break;
+      case 'E':
+      case 'e': {
+        const [cx, cy, rx, ry] = op.rect;
+        parts.push(`<ellipse cx="${cx}" cy="${cy}" rx="${rx}" ry="${ry}" fill="${op.op === 'E' ? state.fill : 'none'}" ${stroke}/>`);
+        break;
+      }
+      case 'P':
+      case 'p':
+        parts.push(`<polygon points="${points(op.points)}" fill="${op.op === 'P' ? state.fill : 'none'}" ${stroke}/>`);
+        break;
+      case 'L':
+        parts.push(`<polyline points="${points(op.points)}" fill="none" ${stroke}/>`);
+        break;
+      case 'B':
+      case 'b': {
+        const [first, ...rest] = op.points;
+        let d = `M${first[0]},${first[1]}`;
+        for (let i = 0; i + 2 < rest.length; i += 3) {
+          d += `C${points(rest.slice(i, i + 3))}`;
+        }
+        parts.push(`<path d="${d}" fill="${op.op === 'B' ? state.fill : 'none'}" ${stroke}/>`);
+        break;
+      }
+      case 'T': {
+        const anchor = { l: 'start', c: 'middle', r: 'end' }[op.align] || 'middle';
+        const weight = state.fontchar & 1 ? ' font-weight="bold"' : '';
+        const italic = state.fontchar & 2 ? ' font-style="italic"' : '';
+        parts.push(`<text x="${op.pt[0]}" y="${op.pt[1]}" text-anchor="${anchor}" font-family="${escapeXml(state.face)}" ` +
+                   `font-size="${state.size}" fill="${state.pen}"${weight}${italic}>${escapeXml(op.text)}</text>`);
+        break;
+      }
+    }
+  }
+  return parts.join('');
+}
+
+// Draw a layout scene as SVG; elements get the same g.node/g.edge/g.cluster groups with a
+// <title> as Graphviz's SVG, so drill-down works on either
+function drawScene(scene) {
+  const group = (cls, title, ops) => `<g class="${cls}"><title>${escapeXml(title)}</title>${drawOps(ops)}</g>`;
+  return `<svg xmlns="http://www.w3.org/2000/svg" viewBox="${scene.origin[0]} ${scene.origin[1]} ${scene.width} ${scene.height}">` +
+    `<g class="graph">${drawOps(scene.graph)}` +
+    scene.clusters.map(c => group('cluster', c.name, c.draw)).join('') +
+    scene.edges.map(e => group('edge', `${e.tail}->${e.head}`, e.draw)).join('') +
+    scene.nodes.map(n => group('node', n.name, n.draw)).join('') +
+    '</g></svg>';
+}
+
+// Prefer the server-side layout (cached per unique graph, picks the engine by size and
+// degrades to cheaper graphs when a layout hits its limits), fetched as a scene of drawing
+// operations; fall back to laying out the DOT in the browser when the server has no Graphviz
+async function fetchSvg(pyFile, full) {
+  const query = full ? '' : `?node_budget=${OVERVIEW_NODE_BUDGET}`;
+  const response = await fetch(`http://localhost:8000/api/layout/${pyFile}${query ? query + '&' : '?'}format=scene`);
+  if (response.ok) {
+    return drawScene(await response.json());
+  }
+  let dot = await (await fetch(`http://localhost:8000/api/dot/${pyFile}${query}`)).text();
+  if (edgeCount(dot) > BROWSER_MAX_EDGES) {
+    dot = await (await fetch(`http://localhost:8000/api/dot/${pyFile}?node_budget=${OVERVIEW_NODE_BUDGET}`)).text();
+  }
+  return await layoutInBrowser(dot);
+}
+
+async function loadAndRenderDot(pyFile, full = false) {
+  currentFile = pyFile;
   const graphDiv = document.getElementById('graph');
   graphDiv.innerHTML = '';
-  const graphviz = await Graphviz.load();
-  const svg = await graphviz.layout(dot, "svg", "dot");
+  const svg = await fetchSvg(pyFile, full);
   graphDiv.innerHTML = svg;
   const svgElem = graphDiv.querySelector("svg");
 
@@ -48,6 +179,8 @@ async function loadAndRenderDot(pyFile) {
     svgElem.setAttribute('height', '100%');
   }
 
+  enableDrillDown(svgElem);
+
   // Initialize pan/zoom
   if (panZoomInstance) {
     panZoomInstance.destroy();
@@ -63,6 +196,43 @@ async function loadAndRenderDot(pyFile) {
   // window.addEventListener('resize', updatePanLimits); // Comment out or remove if not needed
 }
 
+// Node IDs ("n" for the module, "n.body.3" for a top-level statement, "n.body.3.<hash>" below it)
+// identify a node within the file, so a clicked node can be opened on its own through the
+// subtree endpoint
+function enableDrillDown(svgElem) {
+  if (!svgElem) {
+    return;
+  }
+  svgElem.querySelectorAll('g.node').forEach(nodeElem => {
+    const title = nodeElem.querySelector('title');
+    if (!title || !title.textContent.startsWith('n.')) {
+      return;
+    }
+    nodeElem.style.cursor = 'pointer';
+    nodeElem.addEventListener('dblclick', () => loadSubtree(currentFile, title.textContent));
+  });
+}
+
+async function loadSubtree(pyFile, nodeId) {
+  const response = await fetch(`http://localhost:8000/api/ast/${pyFile}/subtree?node=${encodeURIComponent(nodeId)}&depth=3`);
+  if (!response.ok) {
+    return;
+  }
+  const dot = await response.text();
+  const graphDiv = document.getElementById('graph');
+  graphDiv.innerHTML = await layoutInBrowser(dot);
+  const svgElem = graphDiv.querySelector("svg");
+  if (svgElem) {
+    svgElem.setAttribute('width', '100%');
+    svgElem.setAttribute('height', '100%');
+  }
+  enableDrillDown(svgElem);
+  if (panZoomInstance) {
+    panZoomInstance.destroy();
+  }
+  panZoomInstance = svgPanZoom(svgElem, { maxZoom: 5, minZoom: 0.5, contain: false, center: true });
+}
+
 // Function to add the reset button and its event listener
 function addResetButton() {
   // Check if button already exists to prevent duplicates
@@ -86,5 +256,199 @@ function addResetButton() {
   });
 }
 
+// Button that re-renders the current file without the overview node budget
+function addFullGraphButton() {
+  if (document.getElementById('fullGraphBtn')) {
+    return;
+  }
+  const fullButton = document.createElement('button');
+  fullButton.id = 'fullGraphBtn';
+  fullButton.textContent = 'Show full graph';
+  fullButton.style.position = 'absolute';
+  fullButton.style.top = '10px';
+  fullButton.style.right = '110px';
+  fullButton.style.zIndex = '1000';
+  document.body.appendChild(fullButton);
+
+  fullButton.addEventListener('click', () => {
+    if (currentFile) {
+      loadAndRenderDot(currentFile, true);
+    }
+  });
+}
+
+function showSvg(svg) {
+  const graphDiv = document.getElementById('graph');
+  graphDiv.innerHTML = svg;
+  const svgElem = graphDiv.querySelector("svg");
+  if (!svgElem) {
+    return;
+  }
+  svgElem.setAttribute('width', '100%');
+  svgElem.setAttribute('height', '100%');
+  if (panZoomInstance) {
+    panZoomInstance.destroy();
+  }
+  panZoomInstance = svgPanZoom(svgElem, { maxZoom: 5, minZoom: 0.5, contain: false, center: true });
+}
+
+function quoteId(id) {
+  return '"' + id.replace(/"/g, '\\"') + '"';
+}
+
+function attrText(attrs) {
+  // HTML-like labels are sent as <...>; everything else is quoted
+  return Object.entries(attrs).map(([k, v]) => `${k}=${v.startsWith('<') ? v : quoteId(v)}`).join(' ');
+}
+
+function elementKey(group, element) {
+  return group === 'edges' ? `${element.tail}\u0000${element.head}` : element.id;
+}
+
+function renameTopLevel(name, renames) {
+  const match = name && name.match(TOP_LEVEL_ID);
+  if (!match || !(match[2] in renames)) {
+    return name;
+  }
+  return match[1] + renames[match[2]] + name.slice(match[0].length);
+}
+
+// Deltas are applied in order: removals, renames of moved top-level statements, updates, additions
+function applyDelta(message) {
+  for (const [group, items] of Object.entries(message.remove)) {
+    items.forEach(item => liveModel[group].delete(group === 'edges' ? `${item[0]}\u0000${item[1]}` : item));
+  }
+  if (Object.keys(message.renames).length) {
+    for (const group of ['clusters', 'nodes', 'edges']) {
+      const renamed = new Map();
+      liveModel[group].forEach(element => {
+        const moved = { ...element };
+        ['id', 'tail', 'head', 'cluster'].forEach(field => { moved[field] = renameTopLevel(moved[field], message.renames); });
+        renamed.set(elementKey(group, moved), moved);
+      });
+      liveModel[group] = renamed;
+    }
+  }
+  for (const part of [message.update, message.add]) {
+    for (const [group, items] of Object.entries(part)) {
+      items.forEach(element => liveModel[group].set(elementKey(group, element), element));
+    }
+  }
+}
+
+function modelDot() {
+  const members = new Map();
+  const add = (cluster, line) => {
+    if (!members.has(cluster)) {
+      members.set(cluster, []);
+    }
+    members.get(cluster).push(line);
+  };
+  liveModel.nodes.forEach(n => add(n.cluster, `${quoteId(n.id)} [${attrText(n.attrs)}]`));
+  liveModel.edges.forEach(e => add(e.cluster, `${quoteId(e.tail)} -> ${quoteId(e.head)} [${attrText(e.attrs)}]`));
+  const emit = cluster => {
+    const lines = [];
+    liveModel.clusters.forEach(c => {
+      if (c.cluster === cluster) {
+        lines.push(`subgraph ${quoteId(c.id)} {`, attrText(c.attrs), ...emit(c.id), '}');
+      }
+    });
+    return lines.concat(members.get(cluster) || []);
+  };
+  return [...liveModel.head, ...emit(liveModel.cluster), '}', '}'].join('\n');
+}
+
+function toggleLiveEditor() {
+  let editor = document.getElementById('liveEditor');
+  if (editor) {
+    editor.remove();
+    liveSocket.close();
+    return;
+  }
+  editor = document.createElement('textarea');
+  editor.id = 'liveEditor';
+  editor.placeholder = 'Type Python code...';
+  Object.assign(editor.style, { position: 'absolute', left: '10px', top: '40px', width: '30vw', height: '80vh',
+                                zIndex: '1000', fontFamily: 'monospace' });
+  document.body.appendChild(editor);
+
+  liveSocket = new WebSocket('ws://localhost:8000/ws/live');
+  liveSocket.addEventListener('message', async event => {
+    const message = JSON.parse(event.data);
+    if (message.type === 'error') {
+      editor.style.outline = '2px solid red';
+      editor.title = message.line ? `${message.error} (line ${message.line})` : message.error;
+      return;
+    }
+    editor.style.outline = '';
+    editor.title = '';
+    if (message.type === 'snapshot') {
+      // Everything up to the module cluster's attribute line is kept verbatim
+      const lines = message.dot.split('\n');
+      const open = lines.findIndex(line => line.includes(`subgraph ${message.cluster} {`));
+      liveModel = { head: lines.slice(0, open + 2), cluster: message.cluster,
+                    clusters: new Map(), nodes: new Map(), edges: new Map() };
+      for (const group of ['clusters', 'nodes', 'edges']) {
+        message[group].forEach(element => liveModel[group].set(elementKey(group, element), element));
+      }
+    } else {
+      applyDelta(message);
+    }
+    showSvg(await layoutInBrowser(modelDot()));
+  });
+
+  let timer;
+  editor.addEventListener('input', () => {
+    clearTimeout(timer);
+    timer = setTimeout(() => {
+      liveSeq += 1;
+      liveSocket.send(JSON.stringify({ seq: liveSeq, code: editor.value }));
+    }, LIVE_DEBOUNCE_MS);
+  });
+}
+
+function addLiveEditButton() {
+  if (document.getElementById('liveEditBtn')) {
+    return;
+  }
+  const liveButton = document.createElement('button');
+  liveButton.id = 'liveEditBtn';
+  liveButton.textContent = 'Live edit';
+  liveButton.style.position = 'absolute';
+  liveButton.style.top = '10px';
+  liveButton.style.right = '235px';
+  liveButton.style.zIndex = '1000';
+  document.body.appendChild(liveButton);
+  liveButton.addEventListener('click', toggleLiveEditor);
+}
+
+// Button that shows the current file's control-flow graphs (basic blocks per function)
+// instead of its AST; much smaller graphs, so they also lay out quickly in the browser
+function addControlFlowButton() {
+  if (document.getElementById('controlFlowBtn')) {
+    return;
+  }
+  const cfgButton = document.createElement('button');
+  cfgButton.id = 'controlFlowBtn';
+  cfgButton.textContent = 'Control flow';
+  cfgButton.style.position = 'absolute';
+  cfgButton.style.top = '10px';
+  cfgButton.style.right = '315px';
+  cfgButton.style.zIndex = '1000';
+  document.body.appendChild(cfgButton);
+  cfgButton.addEventListener('click', async () => {
+    if (!currentFile) {
+      return;
+    }
+    const response = await fetch(`http://localhost:8000/api/cfg/${currentFile}?format=svg`);
+    if (response.ok) {
+      showSvg(await response.text());
+      return;
+    }
+    const dot = await (await fetch(`http://localhost:8000/api/cfg/${currentFile}`)).text();
+    showSvg(await layoutInBrowser(dot));
+  });
+}
+
 // On page load, fetch the file list and create the picker
 getPythonFiles().then(createFilePicker);
\ No newline at end of file
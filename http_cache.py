@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+try:  # brotli is optional; without it only gzip is offered
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed: the saving doesn't pay for the CPU
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = {'text/plain', 'text/vnd.graphviz', 'image/svg+xml', 'application/json',
+                      'application/msgpack', 'application/octet-stream'}
+
+
+def make_etag(*parts: str) -> str:
+    """Strong ETag for a representation identified by parts (e.g. kind, source hash, config hash)."""
+    return '"' + hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """Compressed bodies are different representations, so they get their own strong ETag."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def match_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    Return the entity tag from an If-None-Match header that matches etag, or None.
+    Uses weak comparison (as RFC 9110 requires for If-None-Match) and accepts the tag
+    of any content-coding of the same representation.
+    """
+    if not if_none_match:
+        return None
+    base = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return etag
+        opaque = (candidate[2:] if candidate.startswith('W/') else candidate).strip('"')
+        if opaque == base or opaque.rsplit('-', 1)[0] == base:
+            return candidate
+    return None
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value."""
+    codings: Dict[str, float] = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, preferring brotli when it is available."""
+    codings = parse_accept_encoding(accept_encoding)
+    wildcard = codings.get('*', 0.0)
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        # mtime=0 keeps the output deterministic for identical input
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported content-coding: {encoding}")
+
+
+def is_compressible(media_type: str, size: int) -> bool:
+    return size >= MIN_COMPRESS_BYTES and media_type.split(';')[0].strip() in COMPRESSIBLE_TYPES
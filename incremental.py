@@ -0,0 +1,166 @@
+import ast
+import hashlib
+import os
+import re
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from graphviz.quoting import quote
+from ast_handlers import ast_to_dict
+from ast_paths import join_path
+from dot_render import DotEmitter
+from prune import prune_tree, resolve_prune
+from profiling import NULL_PROFILER, Profiler
+
+# Our label markup for line numbers and the prefix of every node ID in a top-level fragment.
+# They are only rewritten for statements whose source cannot contain the same text.
+LINE_LABEL = re.compile(r"l#: (\d+)(?:-(\d+))?")
+LINE_MARKER = 'l#:'
+ID_MARKER = 'n.body.'
+
+# Polling interval for watch mode; stat() on one file is cheap enough to do this often
+WATCH_INTERVAL = 0.05
+
+
+def statement_span(stmt: ast.stmt) -> Tuple[int, int]:
+    """First and last source line of a top-level statement, including its decorators."""
+    start = stmt.lineno
+    for decorator in getattr(stmt, 'decorator_list', ()):
+        start = min(start, decorator.lineno)
+    return start, stmt.end_lineno
+
+
+def move_fragment(text: str, line_delta: int, old_index: int, new_index: int) -> str:
+    """Rewrite a statement's DOT fragment for a new start line and top-level index."""
+    if line_delta:
+        def shift(match):
+            first = f"l#: {int(match.group(1)) + line_delta}"
+            return f"{first}-{int(match.group(2)) + line_delta}" if match.group(2) else first
+        text = LINE_LABEL.sub(shift, text)
+    if old_index != new_index:
+        text = re.sub(rf'(?<=[_"])n\.body\.{old_index}(?=[".])', f"n.body.{new_index}", text)
+    return text
+
+
+class IncrementalRenderer:
+    """
+    Re-renders one module after edits, redoing only the top-level statements that changed.
+    - Each top-level statement is keyed by a hash of its source lines. A statement that kept
+      its text and position reuses its ast_to_dict output and DOT fragment as they are.
+    - If it only moved (lines inserted above it, statements added before it) its DOT fragment
+      is patched for the new line numbers and node IDs instead of being walked again, and its
+      dict is only rebuilt when ast_dict is read.
+    - The output is identical to iter_dot() on the full module (with the same prune option).
+    The source is still parsed as a whole (ast.parse is the cheapest stage); a SyntaxError
+    propagates and leaves the previous state in place.
+    """
+    def __init__(self, name: str = 'ast', legend_mode: str = 'full', prune=None):
+        self.name = name
+        self.legend_mode = legend_mode
+        self.prune = resolve_prune(prune)
+        # (source digest, col_offset) -> (start line, index, statement dict or None, DOT text, counts)
+        self._statements: Dict[Tuple[str, int], Tuple[int, int, Optional[dict], str, dict]] = {}
+        self._body: List[Tuple[Tuple[str, int], ast.stmt]] = []
+        self._ast_dict: Optional[dict] = None
+        self.stats: Dict[str, int] = {}
+        # (statement key, index, DOT fragment) of each top-level statement of the last render,
+        # and the cluster they are drawn in
+        self.fragments: List[Tuple[Tuple[str, int], int, str]] = []
+        self.module_cluster: Optional[str] = None
+
+    @property
+    def ast_dict(self) -> Optional[dict]:
+        """AST dictionary of the last rendered source (moved statements are converted on first access)."""
+        if self._ast_dict is None and self.module_cluster is not None:  # Rendered at least once
+            body = []
+            for key, stmt in self._body:
+                start, index, node_dict, text, counts = self._statements[key]
+                if node_dict is None:
+                    node_dict = ast_to_dict(stmt)
+                    self._statements[key] = (start, index, node_dict, text, counts)
+                body.append(node_dict)
+            self._ast_dict = ast_to_dict(ast.Module(body=[], type_ignores=[]))
+            self._ast_dict['body'] = body
+        return self._ast_dict
+
+    def render(self, code: str, profiler: Profiler = NULL_PROFILER) -> str:
+        """Return the DOT source for code, reusing whatever the previous render can provide."""
+        with profiler.stage('parse'):
+            tree = ast.parse(code)
+        lines = code.splitlines(keepends=True)
+
+        statements = {}
+        body = []
+        fragments = []
+        with profiler.stage('dot') as stage:
+            emitter = DotEmitter(self.name, legend_mode=self.legend_mode)
+            parts = [f"digraph {quote(self.name)} {{\n"]
+            parts.extend(emitter.iter_head())
+            module_cluster, opening, closing = emitter.cluster_lines(ast_to_dict(ast.Module(body=[], type_ignores=[])))
+            parts.extend(opening)
+            totals = emitter.stats()
+            reused = moved = converted = 0
+            for index, stmt in enumerate(tree.body):
+                start, end = statement_span(stmt)
+                source = ''.join(lines[start - 1:end])
+                key = (hashlib.sha1(source.encode()).hexdigest(), stmt.col_offset)
+                cached = self._statements.get(key)
+                if cached is not None and cached[:2] == (start, index):
+                    node_dict, text, counts = cached[2:]
+                    reused += 1
+                elif cached is not None and LINE_MARKER not in source and ID_MARKER not in source:
+                    node_dict = None
+                    text = move_fragment(cached[3], start - cached[0], cached[1], index)
+                    counts = cached[4]
+                    moved += 1
+                else:
+                    node_dict = ast_to_dict(stmt)
+                    fragment_emitter = DotEmitter(self.name, legend_mode=self.legend_mode)
+                    path = join_path('', 'body', index)
+                    pruned = prune_tree(node_dict, self.prune, path, keep_root=False)
+                    text = ''.join(fragment_emitter.iter_nodes(pruned, depth=1, path=path)) if pruned else ''
+                    counts = fragment_emitter.stats()
+                    converted += 1
+                statements[key] = (start, index, node_dict, text, counts)
+                body.append((key, stmt))
+                fragments.append((key, index, text))
+                parts.append(text)
+                for name, value in counts.items():
+                    totals[name] += value
+            parts.append(closing)
+            parts.extend(emitter.iter_tail())
+            parts.append("}\n")
+            stage.count(reused=reused, moved=moved, converted=converted, **totals)
+
+        # Only what the current source uses is kept, so memory tracks the module's size
+        self._statements = statements
+        self._body = body
+        self.fragments = fragments
+        self.module_cluster = module_cluster
+        self._ast_dict = None
+        self.stats = totals
+        return ''.join(parts)
+
+
+def iter_changes(path: str, interval: float = WATCH_INTERVAL) -> Iterator[str]:
+    """
+    Yield the contents of path now and after every change, polling its (mtime, size).
+    Saves that leave the text unchanged are ignored. Runs until interrupted.
+    """
+    signature = None
+    last_code = None
+    while True:
+        try:
+            st = os.stat(path)
+            current = (st.st_mtime_ns, st.st_size)
+            if current != signature:
+                signature = current
+                with open(path) as f:
+                    code = f.read()
+                if code != last_code:
+                    last_code = code
+                    yield code
+        except FileNotFoundError:
+            # Editors that save by rename briefly remove the file
+            signature = None
+        time.sleep(interval)
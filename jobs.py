@@ -0,0 +1,279 @@
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from ast_parser import parse_code
+from dot_render import iter_dot_chunks
+from layout import LAYOUT_FORMATS, adaptive_layout, merge_options
+from profiling import Profiler, Stage
+from render_cache import config_hash
+
+JOB_FORMATS = {'dot': 'text/plain; charset=utf-8', **{fmt: LAYOUT_FORMATS[fmt] for fmt in ('svg', 'json', 'xdot', 'scene')}}
+TERMINAL_STATES = frozenset(('done', 'failed', 'cancelled'))
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class QueueFull(Exception):
+    """Raised by JobManager.submit when every worker is busy and the queue is at its limit."""
+
+
+class _ReportingStage(Stage):
+    """Stage that checks for cancellation on entry and reports start/finish to the job's event queue."""
+    __slots__ = ()
+
+    def __enter__(self) -> "_ReportingStage":
+        profiler = self._profiler
+        profiler.checkpoint()
+        profiler.events.put((profiler.job_id, 'stage', {'name': self.name}))
+        return super().__enter__()
+
+    def __exit__(self, *exc) -> None:
+        super().__exit__(*exc)
+        if exc[0] is None:
+            self._profiler.events.put((self._profiler.job_id, 'stage_done', {
+                'name': self.name, 'ms': round(self.seconds * 1000, 3), 'counts': dict(self.counts)}))
+
+
+class JobProfiler(Profiler):
+    """Profiler used inside job workers: every stage is reported back to the parent as it happens."""
+
+    def __init__(self, job_id: str, events, cancelled):
+        super().__init__()
+        self.job_id = job_id
+        self.events = events
+        self.cancelled = cancelled
+
+    def stage(self, name: str) -> Stage:
+        return _ReportingStage(self, name)
+
+    def checkpoint(self) -> None:
+        if self.job_id in self.cancelled:
+            raise JobCancelled()
+
+
+def run_render_job(job_id: str, path: str, fmt: str, options: dict, events, cancelled) -> bytes:
+    """Worker entry point: read, parse and render one file. Cancellation is checked between stages and DOT chunks."""
+    profiler = JobProfiler(job_id, events, cancelled)
+    with profiler.stage('read'):
+        with open(path) as f:
+            code = f.read()
+    ast_dict = parse_code(code, profiler)
+    if "error" in ast_dict:
+        raise ValueError(ast_dict["error"])
+    with profiler.stage('dot') as stage:
+        stats = {}
+        chunks = []
+        for chunk in iter_dot_chunks(ast_dict, stats=stats, **options):
+            profiler.checkpoint()
+            chunks.append(chunk)
+        stage.count(**stats)
+    dot_source = ''.join(chunks)
+    if fmt == 'dot':
+        return dot_source.encode('utf-8')
+    def render_dot(**extra) -> str:
+        return ''.join(iter_dot_chunks(ast_dict, **merge_options(options, extra))) if extra else dot_source
+    with profiler.stage('layout'):
+        return adaptive_layout(render_dot, fmt)[0]
+
+
+class Job:
+    """State of one render job as seen by the API; updated from the pool's callbacks and event thread."""
+
+    def __init__(self, job_id: str, key: Tuple, path: str, fmt: str, options: dict):
+        self.id = job_id
+        self.key = key
+        self.path = path
+        self.format = fmt
+        self.options = options
+        self.status = 'queued'
+        self.stage: Optional[str] = None
+        self.stages: List[dict] = []
+        self.error: Optional[str] = None
+        self.result: Optional[bytes] = None
+        self.cancel_requested = False
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        # Bumped on every change, so watchers can tell when to report again
+        self.version = 0
+        self.future: Optional[Future] = None
+
+    @property
+    def media_type(self) -> str:
+        return JOB_FORMATS[self.format]
+
+    def snapshot(self) -> dict:
+        return {
+            "id": self.id,
+            "file": os.path.basename(self.path),
+            "format": self.format,
+            "options": self.options,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": list(self.stages),
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "result_bytes": len(self.result) if self.result is not None else None,
+        }
+
+
+class JobManager:
+    """
+    Runs render jobs in a bounded process pool.
+    - At most max_workers jobs run at once and at most max_queued more wait; beyond that
+      submit() raises QueueFull so the API can answer 429.
+    - A job identical to one still queued or running (same content hash, format and options)
+      is not started again: the existing job is returned.
+    - Progress is reported per stage; cancel() stops queued jobs immediately and running ones
+      at their next stage or DOT chunk boundary.
+    - Finished jobs (and their results) are kept for polling, up to max_finished of them.
+    """
+    def __init__(self, max_workers: Optional[int] = None, max_queued: int = 32, max_finished: int = 256):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[Tuple, Job] = {}
+        self._finished: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._events = None
+        self._cancelled = None
+        self._event_thread: Optional[threading.Thread] = None
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def _start(self) -> None:
+        # The manager process carries progress events and cancellation flags between processes
+        self._manager = multiprocessing.Manager()
+        self._events = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._event_thread = threading.Thread(target=self._consume_events, name='job-events', daemon=True)
+        self._event_thread.start()
+
+    def submit(self, path: str, fmt: str, options: dict, digest: str) -> Tuple[Job, bool]:
+        """Start (or join) a render job; returns (job, deduplicated)."""
+        if fmt not in JOB_FORMATS:
+            raise ValueError(f"Unsupported job format: {fmt}")
+        key = (digest, fmt, config_hash(**options))
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None and not job.cancel_requested:
+                self.deduplicated += 1
+                return job, True
+            if len(self._active) >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                raise QueueFull(f"{len(self._active)} jobs queued or running")
+            if self._executor is None:
+                self._start()
+            job = Job(secrets.token_hex(8), key, path, fmt, options)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            job.future = self._executor.submit(run_render_job, job.id, path, fmt, options,
+                                               self._events, self._cancelled)
+        job.future.add_done_callback(lambda future, job=job: self._finish(job, future))
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in TERMINAL_STATES:
+            return job
+        with self._lock:
+            job.cancel_requested = True
+            job.version += 1
+            self._cancelled[job.id] = True
+        # Succeeds only while the job is still queued; running jobs stop at their next checkpoint
+        job.future.cancel()
+        return job
+
+    def _consume_events(self) -> None:
+        while True:
+            try:
+                event = self._events.get()
+            except (EOFError, OSError):  # manager shut down
+                return
+            if event is None:
+                return
+            job_id, kind, data = event
+            job = self._jobs.get(job_id)
+            if job is None or job.status in TERMINAL_STATES:
+                continue
+            with self._lock:
+                if kind == 'stage':
+                    if job.status == 'queued':
+                        job.status = 'running'
+                        job.started = time.time()
+                    job.stage = data['name']
+                else:
+                    job.stages.append(data)
+                job.version += 1
+
+    def _finish(self, job: Job, future: Future) -> None:
+        with self._lock:
+            if future.cancelled():
+                job.status = 'cancelled'
+            else:
+                error = future.exception()
+                if error is None:
+                    job.status = 'done'
+                    job.result = future.result()
+                elif isinstance(error, JobCancelled):
+                    job.status = 'cancelled'
+                else:
+                    job.status = 'failed'
+                    job.error = f"{type(error).__name__}: {error}"
+            job.stage = None
+            job.finished = time.time()
+            job.version += 1
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            self._finished[job.id] = job
+            while len(self._finished) > self.max_finished:
+                old_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(old_id, None)
+        try:
+            self._cancelled.pop(job.id, None)
+        except (EOFError, OSError):
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "max_workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "active": len(self._active),
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                **statuses,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            try:
+                self._events.put(None)
+            except (EOFError, OSError):
+                pass
+            self._manager.shutdown()
+            self._manager = None
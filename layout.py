@@ -0,0 +1,386 @@
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import graphviz
+
+try:  # Memory limits for layout subprocesses need the POSIX resource module
+    import resource
+except ImportError:
+    resource = None
+
+from render_cache import LRUCache
+from render_store import RenderStore
+
+LAYOUT_FORMATS = {
+    'svg': 'image/svg+xml',
+    'xdot': 'text/vnd.graphviz',
+    'json': 'application/json',
+    'png': 'image/png',
+    'scene': 'application/json',
+}
+
+# Graphs are laid out once into a positioned graph (xdot: the DOT source plus node positions,
+# edge splines and drawing operations); every other format is rendered from that by neato -n2,
+# which keeps the given positions instead of laying the graph out again
+POSITIONED_FORMAT = 'xdot'
+EXPORT_ENGINE = 'neato'
+EXPORT_ARGS = ('-n2',)
+# Client-ready JSON scene (see layout_scene), derived from Graphviz's json output
+SCENE_FORMAT = 'scene'
+
+
+# Hard limits for one Graphviz run; configurable per deployment
+LAYOUT_TIMEOUT = float(os.environ.get('CODEVIZ_LAYOUT_TIMEOUT', '30'))
+LAYOUT_MEMORY_MB = int(os.environ.get('CODEVIZ_LAYOUT_MEMORY_MB', '2048'))
+
+# Engine selection by graph size (nodes + edges): dot with clusters for small graphs, dot without
+# clusters up to FLAT_DOT_MAX_SIZE, sfdp beyond; the last resort is a node_budget overview
+DOT_MAX_SIZE = 4000
+FLAT_DOT_MAX_SIZE = 12000
+FALLBACK_NODE_BUDGET = 300
+
+# Layouts that hit a limit are remembered (per process) so later requests skip straight past them
+MAX_EXCEEDED_ENTRIES = 1024
+
+
+class LayoutLimitExceeded(Exception):
+    """A Graphviz run was stopped by the wall-clock or memory limit."""
+
+
+def _limit_memory(memory_mb: int) -> Callable[[], None]:
+    def apply() -> None:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return apply
+
+
+def run_layout(dot_source: str, fmt: str = 'svg', engine: str = 'dot', timeout: Optional[float] = LAYOUT_TIMEOUT,
+               memory_mb: Optional[int] = LAYOUT_MEMORY_MB, args: Tuple[str, ...] = ()) -> bytes:
+    """
+    Run a Graphviz layout engine over DOT source and return the rendered bytes.
+    The process is killed after timeout seconds and cannot allocate more than memory_mb;
+    either raises LayoutLimitExceeded. Other failures raise graphviz's own exceptions.
+    """
+    if fmt == SCENE_FORMAT:
+        return export_layout(run_layout(dot_source, POSITIONED_FORMAT, engine, timeout, memory_mb), fmt,
+                             timeout, memory_mb)
+    cmd = [engine, *args, f'-T{fmt}']
+    preexec = _limit_memory(memory_mb) if memory_mb and resource is not None else None
+    try:
+        proc = subprocess.run(cmd, input=dot_source.encode('utf-8'), capture_output=True,
+                              timeout=timeout, preexec_fn=preexec)
+    except FileNotFoundError:
+        raise graphviz.ExecutableNotFound(cmd)
+    except subprocess.TimeoutExpired:
+        raise LayoutLimitExceeded(f"{engine} took longer than {timeout:g}s")
+    if proc.returncode:
+        stderr = proc.stderr.decode('utf-8', 'replace')
+        # Graphviz reports failed allocations ("out of memory", "agalloc: ...") or dies of a signal
+        if preexec is not None and (proc.returncode < 0 or 'memory' in stderr.lower() or 'alloc' in stderr):
+            raise LayoutLimitExceeded(f"{engine} ran out of memory (limit {memory_mb} MB)")
+        raise graphviz.CalledProcessError(proc.returncode, cmd, output=proc.stdout, stderr=stderr)
+    return proc.stdout
+
+
+def export_layout(positioned: bytes, fmt: str = 'svg', timeout: Optional[float] = LAYOUT_TIMEOUT,
+                  memory_mb: Optional[int] = LAYOUT_MEMORY_MB) -> bytes:
+    """Render a positioned graph (POSITIONED_FORMAT output) to fmt without laying it out again."""
+    if fmt == POSITIONED_FORMAT:
+        return positioned
+    graphviz_fmt = 'json' if fmt == SCENE_FORMAT else fmt
+    output = run_layout(positioned.decode('utf-8'), graphviz_fmt, EXPORT_ENGINE, timeout, memory_mb, EXPORT_ARGS)
+    if fmt == SCENE_FORMAT:
+        return json.dumps(layout_scene(json.loads(output)), separators=(',', ':')).encode('utf-8')
+    return output
+
+
+def _flip_ops(ops: List[dict], flip: Callable[[float], float]) -> List[dict]:
+    flipped = []
+    for op in ops:
+        op = dict(op)
+        if 'points' in op:
+            op['points'] = [[x, flip(y)] for x, y in op['points']]
+        if 'pt' in op:
+            op['pt'] = [op['pt'][0], flip(op['pt'][1])]
+        if 'rect' in op:  # ellipses: centre and radii; images: corner and size
+            x, y, w, h = op['rect']
+            op['rect'] = [x, flip(y) - (h if op['op'] == 'I' else 0), w, h]
+        flipped.append(op)
+    return flipped
+
+
+def layout_scene(graph: dict) -> dict:
+    """
+    Client-ready scene from Graphviz's json output: the drawing size plus, for the graph,
+    each cluster, node and edge, its name (tail/head for edges) and its xdot drawing operations
+    (shapes, then labels) as Graphviz emits them, with y flipped to a top-left origin. Drawing
+    the operations in order reproduces the SVG output without any layout on the client.
+    """
+    x0, y0, x1, y1 = (float(v) for v in graph['bb'].split(','))
+
+    def flip(y: float) -> float:
+        return y0 + y1 - y
+
+    def draw(obj: dict, *keys: str) -> List[dict]:
+        return _flip_ops([op for key in keys for op in obj.get(key, ())], flip)
+
+    clusters, nodes = [], []
+    names = {}
+    # Subgraphs come first in objects and have a bounding box; edges refer to nodes by _gvid
+    for obj in graph.get('objects', []):
+        if 'bb' in obj:
+            if obj.get('_draw_') or obj.get('_ldraw_'):
+                clusters.append({"name": obj['name'], "draw": draw(obj, '_draw_', '_ldraw_')})
+        else:
+            names[obj['_gvid']] = obj['name']
+            nodes.append({"name": obj['name'], "draw": draw(obj, '_draw_', '_ldraw_')})
+    edges = [{"tail": names.get(edge['tail']), "head": names.get(edge['head']),
+              "draw": draw(edge, '_draw_', '_tdraw_', '_hdraw_', '_ldraw_', '_tldraw_', '_hldraw_')}
+             for edge in graph.get('edges', [])]
+    return {"width": x1 - x0, "height": y1 - y0, "origin": [x0, y0],
+            "graph": draw(graph, '_draw_', '_ldraw_'), "clusters": clusters, "nodes": nodes, "edges": edges}
+
+
+def graph_size(dot_source: str) -> Tuple[int, int, int]:
+    """Approximate (nodes, edges, clusters) of DOT text written by dot_render, counted without parsing it."""
+    edges = dot_source.count(' -> ')
+    clusters = dot_source.count('subgraph ')
+    # Node and edge statements both end in an attribute list; the three default-attribute lines do too
+    nodes = max(dot_source.count(']\n') - edges - 3, 0)
+    return nodes, edges, clusters
+
+
+def layout_plan(nodes: int, edges: int) -> List[Tuple[str, dict]]:
+    """
+    The (engine, extra render options) to try in order for a graph of this size; each step is
+    cheaper than the one before and the last (a node_budget overview) always fits the limits.
+    """
+    size = nodes + edges
+    plan = []
+    if size <= DOT_MAX_SIZE:
+        plan.append(('dot', {}))
+    if size <= FLAT_DOT_MAX_SIZE:
+        plan.append(('dot', {'clusters': False}))
+    plan.append(('sfdp', {'clusters': False}))
+    plan.append(('dot', {'node_budget': FALLBACK_NODE_BUDGET}))
+    return plan
+
+
+def merge_options(options: dict, extra: dict) -> dict:
+    """Render options with a fallback step's extra options applied; the smaller node_budget wins."""
+    merged = {**options, **extra}
+    if 'node_budget' in options and 'node_budget' in extra:
+        merged['node_budget'] = min(options['node_budget'], extra['node_budget'])
+    return merged
+
+
+def adaptive_layout(render_dot: Callable[..., str], fmt: str = 'svg',
+                    run: Callable[[str, str, str], bytes] = run_layout) -> Tuple[bytes, List[str]]:
+    """
+    Lay out a graph with the engine its size calls for, degrading to cheaper variants when a
+    layout hits its limits. render_dot(**extra) returns the DOT source with extra render options
+    added (none for the graph as requested); run(dot_source, fmt, engine) does one layout.
+    Returns (rendered bytes, the steps taken, e.g. ['dot: took longer than 30s', 'sfdp flat']).
+    """
+    variants = {(): render_dot()}
+    nodes, edges, _ = graph_size(variants[()])
+    steps = []
+    plan = layout_plan(nodes, edges)
+    for engine, extra in plan:
+        label = ' '.join([engine] + (['flat'] if extra.get('clusters') is False else [])
+                         + ([f"budget={extra['node_budget']}"] if 'node_budget' in extra else []))
+        variant = tuple(sorted(extra.items()))
+        if variant not in variants:
+            variants[variant] = render_dot(**extra)
+        try:
+            result = run(variants[variant], fmt, engine)
+        except LayoutLimitExceeded as e:
+            steps.append(f"{label}: {e}")
+            if (engine, extra) == plan[-1]:
+                raise
+            continue
+        steps.append(label)
+        return result, steps
+
+
+def dot_hash(dot_source: str) -> str:
+    return hashlib.sha256(dot_source.encode('utf-8')).hexdigest()
+
+
+def store_key(digest: str, fmt: str, engine: str = 'dot') -> str:
+    """
+    RenderStore key of the layout by engine of the DOT source with hash digest. LayoutPool and
+    layout_once both store layouts under it, so either reuses layouts the other made.
+    """
+    return RenderStore.key('layout', digest, format=fmt, engine=engine)
+
+
+def plan_key(digest: str, timeout: Optional[float] = LAYOUT_TIMEOUT, memory_mb: Optional[int] = LAYOUT_MEMORY_MB) -> str:
+    """
+    RenderStore key of the outcome of adaptive_layout for the DOT source with hash digest: which
+    variant and engine fitted the limits. The outcome depends on the limits, so they are part of it.
+    """
+    return RenderStore.key('layout-plan', digest, timeout=timeout, memory_mb=memory_mb)
+
+
+def layout_once(render_dot: Callable[..., str], formats: List[str], store=None) -> Tuple[Dict[str, bytes], List[str]]:
+    """
+    Render the graph from render_dot (see adaptive_layout) to several formats with one layout:
+    the positioned graph is laid out adaptively, then each format is exported from it. With a
+    store, the variant and engine adaptive_layout settled on are recorded under plan_key, and
+    the positioned graph and outputs under store_key of that variant and engine.
+    Returns ({format: bytes}, the layout steps taken; empty when nothing had to be laid out).
+    """
+    digest = dot_hash(render_dot())
+    outputs: Dict[str, Optional[bytes]] = {fmt: None for fmt in formats}
+    positioned = None
+    planned = store.get(plan_key(digest)) if store is not None else None
+    if planned is not None:
+        variant_digest, engine = json.loads(planned)
+        outputs = {fmt: store.get(store_key(variant_digest, fmt, engine)) for fmt in formats}
+        if None in outputs.values():
+            positioned = store.get(store_key(variant_digest, POSITIONED_FORMAT, engine))
+    steps: List[str] = []
+    if None not in outputs.values():
+        return outputs, steps
+    if positioned is None:
+        laid_out = []
+
+        def run(dot_source: str, fmt: str, engine: str) -> bytes:
+            result = run_layout(dot_source, fmt, engine)
+            laid_out.append((dot_hash(dot_source), engine))
+            return result
+        positioned, steps = adaptive_layout(render_dot, POSITIONED_FORMAT, run)
+        variant_digest, engine = laid_out[-1]
+        if store is not None:
+            store.put(store_key(variant_digest, POSITIONED_FORMAT, engine), positioned)
+            store.put(plan_key(digest), json.dumps([variant_digest, engine]).encode('utf-8'))
+    for fmt, output in outputs.items():
+        if output is None:
+            outputs[fmt] = export_layout(positioned, fmt)
+            if store is not None:
+                store.put(store_key(variant_digest, fmt, engine), outputs[fmt])
+    return outputs, steps
+
+
+class LayoutPool:
+    """
+    Runs Graphviz layouts in a bounded pool of worker processes.
+    - Results are cached by (DOT hash, format, engine), so each unique graph is laid out once;
+      every format is exported from that one positioned graph (see export_layout).
+    - Concurrent requests for a graph that is already being laid out share the same job.
+    - With a store (render_store.RenderStore), layouts are also looked up in and written to
+      the on-disk store shared with other processes and the CLI.
+    - Every run is bounded by timeout/memory_mb (see run_layout); graphs that exceeded them
+      fail fast with LayoutLimitExceeded afterwards instead of being tried again.
+    """
+    def __init__(self, max_workers: Optional[int] = None, cache: Optional[LRUCache] = None, store=None,
+                 timeout: Optional[float] = LAYOUT_TIMEOUT, memory_mb: Optional[int] = LAYOUT_MEMORY_MB):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.cache = cache if cache is not None else LRUCache(max_entries=256, max_bytes=256 * 1024 * 1024)
+        self.store = store
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[Tuple[str, str, str], Future] = {}
+        self._exceeded: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.limits_exceeded = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, dot_source: str, fmt: str = 'svg', engine: str = 'dot') -> Future:
+        """
+        Return a future for the rendered bytes, reusing cached or in-flight results.
+        Only the positioned graph is laid out; other formats are exported from it.
+        """
+        if fmt not in LAYOUT_FORMATS:
+            raise ValueError(f"Unsupported layout format: {fmt}")
+        key = (dot_hash(dot_source), fmt, engine)
+        cached = self.cache.get(key)
+        if cached is None and self.store is not None:
+            cached = self.store.get(store_key(*key))
+            if cached is not None:
+                self.cache.put(key, cached, len(cached))
+        if cached is not None:
+            done: Future = Future()
+            done.set_result(cached)
+            return done
+        with self._lock:
+            reason = self._exceeded.get(key)
+            if reason is not None:
+                failed: Future = Future()
+                failed.set_exception(LayoutLimitExceeded(reason))
+                return failed
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            if fmt == POSITIONED_FORMAT:
+                future = self._get_executor().submit(run_layout, dot_source, fmt, engine, self.timeout, self.memory_mb)
+            else:
+                future = Future()
+            self._pending[key] = future
+        future.add_done_callback(lambda f, key=key: self._finish(key, f))
+        if fmt != POSITIONED_FORMAT:
+            positioned = self.submit(dot_source, POSITIONED_FORMAT, engine)
+            positioned.add_done_callback(lambda p: self._export(p, fmt, future))
+        return future
+
+    def _export(self, positioned: Future, fmt: str, future: Future) -> None:
+        """Once the positioned graph is ready, render it to fmt in the pool and settle future with that."""
+        if future.cancelled():
+            return
+        if positioned.cancelled() or positioned.exception() is not None:
+            future.set_exception(positioned.exception() if not positioned.cancelled() else
+                                 LayoutLimitExceeded("layout was cancelled"))
+            return
+        try:
+            export = self._get_executor().submit(export_layout, positioned.result(), fmt, self.timeout, self.memory_mb)
+        except RuntimeError as e:  # the pool is shutting down
+            future.set_exception(e)
+            return
+
+        def settle(done: Future) -> None:
+            if future.cancelled():
+                return
+            if done.cancelled():
+                future.cancel()
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(done.result())
+        export.add_done_callback(settle)
+
+    def _finish(self, key: Tuple[str, str, str], future: Future) -> None:
+        # Cache before dropping the pending entry so no request falls between the two
+        if not future.cancelled() and future.exception() is None:
+            result = future.result()
+            self.cache.put(key, result, len(result))
+            if self.store is not None:
+                self.store.put(store_key(*key), result)
+        with self._lock:
+            if not future.cancelled() and isinstance(future.exception(), LayoutLimitExceeded):
+                self.limits_exceeded += 1
+                self._exceeded[key] = str(future.exception())
+                while len(self._exceeded) > MAX_EXCEEDED_ENTRIES:
+                    self._exceeded.popitem(last=False)
+            self._pending.pop(key, None)
+
+    def render(self, dot_source: str, fmt: str = 'svg', engine: str = 'dot',
+               timeout: Optional[float] = None) -> bytes:
+        """Blocking wrapper around submit()."""
+        return self.submit(dot_source, fmt, engine).result(timeout)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,284 @@
+import re
+from collections import defaultdict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from incremental import IncrementalRenderer
+from profiling import NULL_PROFILER, Profiler
+
+# Element keys: ('node', id), ('edge', tail, head) or ('cluster', name)
+ElementKey = Tuple[str, ...]
+Element = Dict[str, object]
+
+KIND_GROUPS = {'cluster': 'clusters', 'node': 'nodes', 'edge': 'edges'}
+
+# Node IDs and cluster names of a top-level statement start with its index: "n.body.3...",
+# "cluster_functiondef_n.body.3..."
+TOP_LEVEL_ID = re.compile(r'^((?:cluster_[a-z]+_)?n\.body\.)(\d+)(?=\.|$)')
+
+# A cluster's attribute statement (`label=... style=filled`), as opposed to a node or edge statement
+ATTR_STATEMENT = re.compile(r'\w+=')
+
+
+def _read_id(text: str, at: int) -> Tuple[str, int]:
+    """Read a (possibly quoted) DOT ID starting at text[at]; returns (ID, index after it)."""
+    if text[at] == '"':
+        end = at + 1
+        while text[end] != '"':
+            end += 2 if text[end] == '\\' else 1
+        return text[at + 1:end].replace('\\"', '"'), end + 1
+    end = at
+    while end < len(text) and text[end] not in ' ]':
+        end += 1
+    return text[at:end], end
+
+
+def parse_attrs(text: str) -> Dict[str, str]:
+    """Parse the `key=value key=value` attribute list written by graphviz.quoting (HTML labels kept as <...>)."""
+    attrs = {}
+    at = 0
+    while at < len(text):
+        if text[at] in ' []':
+            at += 1
+            continue
+        equals = text.index('=', at)
+        key = text[at:equals]
+        at = equals + 1
+        if text[at] == '<':
+            # HTML-like value: up to the matching '>' (labels may hold unescaped markup such as "a<b>")
+            depth, end = 0, at
+            while end < len(text):
+                depth += {'<': 1, '>': -1}.get(text[end], 0)
+                end += 1
+                if depth == 0:
+                    break
+            attrs[key] = text[at:end]
+            at = end
+        else:
+            attrs[key], at = _read_id(text, at)
+    return attrs
+
+
+def iter_statements(text: str) -> Iterator[str]:
+    """
+    Split DOT text written by dot_render into statements. A statement ends at a newline outside
+    quoted IDs and HTML-like values, so a label that spans lines stays in one statement.
+    """
+    start = depth = 0
+    quoted = False
+    at = 0
+    while at < len(text):
+        char = text[at]
+        if quoted:
+            if char == '\\':
+                at += 1
+            elif char == '"':
+                quoted = False
+        elif depth == 0 and char == '"':
+            quoted = True
+        elif char == '<':
+            depth += 1
+        elif char == '>' and depth:
+            depth -= 1
+        elif char == '\n' and depth == 0:
+            yield text[start:at]
+            start = at + 1
+        at += 1
+    if start < len(text):
+        yield text[start:]
+
+
+def fragment_elements(text: str, cluster: Optional[str] = None) -> Dict[ElementKey, Element]:
+    """
+    Nodes, edges and clusters of a DOT fragment written by dot_render, each with its attributes
+    and the cluster it is drawn in (cluster is the one the fragment itself sits in).
+    """
+    elements: Dict[ElementKey, Element] = {}
+    clusters: List[Optional[str]] = [cluster]
+    for line in iter_statements(text):
+        line = line.strip()
+        if not line:
+            continue
+        if line == '}':
+            clusters.pop()
+        elif line.startswith('subgraph '):
+            name, _ = _read_id(line, len('subgraph '))
+            elements[('cluster', name)] = {"id": name, "cluster": clusters[-1], "attrs": {}}
+            clusters.append(name)
+        elif line[0] == '"' or not ATTR_STATEMENT.match(line):
+            first, at = _read_id(line, 0)
+            if line.startswith(' -> ', at):
+                second, at = _read_id(line, at + len(' -> '))
+                elements[('edge', first, second)] = {"tail": first, "head": second, "cluster": clusters[-1],
+                                                    "attrs": parse_attrs(line[at:])}
+            else:
+                elements[('node', first)] = {"id": first, "cluster": clusters[-1], "attrs": parse_attrs(line[at:])}
+        else:
+            # Attribute statement of the enclosing cluster
+            elements[('cluster', clusters[-1])]["attrs"] = parse_attrs(line)
+    return elements
+
+
+def rename_top_level(name: str, renames: Dict[int, int]) -> str:
+    """name with its top-level statement index replaced according to renames."""
+    match = TOP_LEVEL_ID.match(name)
+    if match is None or int(match.group(2)) not in renames:
+        return name
+    return f"{match.group(1)}{renames[int(match.group(2))]}{name[match.end():]}"
+
+
+def _renamed(elements: Dict[ElementKey, Element], renames: Dict[int, int]) -> Dict[ElementKey, Element]:
+    result = {}
+    for key, element in elements.items():
+        key = (key[0],) + tuple(rename_top_level(part, renames) for part in key[1:])
+        element = dict(element)
+        for field in ('id', 'tail', 'head', 'cluster'):
+            if element.get(field) is not None:
+                element[field] = rename_top_level(element[field], renames)
+        result[key] = element
+    return result
+
+
+class GraphDelta:
+    """Element changes between two renders, applied by clients in order: remove, rename, update, add."""
+    __slots__ = ('removed', 'renames', 'updated', 'added')
+
+    def __init__(self):
+        self.removed: List[ElementKey] = []
+        self.renames: Dict[int, int] = {}
+        self.updated: List[Tuple[ElementKey, Element]] = []
+        self.added: List[Tuple[ElementKey, Element]] = []
+
+    def compare(self, old: Dict[ElementKey, Element], new: Dict[ElementKey, Element]) -> None:
+        for key in old:
+            if key not in new:
+                self.removed.append(key)
+        for key, element in new.items():
+            previous = old.get(key)
+            if previous is None:
+                self.added.append((key, element))
+            elif previous != element:
+                self.updated.append((key, element))
+
+    def __bool__(self) -> bool:
+        return bool(self.removed or self.renames or self.updated or self.added)
+
+    def as_message(self) -> dict:
+        """JSON message: elements grouped by kind; removed edges as [tail, head] pairs."""
+        def group(entries):
+            grouped = {name: [] for name in KIND_GROUPS.values()}
+            for key, element in entries:
+                grouped[KIND_GROUPS[key[0]]].append(element)
+            return grouped
+        removed = {name: [] for name in KIND_GROUPS.values()}
+        for key in self.removed:
+            removed[KIND_GROUPS[key[0]]].append(list(key[1:]) if key[0] == 'edge' else key[1])
+        return {
+            "remove": removed,
+            "renames": {str(old): new for old, new in self.renames.items()},
+            "update": group(self.updated),
+            "add": group(self.added),
+        }
+
+
+class LiveSession:
+    """
+    Renders successive versions of one module for a live editor and reports what changed.
+    - Rendering goes through IncrementalRenderer, so only edited top-level statements are walked.
+    - Each statement's DOT fragment is parsed into elements keyed by their path-based IDs, and
+      statements are matched across versions: unchanged fragments are skipped, statements that
+      only moved become one rename of their top-level index (plus label updates for shifted
+      line numbers), and an edited statement is diffed element by element against whatever
+      was at the same index before.
+    The first render (and any after reset()) returns the full DOT source instead of a delta.
+    """
+    def __init__(self, name: str = 'ast'):
+        self.renderer = IncrementalRenderer(name, legend_mode='none')
+        self.dot_source: Optional[str] = None
+        # (statement key, index, DOT text) of the current render, and the parsed elements per text
+        self._fragments: List[Tuple[tuple, int, str]] = []
+        self._elements: Dict[str, Dict[ElementKey, Element]] = {}
+
+    def reset(self) -> None:
+        """Make the next update return a full snapshot again."""
+        self.dot_source = None
+
+    def snapshot(self) -> dict:
+        """All current elements grouped by kind (as in GraphDelta.as_message), for a client's initial model."""
+        grouped = {name: [] for name in KIND_GROUPS.values()}
+        for _, _, text in self._fragments:
+            for key, element in self._elements[text].items():
+                grouped[KIND_GROUPS[key[0]]].append(element)
+        return {"cluster": self.renderer.module_cluster, **grouped}
+
+    def _elements_of(self, text: str, cache: Dict[str, Dict[ElementKey, Element]]) -> Dict[ElementKey, Element]:
+        elements = cache.get(text)
+        if elements is None:
+            elements = self._elements.get(text)
+            if elements is None:
+                elements = fragment_elements(text, self.renderer.module_cluster)
+            cache[text] = elements
+        return elements
+
+    def update(self, code: str, profiler: Profiler = NULL_PROFILER) -> Tuple[str, Optional[GraphDelta]]:
+        """
+        Render code and return (DOT source, delta from the previous render); the delta is None
+        when the caller needs the full DOT. A SyntaxError propagates and keeps the previous state;
+        after any other error the session is reset, so the next update is a full snapshot.
+        """
+        try:
+            return self._update(code, profiler)
+        except SyntaxError:
+            raise
+        except BaseException:
+            self.reset()
+            raise
+
+    def _update(self, code: str, profiler: Profiler) -> Tuple[str, Optional[GraphDelta]]:
+        snapshot = self.dot_source is None
+        dot_source = self.renderer.render(code, profiler)
+        fragments = self.renderer.fragments
+        elements: Dict[str, Dict[ElementKey, Element]] = {}
+        delta = None
+        with profiler.stage('delta') as stage:
+            if snapshot:
+                for _, _, text in fragments:
+                    self._elements_of(text, elements)
+            else:
+                delta = self._diff(fragments, elements)
+                stage.count(removed=len(delta.removed), renamed=len(delta.renames),
+                            updated=len(delta.updated), added=len(delta.added))
+        self.dot_source = dot_source
+        self._fragments = fragments
+        self._elements = elements
+        return dot_source, delta
+
+    def _diff(self, fragments: List[Tuple[tuple, int, str]],
+              elements: Dict[str, Dict[ElementKey, Element]]) -> GraphDelta:
+        delta = GraphDelta()
+        old_by_key: Dict[tuple, deque] = defaultdict(deque)
+        for key, index, text in self._fragments:
+            old_by_key[key].append((index, text))
+        moved = []
+        unmatched_new = []
+        for key, index, text in fragments:
+            if not old_by_key[key]:
+                unmatched_new.append((index, text))
+                continue
+            old_index, old_text = old_by_key[key].popleft()
+            if old_text == text:
+                self._elements_of(text, elements)
+                continue
+            if old_index != index:
+                delta.renames[old_index] = index
+            moved.append((old_text, text))
+        unmatched_old = {index: text for entries in old_by_key.values() for index, text in entries}
+        # Edited statements are compared with whatever was at their index; neither side is renamed
+        for index, text in unmatched_new:
+            old_text = unmatched_old.pop(index, None)
+            delta.compare(self._elements[old_text] if old_text is not None else {}, self._elements_of(text, elements))
+        # Same source as before, so only IDs and line numbers in labels can differ
+        for old_text, text in moved:
+            delta.compare(_renamed(self._elements[old_text], delta.renames), self._elements_of(text, elements))
+        for text in unmatched_old.values():
+            delta.compare(self._elements[text], {})
+        return delta
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import re
+from typing import Iterator, List, Optional, Sequence
+
+from graphviz.quoting import quote
+
+from ast_paths import join_path, path_node_id
+from detail import collapse_tree, node_key, subtree_sizes
+from dot_render import DotEmitter, _node_line, format_label_for_summary, get_node_color, iter_dot
+
+# Top-level statements that always get a page of their own
+PAGE_NODE_TYPES = {'FunctionDef', 'AsyncFunctionDef', 'ClassDef'}
+
+# Other top-level statements (a main loop, a large `if __name__ == ...` block) get a page once
+# their subtree has this many nodes; smaller ones are drawn in full on the overview page
+PAGE_MIN_NODES = int(os.environ.get('CODEVIZ_PAGE_MIN_NODES', '60'))
+
+OVERVIEW_PAGE = 'overview'
+
+# Module-level statements on the overview page are drawn this many levels deep (see detail.collapse_tree)
+OVERVIEW_MAX_DEPTH = 1
+
+# A statement page is drawn as if its statement were the first of a module, so its node IDs start
+# with "n.body.0" wherever the statement is; the ID in the full graph has "n." + page.path in place
+# of that prefix (see ast_paths.child_node_id)
+PAGE_ROOT_PATH = join_path('', 'body', 0)
+
+
+class Page:
+    """One independently laid-out graph of a paginated module: a top-level statement, or the overview."""
+    __slots__ = ('name', 'title', 'node_type', 'path', 'lineno', 'end_lineno', 'nodes', 'dot_source', 'digest')
+
+    def __init__(self, name: str, title: str, node_type: str, path: str, lineno: Optional[int],
+                 end_lineno: Optional[int], nodes: int, dot_source: str):
+        self.name = name
+        self.title = title
+        self.node_type = node_type
+        self.path = path
+        self.lineno = lineno
+        self.end_lineno = end_lineno
+        self.nodes = nodes
+        self.dot_source = dot_source
+        # Same digest as layout.dot_hash: pages whose digest is unchanged need no new layout
+        self.digest = hashlib.sha256(dot_source.encode('utf-8')).hexdigest()
+
+    def as_dict(self) -> dict:
+        return {"name": self.name, "title": self.title, "type": self.node_type, "path": self.path,
+                "lines": [self.lineno, self.end_lineno], "nodes": self.nodes, "hash": self.digest}
+
+
+def first_line(stmt) -> Optional[int]:
+    """First source line of a statement, including its decorators."""
+    lines = [node.get('lineno') for node in (stmt, *(stmt.get('decorator_list') or ()))]
+    return min((line for line in lines if line), default=None)
+
+
+def page_title(node) -> str:
+    return node.get('name') or f"{node['type']} at line {node.get('lineno')}"
+
+
+def _page_name(node, used: set) -> str:
+    """File-safe page name from the definition's name; other statements use their type ("while", "while_2")."""
+    base = re.sub(r'[^\w.-]', '_', node.get('name') or node['type'].lower())
+    name = base
+    suffix = 1
+    while name in used:  # Redefinitions keep the first name; later ones are numbered
+        suffix += 1
+        name = f"{base}_{suffix}"
+    used.add(name)
+    return name
+
+
+def iter_overview_dot(ast_dict, pages: Sequence[Page], name: str = 'ast', link: Optional[str] = None,
+                      clusters: bool = True) -> Iterator[str]:
+    """
+    Yield the overview page: the module with every paged statement drawn as one summary node
+    (linked to its page when a link template such as "{name}.svg" is given) and the remaining
+    module-level statements drawn OVERVIEW_MAX_DEPTH levels deep.
+    """
+    emitter = DotEmitter(name, clusters=clusters)
+    by_path = {page.path: page for page in pages}
+    yield f"digraph {quote(name)} {{\n"
+    yield from emitter.iter_head()
+    depth = 0
+    closing = None
+    if clusters:
+        _, opening, closing = emitter.cluster_lines(ast_dict, '', 0)
+        yield from opening
+        depth = 1
+    for i, stmt in enumerate(ast_dict.get('body') or ()):
+        path = join_path('', 'body', i)
+        page = by_path.get(path)
+        if page is None:
+            yield from emitter.iter_nodes(collapse_tree(stmt, OVERVIEW_MAX_DEPTH), depth, path)
+            continue
+        summary = {'type': page.node_type, 'name': stmt.get('name', ''), 'lineno': page.lineno,
+                   'end_lineno': page.end_lineno, 'collapsed': page.nodes - 1}
+        attrs = {'tooltip': f"{page.title} ({page.nodes} nodes)"}
+        if link:
+            attrs['href'] = link.format(name=page.name)
+        emitter.node_count += 1
+        yield _node_line(depth, path_node_id(path), label=format_label_for_summary(summary),
+                         style='filled,dashed', fillcolor=get_node_color(page.node_type), **attrs)
+    if closing:
+        yield closing
+    yield from emitter.iter_tail()
+    yield "}\n"
+
+
+def split_pages(ast_dict, name: str = 'ast', link: Optional[str] = None, min_nodes: int = PAGE_MIN_NODES,
+                **options) -> List[Page]:
+    """
+    Split a module into pages: the overview first, then one page per top-level definition (and
+    per statement of at least min_nodes nodes), each a complete graph of its own.
+    - Page names come from the definitions, so they stay put while the module is edited.
+    - A statement page's node IDs and line numbers are relative to the page (PAGE_ROOT_PATH;
+      line 1 is the page's first line, Page.lineno), so its DOT only changes when its statement
+      does, not when code above it is edited, and its digest tells which pages need a new
+      layout. The overview shows where each statement is, so it changes with any such edit.
+    options are passed to iter_dot for the statement pages (max_depth, node_budget, clusters).
+    """
+    sizes = subtree_sizes(ast_dict)
+    used = {OVERVIEW_PAGE}
+    pages = []
+    for i, stmt in enumerate(ast_dict.get('body') or ()):
+        nodes = sizes[node_key(stmt)]
+        if stmt['type'] not in PAGE_NODE_TYPES and nodes < min_nodes:
+            continue
+        path = join_path('', 'body', i)
+        start = first_line(stmt)
+        dot_source = ''.join(iter_dot({'type': 'Module', 'body': [stmt]}, name=name, root_path=PAGE_ROOT_PATH,
+                                      legend_mode='none', line_offset=start - 1 if start else 0, **options))
+        pages.append(Page(_page_name(stmt, used), page_title(stmt), stmt['type'], path, start,
+                          stmt.get('end_lineno'), nodes, dot_source))
+    overview = ''.join(iter_overview_dot(ast_dict, pages, name, link, options.get('clusters', True)))
+    body = ast_dict.get('body') or ()
+    overview_page = Page(OVERVIEW_PAGE, 'Module overview', 'Module', '', body[0].get('lineno') if body else None,
+                         body[-1].get('end_lineno') if body else None, sizes[node_key(ast_dict)], overview)
+    return [overview_page] + pages
@@ -0,0 +1,174 @@
+import bisect
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+# Upper bounds (milliseconds) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# tracemalloc's peak is one counter for the whole process, so stages that trace memory run one
+# at a time (reentrant: a stage may open another in the same thread)
+_MEMORY_LOCK = threading.RLock()
+
+
+class Stage:
+    """Timing record for one pipeline stage; also usable as the context manager that measures it."""
+    __slots__ = ('name', 'seconds', 'peak_bytes', 'counts', '_profiler', '_start', '_mem_start')
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.peak_bytes: Optional[int] = None
+        self.counts: Dict[str, int] = {}
+        self._profiler = profiler
+        self._start = 0.0
+        self._mem_start = 0
+
+    def count(self, **counts: int) -> None:
+        """Attach counts (e.g. nodes=..., edges=...) to this stage."""
+        self.counts.update(counts)
+
+    def __enter__(self) -> "Stage":
+        if self._profiler.trace_memory:
+            _MEMORY_LOCK.acquire()
+            tracemalloc.reset_peak()
+            self._mem_start = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.seconds = time.perf_counter() - self._start
+        if self._profiler.trace_memory:
+            # Peak allocated on top of what was already live when the stage started
+            self.peak_bytes = tracemalloc.get_traced_memory()[1] - self._mem_start
+            _MEMORY_LOCK.release()
+        self._profiler.stages.append(self)
+
+
+class _NullStage:
+    """Shared do-nothing stage returned by NullProfiler."""
+    __slots__ = ()
+
+    def count(self, **counts: int) -> None:
+        pass
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """
+    Collects per-stage wall time, node/edge counts and (optionally) peak allocations
+    for one run of the parse -> dict -> DOT -> layout pipeline.
+    With trace_memory, stages of all profilers in the process run one at a time (_MEMORY_LOCK),
+    since each resets tracemalloc's process-wide peak; that serialises concurrent requests.
+    """
+    enabled = True
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: List[Stage] = []
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name: str) -> Stage:
+        return Stage(self, name)
+
+    def server_timing(self) -> str:
+        """Format the stages as a Server-Timing header value."""
+        return ', '.join(f"{s.name};dur={s.seconds * 1000:.2f}" for s in self.stages)
+
+    def report(self) -> str:
+        """Format the stages as a small human-readable table."""
+        lines = [f"{'stage':<12} {'time (ms)':>10} {'peak mem':>12}  counts"]
+        for s in self.stages:
+            peak = f"{s.peak_bytes / 1024:.0f} KiB" if s.peak_bytes is not None else '-'
+            counts = ' '.join(f"{k}={v}" for k, v in s.counts.items())
+            lines.append(f"{s.name:<12} {s.seconds * 1000:>10.2f} {peak:>12}  {counts}")
+        total = sum(s.seconds for s in self.stages)
+        lines.append(f"{'total':<12} {total * 1000:>10.2f}")
+        return '\n'.join(lines)
+
+
+class NullProfiler(Profiler):
+    """Profiler used when instrumentation is disabled: every call is a no-op."""
+    enabled = False
+
+    def __init__(self):
+        self.trace_memory = False
+        self.stages = []
+
+    def stage(self, name: str) -> _NullStage:
+        return _NULL_STAGE
+
+    def server_timing(self) -> str:
+        return ''
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageHistogram:
+    __slots__ = ('buckets', 'count', 'total_ms', 'max_ms', 'counts')
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.counts: Dict[str, int] = {}
+
+    def observe(self, stage: Stage) -> None:
+        ms = stage.seconds * 1000
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        for key, value in stage.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def as_dict(self) -> dict:
+        bounds = [f"le_{b}" for b in HISTOGRAM_BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(bounds, self.buckets)),
+            "counts": dict(self.counts),
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe aggregation of profiled runs into per-stage latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageHistogram] = {}
+        self.runs = 0
+
+    def observe(self, profiler: Profiler) -> None:
+        if not profiler.enabled:
+            return
+        with self._lock:
+            self.runs += 1
+            for stage in profiler.stages:
+                histogram = self._stages.get(stage.name)
+                if histogram is None:
+                    histogram = self._stages[stage.name] = StageHistogram()
+                histogram.observe(stage)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "bucket_bounds_ms": list(HISTOGRAM_BUCKETS_MS),
+                "stages": {name: h.as_dict() for name, h in self._stages.items()},
+            }
@@ -0,0 +1,365 @@
+import ast
+import hashlib
+import html
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from batch import collect_inputs
+from dot_render import _attr_line, _edge_line, _graph_attr_line, _node_line, _subgraph_head, _subgraph_tail
+from dot_render import DEFAULT_EDGE_ATTRS, NODE_DEFAULTS, get_node_color
+from graphviz.quoting import quote
+from render_cache import source_hash
+from render_store import cache_dir
+
+INDEX_NAME = 'project-index.sqlite'
+# Bump when the summary format changes; older indexes are rebuilt from scratch
+SCHEMA_VERSION = 1
+# Below this many files to summarize, starting worker processes costs more than it saves
+PARALLEL_MIN_FILES = 16
+
+OVERVIEW_DETAILS = ('modules', 'classes', 'functions')
+OVERVIEW_GRAPH_ATTRS = {'rankdir': 'LR', 'ranksep': '0.6', 'nodesep': '0.25', 'compound': 'true'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    hash TEXT PRIMARY KEY,
+    summary TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    root TEXT NOT NULL,
+    path TEXT NOT NULL,
+    module TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (root, path)
+);
+"""
+
+
+def default_index_path() -> str:
+    """The machine-wide index (CODEVIZ_INDEX_PATH, else in the codeviz cache directory), shared by the CLI and backend."""
+    return os.environ.get('CODEVIZ_INDEX_PATH') or os.path.join(cache_dir(), INDEX_NAME)
+
+
+def package_prefix(root: str) -> List[str]:
+    """Names of the packages enclosing root itself, outermost first (empty if root is not a package)."""
+    names = []
+    while os.path.isfile(os.path.join(root, '__init__.py')):
+        root, name = os.path.split(root)
+        names.insert(0, name)
+    return names
+
+
+def module_name(relative_path: str, prefix: List[str] = ()) -> str:
+    """Dotted module name for a path relative to the project root ('pkg/__init__.py' -> 'pkg')."""
+    parts = list(prefix) + os.path.splitext(relative_path)[0].split(os.sep)
+    if parts[-1] == '__init__' and len(parts) > 1:
+        parts.pop()
+    return '.'.join(parts)
+
+
+def _definitions(body: list, owner: Optional[dict], summary: dict, prefix: str = '') -> Iterator[Tuple[list, dict, str]]:
+    """Record the classes and functions defined directly in body; yield the class bodies still to visit."""
+    pending = list(reversed(body))
+    while pending:
+        stmt = pending.pop()
+        if isinstance(stmt, ast.ClassDef):
+            entry = {"name": prefix + stmt.name, "lineno": stmt.lineno,
+                     "bases": [ast.unparse(base) for base in stmt.bases], "methods": []}
+            summary["classes"].append(entry)
+            yield stmt.body, entry, f"{entry['name']}."
+        elif isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            entry = {"name": stmt.name, "lineno": stmt.lineno, "async": isinstance(stmt, ast.AsyncFunctionDef)}
+            (owner["methods"] if owner is not None else summary["functions"]).append(entry)
+        elif isinstance(stmt, (ast.If, ast.Try)):
+            # Conditional definitions (TYPE_CHECKING blocks, try/except ImportError fallbacks)
+            blocks = [stmt.body, stmt.orelse] + ([stmt.finalbody] + [h.body for h in stmt.handlers]
+                                                 if isinstance(stmt, ast.Try) else [])
+            for block in reversed(blocks):
+                pending.extend(reversed(block))
+
+
+def summarize_source(code: str) -> dict:
+    """
+    Summary of one module from a single parse: its classes (with methods), top-level functions,
+    imports (as written; resolved against the project later) and size. Never raises: a file
+    that does not parse gets an 'error' entry instead.
+    """
+    summary = {"lines": code.count('\n') + 1, "nodes": 0, "imports": [], "classes": [], "functions": []}
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError) as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+        return summary
+    for node in ast.walk(tree):
+        summary["nodes"] += 1
+        if isinstance(node, ast.Import):
+            summary["imports"].extend([alias.name, 0, []] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            summary["imports"].append([node.module or '', node.level, [alias.name for alias in node.names]])
+    stack = [(tree.body, None, '')]
+    while stack:
+        body, owner, prefix = stack.pop()
+        stack.extend(_definitions(body, owner, summary, prefix))
+    summary["classes"].sort(key=lambda c: c["lineno"])
+    return summary
+
+
+def resolve_import(module: str, level: int, names: List[str], importer: str, is_package: bool,
+                   modules: Dict[str, dict]) -> Tuple[List[str], Optional[str]]:
+    """
+    Resolve one import statement against the project's modules.
+    Returns (project modules it refers to, top-level name of the external package or None).
+    'from pkg import sub' refers to the submodule pkg.sub when there is one.
+    """
+    if level:
+        parts = importer.split('.') if is_package else importer.split('.')[:-1]
+        if level - 1 > len(parts):
+            return [], None
+        parts = parts[:len(parts) - (level - 1)]
+        base = '.'.join(parts + ([module] if module else []))
+    else:
+        base = module
+    targets = [f"{base}.{name}" if base else name for name in names]
+    targets = [t for t in targets if t in modules]
+    if not targets:
+        candidate = base
+        while candidate and candidate not in modules:
+            candidate = candidate.rpartition('.')[0]
+        if candidate:
+            targets = [candidate]
+    if targets or level:
+        return targets, None
+    return [], base.partition('.')[0] or None
+
+
+class ProjectIndex:
+    """
+    SQLite index of per-file summaries for whole-project overviews.
+    - Summaries are stored by content hash; files map (root, relative path) to a hash plus the
+      (mtime, size) they had when indexed.
+    - update() only reads files whose (mtime, size) changed, and only summarizes contents whose
+      hash is not in the index yet (in a process pool when there are many).
+    - The database can be shared by the CLI and the backend; SQLite serialises the writers.
+    - Without db_path the index lives at default_index_path(). It is opened on first use; if that
+      location is unusable (read-only, no permission) the index is kept in memory instead, with
+      a warning, so overviews still work but are rebuilt per process.
+    - fingerprint() is kept from the last update(), so checking it costs no query.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or default_index_path()
+        self._fallback = db_path is None
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        # Root -> fingerprint as of the last update(), so requests need not query for it
+        self._fingerprints: Dict[str, str] = {}
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection is None:
+            try:
+                self._connection = self._open(self.db_path)
+            except (OSError, sqlite3.Error) as e:
+                if not self._fallback:
+                    raise
+                warnings.warn(f"Project index {self.db_path} unusable ({e}); keeping it in memory", RuntimeWarning)
+                self._connection = self._open(':memory:')
+        return self._connection
+
+    @staticmethod
+    def _open(db_path: str) -> sqlite3.Connection:
+        if db_path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS summaries;")
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.executescript(SCHEMA)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def update(self, root: str, jobs: Optional[int] = None) -> Dict[str, float]:
+        """Bring the index for every Python file under root up to date; returns what was done."""
+        start = time.perf_counter()
+        root = os.path.abspath(root)
+        sources = collect_inputs([root])
+        prefix = package_prefix(root)
+        stats = {"files": len(sources), "unchanged": 0, "reused": 0, "summarized": 0, "removed": 0, "failed": 0}
+        with self._lock:
+            known = {path: (mtime_ns, size) for path, mtime_ns, size in self._conn.execute(
+                'SELECT path, mtime_ns, size FROM files WHERE root = ?', (root,))}
+            rows = []
+            pending: Dict[str, str] = {}
+            for source in sources:
+                relative = os.path.relpath(source, root)
+                try:
+                    st = os.stat(source)
+                    if known.get(relative) == (st.st_mtime_ns, st.st_size):
+                        stats["unchanged"] += 1
+                        continue
+                    with open(source, encoding='utf-8', errors='replace') as f:
+                        code = f.read()
+                except OSError:
+                    stats["failed"] += 1
+                    continue
+                digest = source_hash(code)
+                rows.append((root, relative, module_name(relative, prefix), digest, st.st_mtime_ns, st.st_size))
+                if digest in pending or self._conn.execute(
+                        'SELECT 1 FROM summaries WHERE hash = ?', (digest,)).fetchone():
+                    stats["reused"] += 1
+                else:
+                    pending[digest] = code
+
+            summaries = self._summarize(pending, jobs)
+            stats["summarized"] = len(summaries)
+            stats["failed"] += sum('error' in summary for _, summary in summaries)
+
+            current = {os.path.relpath(source, root) for source in sources}
+            removed = [(root, path) for path in known if path not in current]
+            stats["removed"] = len(removed)
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO summaries VALUES (?, ?)',
+                                       [(digest, json.dumps(summary)) for digest, summary in summaries])
+                self._conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', rows)
+                self._conn.executemany('DELETE FROM files WHERE root = ? AND path = ?', removed)
+                if removed or rows:
+                    self._conn.execute('DELETE FROM summaries WHERE hash NOT IN (SELECT hash FROM files)')
+            self._fingerprints[root] = self._fingerprint(root)
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return stats
+
+    @staticmethod
+    def _summarize(pending: Dict[str, str], jobs: Optional[int]) -> List[Tuple[str, dict]]:
+        digests = list(pending)
+        codes = [pending[d] for d in digests]
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1 or len(codes) < PARALLEL_MIN_FILES:
+            return list(zip(digests, map(summarize_source, codes)))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return list(zip(digests, executor.map(summarize_source, codes, chunksize=8)))
+
+    def fingerprint(self, root: str) -> str:
+        """Hash of every (path, content hash) under root: changes whenever the overview can."""
+        root = os.path.abspath(root)
+        with self._lock:
+            fingerprint = self._fingerprints.get(root)
+            if fingerprint is None:
+                fingerprint = self._fingerprints[root] = self._fingerprint(root)
+            return fingerprint
+
+    def _fingerprint(self, root: str) -> str:
+        rows = self._conn.execute('SELECT path, hash FROM files WHERE root = ? ORDER BY path', (root,)).fetchall()
+        return hashlib.sha256(json.dumps(rows).encode('utf-8')).hexdigest()[:32]
+
+    def overview(self, root: str) -> dict:
+        """Modules under root with their summaries, plus the import edges between them."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT f.path, f.module, s.summary FROM files f JOIN summaries s ON s.hash = f.hash '
+                'WHERE f.root = ? ORDER BY f.module', (os.path.abspath(root),)).fetchall()
+        modules = {module: {"module": module, "path": path, **json.loads(summary)} for path, module, summary in rows}
+        edges: Dict[Tuple[str, str], int] = {}
+        external: Dict[Tuple[str, str], int] = {}
+        for name, entry in modules.items():
+            is_package = os.path.basename(entry["path"]) == '__init__.py'
+            for module, level, names in entry["imports"]:
+                targets, outside = resolve_import(module, level, names, name, is_package, modules)
+                for target in targets:
+                    if target != name:
+                        edges[(name, target)] = edges.get((name, target), 0) + 1
+                if outside:
+                    external[(name, outside)] = external.get((name, outside), 0) + 1
+        for entry in modules.values():
+            del entry["imports"]
+        return {
+            "modules": list(modules.values()),
+            "imports": [{"source": s, "target": t, "count": n} for (s, t), n in sorted(edges.items())],
+            "external_imports": [{"source": s, "target": t, "count": n} for (s, t), n in sorted(external.items())],
+        }
+
+
+def _module_label(entry: dict) -> str:
+    rows = [f"<B>{entry['module']}</B>",
+            f"<FONT POINT-SIZE='7' COLOR='grey60'>{html.escape(entry['path'])} · {entry['lines']} lines</FONT>"]
+    if 'error' in entry:
+        rows.append("<FONT POINT-SIZE='7' COLOR='firebrick'>does not parse</FONT>")
+    cells = ''.join(f"<TR><TD ALIGN='LEFT'>{row}</TD></TR>" for row in rows)
+    return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'>{cells}</TABLE>>"
+
+
+def _class_label(entry: dict, list_methods: bool) -> str:
+    rows = [f"<B>class</B> {entry['name']}"]
+    if list_methods:
+        rows.extend(f"<FONT POINT-SIZE='8'>{m['name']}()</FONT>" for m in entry["methods"])
+    else:
+        rows.append(f"<FONT POINT-SIZE='7' COLOR='grey60'>{len(entry['methods'])} methods</FONT>")
+    cells = ''.join(f"<TR><TD ALIGN='LEFT'>{row}</TD></TR>" for row in rows)
+    return f"<<TABLE BORDER='0' CELLBORDER='0' CELLSPACING='0' CELLPADDING='0'>{cells}</TABLE>>"
+
+
+def iter_overview_dot(overview: dict, detail: str = 'modules', external: bool = False,
+                      name: str = 'overview') -> Iterator[str]:
+    """
+    Yield DOT for a project overview: one node per module (or, with detail 'classes'/'functions',
+    one cluster per module holding its definitions) and an edge per importing module pair.
+    With external, imported third-party/stdlib packages are drawn as dashed nodes.
+    Node IDs ("m.pkg.mod", "c.pkg.mod/Class", "f.pkg.mod/func", "x.os") contain no ':', which
+    DOT would read as a node:port separator in edge statements.
+    """
+    if detail not in OVERVIEW_DETAILS:
+        raise ValueError(f"detail must be one of: {', '.join(OVERVIEW_DETAILS)}")
+    yield f"digraph {quote(name)} {{\n"
+    yield _attr_line(0, 'node', **NODE_DEFAULTS)
+    yield _attr_line(0, 'graph', **OVERVIEW_GRAPH_ATTRS)
+    yield _attr_line(0, 'edge', **DEFAULT_EDGE_ATTRS)
+    module_color = get_node_color('Module')
+    for entry in overview["modules"]:
+        module_id = f"m.{entry['module']}"
+        style = {'style': 'filled,dashed', 'color': 'firebrick'} if 'error' in entry else {'style': 'filled'}
+        if detail == 'modules':
+            yield _node_line(0, module_id, _module_label(entry), fillcolor=module_color, **style)
+            continue
+        yield _subgraph_head(0, f"cluster_{module_id}")
+        yield _graph_attr_line(1, label='', style='rounded', color='grey60')
+        yield _node_line(1, module_id, _module_label(entry), fillcolor=module_color, **style)
+        for cls in entry["classes"]:
+            class_id = f"c.{entry['module']}/{cls['name']}"
+            yield _node_line(1, class_id, _class_label(cls, detail == 'functions'),
+                             fillcolor=get_node_color('ClassDef'), style='filled')
+            yield _edge_line(1, module_id, class_id, style='dotted', arrowhead='none')
+        if detail == 'functions':
+            for func in entry["functions"]:
+                func_id = f"f.{entry['module']}/{func['name']}"
+                yield _node_line(1, func_id, f"<{'async ' if func['async'] else ''}{func['name']}()>",
+                                 fillcolor=get_node_color('FunctionDef'), style='filled')
+                yield _edge_line(1, module_id, func_id, style='dotted', arrowhead='none')
+        yield _subgraph_tail(0)
+    for edge in overview["imports"]:
+        attrs = {'penwidth': str(min(1 + edge['count'] // 2, 4))} if edge['count'] > 1 else {}
+        yield _edge_line(0, f"m.{edge['source']}", f"m.{edge['target']}", **attrs)
+    if external:
+        for package in sorted({edge['target'] for edge in overview["external_imports"]}):
+            yield _node_line(0, f"x.{package}", package, style='dashed', color='grey50', fontcolor='grey40')
+        for edge in overview["external_imports"]:
+            yield _edge_line(0, f"m.{edge['source']}", f"x.{edge['target']}", color='grey70')
+    yield "}\n"
+
+
+def overview_dot(overview: dict, detail: str = 'modules', external: bool = False, name: str = 'overview') -> str:
+    return ''.join(iter_overview_dot(overview, detail, external, name))
@@ -0,0 +1,187 @@
+import ast
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Optional
+
+from ast_paths import child_node_id, path_node_id
+from detail import NON_CHILD_FIELDS, child_fields, is_node, node_key
+from viz_config import OPERATOR_SYMBOLS
+
+# Fields that hold a node's operator(s): BinOp/BoolOp/UnaryOp/AugAssign.op, Compare.ops
+OPERATOR_FIELDS = ('op', 'ops')
+
+# Node classes kept by the skeleton preset: everything else (expressions, arguments, aliases...) is dropped
+STRUCTURE_CLASSES = (ast.mod, ast.stmt, ast.excepthandler, ast.match_case)
+
+
+class PruneRules:
+    """
+    What prune_tree removes from an AST dictionary before it is rendered:
+    - drop_ctx: leave out Load/Store/Del contexts (the [Load] suffix of Name labels)
+    - fold_operators: replace operator child nodes (op/ops) by a 'folded' symbol in the parent's label
+    - elide: node types that are replaced by their child when they have exactly one (e.g. Expr)
+    - drop: node types whose whole subtree is left out
+    - structure_only: also drop every node that is not a module, statement, handler or match case
+    """
+    __slots__ = ('drop_ctx', 'fold_operators', 'elide', 'drop', 'structure_only')
+
+    def __init__(self, drop_ctx: bool = False, fold_operators: bool = False, elide: Iterable[str] = (),
+                 drop: Iterable[str] = (), structure_only: bool = False):
+        self.drop_ctx = drop_ctx
+        self.fold_operators = fold_operators
+        self.elide: FrozenSet[str] = frozenset(elide)
+        self.drop: FrozenSet[str] = frozenset(drop)
+        self.structure_only = structure_only
+
+    def copy(self, **changes) -> 'PruneRules':
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return PruneRules(**fields)
+
+    def is_identity(self) -> bool:
+        return not (self.drop_ctx or self.fold_operators or self.elide or self.drop or self.structure_only)
+
+    def drops(self, node_type: str) -> bool:
+        if node_type in self.drop:
+            return True
+        return self.structure_only and not _is_structure(node_type)
+
+
+@lru_cache(maxsize=None)
+def _is_structure(node_type: str) -> bool:
+    node_class = getattr(ast, node_type, None)
+    return isinstance(node_class, type) and issubclass(node_class, STRUCTURE_CLASSES)
+
+
+PRUNE_PRESETS = {
+    # The graph as parsed
+    'full': PruneRules(),
+    # The same picture with fewer nodes: no contexts, operators in their parent's label, no single-child
+    # wrappers that only repeat their child (Expr, keyword and withitem labels show nothing of their own)
+    'compact': PruneRules(drop_ctx=True, fold_operators=True, elide={'Expr', 'keyword', 'withitem'}),
+    # Control structure only: modules, definitions, statements and handlers
+    'skeleton': PruneRules(drop_ctx=True, fold_operators=True, structure_only=True),
+}
+
+
+def _node_types(value: str) -> FrozenSet[str]:
+    types = frozenset(t.strip() for t in value.split('|') if t.strip())
+    unknown = sorted(t for t in types if not (isinstance(getattr(ast, t, None), type)
+                                              and issubclass(getattr(ast, t), ast.AST)))
+    if unknown:
+        raise ValueError(f"Unknown node types: {', '.join(unknown)}")
+    return types
+
+
+@lru_cache(maxsize=64)
+def parse_prune(spec: str) -> PruneRules:
+    """
+    Rules from a spec: an optional preset name followed by comma-separated rules, e.g.
+    "compact,drop=Import|ImportFrom,elide=Return". Rules: drop=TYPES, elide=TYPES,
+    keep=TYPES (neither dropped nor elided), ctx=keep|drop, operators=keep|fold.
+    Raises ValueError for unknown presets, rules or node types.
+    """
+    parts = [part.strip() for part in spec.split(',') if part.strip()]
+    rules = PRUNE_PRESETS['full']
+    if parts and '=' not in parts[0]:
+        preset = parts.pop(0)
+        if preset not in PRUNE_PRESETS:
+            raise ValueError(f"Unknown pruning preset {preset!r} (presets: {', '.join(PRUNE_PRESETS)})")
+        rules = PRUNE_PRESETS[preset]
+    for part in parts:
+        key, _, value = part.partition('=')
+        if key == 'drop':
+            rules = rules.copy(drop=rules.drop | _node_types(value))
+        elif key == 'elide':
+            rules = rules.copy(elide=rules.elide | _node_types(value))
+        elif key == 'keep':
+            kept = _node_types(value)
+            rules = rules.copy(drop=rules.drop - kept, elide=rules.elide - kept)
+        elif key == 'ctx' and value in ('keep', 'drop'):
+            rules = rules.copy(drop_ctx=value == 'drop')
+        elif key == 'operators' and value in ('keep', 'fold'):
+            rules = rules.copy(fold_operators=value == 'fold')
+        else:
+            raise ValueError(f"Unknown pruning rule {part!r}")
+    return rules
+
+
+def resolve_prune(prune) -> Optional[PruneRules]:
+    """PruneRules for a render option value: None, a spec string (see parse_prune) or PruneRules."""
+    if prune is None or isinstance(prune, PruneRules):
+        return prune
+    return parse_prune(prune)
+
+
+def prune_tree(ast_dict, rules: Optional[PruneRules], path: str = '', keep_root: bool = True):
+    """
+    Return a pruned copy of an AST dictionary (or NodeView tree) rooted at path; the input is not
+    modified, and with no rules (or the full preset) it is returned as is.
+    Every node of the copy records its node ID in the unpruned tree as 'ast_id', so the DOT emitter
+    gives it the same ID it has in the unpruned graph even where elided wrappers or dropped siblings moved it.
+    The walk is iterative: children are pruned before their parent decides whether to elide itself.
+    The root itself is neither dropped nor elided unless keep_root is False (then None means dropped),
+    as for the top-level statements that incremental.IncrementalRenderer renders one by one.
+    """
+    if rules is None or rules.is_identity():
+        return ast_dict
+    results = {}
+    root_key = node_key(ast_dict)
+    stack = [(ast_dict, path_node_id(path), False)]
+    while stack:
+        node, node_id, children_done = stack.pop()
+        is_root = node_key(node) == root_key
+        if not children_done:
+            if (not is_root or not keep_root) and rules.drops(node['type']):
+                results[node_key(node)] = None
+                continue
+            stack.append((node, node_id, True))
+            for field, value in child_fields(node):
+                if isinstance(value, list):
+                    stack.extend((item, child_node_id(node_id, field, i), False)
+                                 for i, item in enumerate(value) if is_node(item))
+                else:
+                    stack.append((value, child_node_id(node_id, field), False))
+            continue
+
+        copy = {}
+        children = []
+        folded = []
+        for field, value in node.items():
+            if field == 'ctx' and rules.drop_ctx:
+                continue
+            if field in NON_CHILD_FIELDS or value is None:
+                copy[field] = value
+            elif isinstance(value, list):
+                items = []
+                for item in value:
+                    if not is_node(item):
+                        items.append(item)
+                        continue
+                    pruned = results.pop(node_key(item))
+                    if pruned is None:
+                        continue
+                    if field in OPERATOR_FIELDS and rules.fold_operators and pruned['type'] in OPERATOR_SYMBOLS:
+                        folded.append(OPERATOR_SYMBOLS[pruned['type']])
+                        continue
+                    items.append(pruned)
+                    children.append(pruned)
+                if items or not value:
+                    copy[field] = items
+            elif is_node(value):
+                pruned = results.pop(node_key(value))
+                if pruned is None:
+                    continue
+                if field in OPERATOR_FIELDS and rules.fold_operators and pruned['type'] in OPERATOR_SYMBOLS:
+                    folded.append(OPERATOR_SYMBOLS[pruned['type']])
+                    continue
+                copy[field] = pruned
+                children.append(pruned)
+            else:
+                copy[field] = value
+        if folded:
+            copy['folded'] = ' '.join(folded)
+        copy['ast_id'] = node_id
+        if node['type'] in rules.elide and len(children) == 1 and (not is_root or not keep_root):
+            copy = children[0]
+        results[node_key(node)] = copy
+    return results[root_key]
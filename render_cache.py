@@ -0,0 +1,338 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Tuple
+
+from ast_parser import parse_code_compact
+from cfg import ControlFlowGraph, build_cfgs
+from compact_ast import CompactAST, NodeView
+from dot_render import iter_dot
+from pages import Page, split_pages
+from profiling import NULL_PROFILER, Profiler
+from source_index import SpanIndex
+from viz_config import NODE_COLORS, LEGEND
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+
+def source_hash(code: str) -> str:
+    """Return the content hash used to key cached parse/render results."""
+    return hashlib.sha256(code.encode('utf-8')).hexdigest()
+
+
+def config_hash(**options) -> str:
+    """
+    Return a hash of everything besides the source that affects the rendered output:
+    the colour/legend configuration from viz_config plus any render options.
+    """
+    payload = json.dumps({'colors': NODE_COLORS, 'legend': LEGEND, 'options': options},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def estimate_size(obj: Any) -> int:
+    """Approximate the memory held by a nested dict/list structure (iteratively)."""
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return total
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping bounded both by entry count and by approximate size in bytes.
+    Keeps hit/miss/eviction counters for reporting.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return  # Never cache something that would evict everything else
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether key is cached; unlike get() this neither counts as a hit nor refreshes the entry."""
+        with self._lock:
+            return key in self._data
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches predicate; returns the number removed."""
+        with self._lock:
+            doomed = [k for k in self._data if predicate(k)]
+            for k in doomed:
+                self._bytes -= self._data.pop(k)[1]
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SourceChanged(Exception):
+    """A file no longer has the content hash a caller loaded it with, so that version cannot be rendered."""
+
+
+class RenderCache:
+    """
+    Caches parsed AST dictionaries and rendered DOT text for files on disk.
+    - Files are only re-read when their (mtime, size) signature changes.
+    - Entries are keyed by source content hash (and render config hash for DOT),
+      so identical sources share entries and edits never serve stale output.
+    - With a store (render_store.RenderStore), misses fall through to the on-disk store shared
+      by every process before anything is parsed or rendered, and new results are written to it.
+    - The get_* methods take an optional source, the (content hash, source) pair from an earlier
+      load(path): the result is then for exactly that version (e.g. the one an ETag was made from),
+      and SourceChanged is raised if the file has to be re-read and no longer matches.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES, store=None):
+        self.entries = LRUCache(max_entries, max_bytes)
+        self.store = store
+        self._files: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._files_lock = threading.Lock()
+        self.file_reads = 0
+
+    def _read(self, path: str) -> str:
+        with open(path, 'r') as f:
+            code = f.read()
+        self.file_reads += 1
+        return code
+
+    def _read_version(self, path: str, digest: str) -> str:
+        """Re-read path for a version already loaded as digest, which it must still be."""
+        code = self._read(path)
+        if source_hash(code) != digest:
+            raise SourceChanged(path)
+        return code
+
+    def load(self, path: str) -> Tuple[str, Optional[str]]:
+        """
+        Return (content hash, source) for path. Source is None when the file is unchanged
+        since the last call, in which case it was not read at all.
+        """
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._files_lock:
+            known = self._files.get(path)
+        if known is not None and known[0] == signature:
+            return known[1], None
+        code = self._read(path)
+        digest = source_hash(code)
+        with self._files_lock:
+            self._files[path] = (signature, digest)
+        if known is not None and known[1] != digest:
+            self._invalidate(known[1])
+        return digest, code
+
+    def _invalidate(self, digest: str) -> None:
+        with self._files_lock:
+            if any(d == digest for _, d in self._files.values()):
+                return  # Another file still has this content
+        self.entries.discard_where(lambda key: key[1] == digest)
+
+    def get_ast(self, path: str, profiler: Profiler = NULL_PROFILER,
+                source: Optional[Tuple[str, Optional[str]]] = None) -> Tuple[str, Mapping]:
+        """
+        Return (content hash, AST) for path, parsing only on a cache miss.
+        ASTs are held as CompactAST; the returned root NodeView reads like the AST dict.
+        """
+        digest, code = source or self.load(path)
+        return digest, self._ast_for(path, digest, code, profiler)
+
+    def _ast_for(self, path: Optional[str], digest: str, code: Optional[str], profiler: Profiler) -> Mapping:
+        tree = self.entries.get(('ast', digest))
+        if tree is None:
+            tree = self._stored_ast(digest, profiler)
+            if tree is None:
+                if code is None:
+                    code = self._read_version(path, digest)
+                tree = parse_code_compact(code, profiler)
+                if self.store is not None and isinstance(tree, CompactAST):
+                    self.store.put(self.store.key('ast', digest), tree.to_bytes())
+            if isinstance(tree, CompactAST):
+                self.entries.put(('ast', digest), tree, tree.nbytes())
+            elif not tree['error'].startswith('MemoryError'):
+                # Parse errors are cached like ASTs; running out of memory may not happen next time
+                self.entries.put(('ast', digest), tree, estimate_size(tree))
+        return tree.root if isinstance(tree, CompactAST) else tree
+
+    def get_spans(self, path: str, profiler: Profiler = NULL_PROFILER,
+                  source: Optional[Tuple[str, Optional[str]]] = None) -> Tuple[str, Optional[SpanIndex]]:
+        """
+        Return (content hash, SpanIndex) for path, built once per parsed AST and cached next to it.
+        The index is None when the file does not parse.
+        """
+        digest, code = source or self.load(path)
+        spans = self.entries.get(('spans', digest))
+        if spans is None:
+            root = self._ast_for(path, digest, code, profiler)
+            if not isinstance(root, NodeView):
+                return digest, None
+            with profiler.stage('index') as stage:
+                spans = SpanIndex(root.tree)
+                stage.count(nodes=len(root.tree), breakpoints=len(spans.points))
+            self.entries.put(('spans', digest), spans, spans.nbytes())
+        return digest, spans
+
+    def get_cfg(self, path: str, profiler: Profiler = NULL_PROFILER,
+                function: Optional[str] = None,
+                source: Optional[Tuple[str, Optional[str]]] = None) -> Tuple[str, Optional[List[ControlFlowGraph]]]:
+        """
+        Return (content hash, control-flow graphs) for path (see cfg.build_cfgs), cached per
+        function selection. The graphs are None when the file does not parse; an unknown
+        function raises KeyError.
+        """
+        digest, code = source or self.load(path)
+        key = ('cfg', digest, function)
+        graphs = self.entries.get(key)
+        if graphs is None:
+            root = self._ast_for(path, digest, code, profiler)
+            if not isinstance(root, NodeView):
+                return digest, None
+            if code is None:
+                code = self._read_version(path, digest)
+            with profiler.stage('cfg') as stage:
+                graphs = build_cfgs(root, code.splitlines(), function)
+                stage.count(functions=len(graphs), blocks=sum(len(g.blocks) for g in graphs))
+            self.entries.put(key, graphs, sum(g.nbytes() for g in graphs))
+        return digest, graphs
+
+    def get_pages(self, path: str, profiler: Profiler = NULL_PROFILER, link: Optional[str] = None,
+                  source: Optional[Tuple[str, Optional[str]]] = None, **options) -> Tuple[str, Optional[List[Page]]]:
+        """
+        Return (content hash, pages) for path split with pages.split_pages(link=link, **options),
+        cached per option set. The pages are None when the file does not parse.
+        """
+        digest, code = source or self.load(path)
+        key = ('pages', digest, config_hash(link=link, **options))
+        pages = self.entries.get(key)
+        if pages is None:
+            root = self._ast_for(path, digest, code, profiler)
+            if not isinstance(root, NodeView):
+                return digest, None
+            with profiler.stage('pages') as stage:
+                pages = split_pages(root, link=link, **options)
+                stage.count(pages=len(pages))
+            self.entries.put(key, pages, sum(sys.getsizeof(page.dot_source) for page in pages))
+        return digest, pages
+
+    def _stored_ast(self, digest: str, profiler: Profiler) -> Optional[CompactAST]:
+        if self.store is None:
+            return None
+        key = self.store.key('ast', digest)
+        with profiler.stage('store') as stage:
+            data = self.store.get(key)
+            if data is None:
+                return None
+            stage.count(bytes=len(data))
+            try:
+                return CompactAST.from_bytes(data)
+            except ValueError:
+                # Corrupt or truncated entry: drop it and parse again, which rewrites it
+                self.store.delete(key)
+                return None
+
+    def get_dot(self, path: str, profiler: Profiler = NULL_PROFILER,
+                source: Optional[Tuple[str, Optional[str]]] = None, **options) -> Tuple[str, str]:
+        """Return (content hash, DOT source) for path rendered with iter_dot(**options)."""
+        digest, code = source or self.load(path)
+        return digest, self._dot_for(path, digest, code, profiler, **options)
+
+    def get_source_ast(self, code: str, profiler: Profiler = NULL_PROFILER) -> Tuple[str, Mapping]:
+        """get_ast for source text that is not in a file; shares entries with files of the same content."""
+        digest = source_hash(code)
+        return digest, self._ast_for(None, digest, code, profiler)
+
+    def get_source_dot(self, code: str, profiler: Profiler = NULL_PROFILER, **options) -> Tuple[str, str]:
+        """get_dot for source text that is not in a file."""
+        digest = source_hash(code)
+        return digest, self._dot_for(None, digest, code, profiler, **options)
+
+    def _dot_for(self, path: Optional[str], digest: str, code: Optional[str], profiler: Profiler,
+                 **options) -> str:
+        key = ('dot', digest, config_hash(**options))
+        with profiler.stage('cache'):
+            dot_source = self.entries.get(key)
+        if dot_source is None and self.store is not None:
+            with profiler.stage('store'):
+                dot_source = self.store.get_text(self.store.key('dot', digest, **options))
+            if dot_source is not None:
+                self.entries.put(key, dot_source, sys.getsizeof(dot_source))
+        if dot_source is None:
+            ast_dict = self._ast_for(path, digest, code, profiler)
+            with profiler.stage('dot') as stage:
+                stats = {}
+                dot_source = ''.join(iter_dot(ast_dict, stats=stats, **options))
+                stage.count(**stats)
+            self.entries.put(key, dot_source, sys.getsizeof(dot_source))
+            if self.store is not None:
+                self.store.put_text(self.store.key('dot', digest, **options), dot_source)
+        return dot_source
+
+    def render_status(self, digest: str) -> Optional[str]:
+        """
+        How much of the work for source digest is already cached: 'rendered' (default DOT in
+        memory), 'parsed' (AST in memory), 'stored' (AST in the render store) or None.
+        """
+        if ('dot', digest, config_hash()) in self.entries:
+            return 'rendered'
+        if ('ast', digest) in self.entries:
+            return 'parsed'
+        if self.store is not None and self.store.contains(self.store.key('ast', digest)):
+            return 'stored'
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.entries.stats()
+        stats["tracked_files"] = len(self._files)
+        stats["file_reads"] = self.file_reads
+        return stats
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from render_cache import config_hash
+
+try:  # Cross-process locking; without fcntl (Windows) eviction is only serialised within a process
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Bump whenever DOT, layout or AST serialisation output changes for the same input and options
+RENDERER_VERSION = 2
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Eviction trims the store to this fraction of max_bytes, so it does not run on every write
+EVICT_TO = 0.9
+
+
+def cache_dir() -> str:
+    """The per-user cache directory for codeviz data (under XDG_CACHE_HOME or ~/.cache)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'codeviz')
+
+
+def default_store_dir() -> str:
+    return os.path.join(cache_dir(), 'store')
+
+
+class RenderStore:
+    """
+    On-disk, content-addressed store for render outputs (DOT text, laid-out graphs, serialised ASTs),
+    shared by every process on the machine.
+    - Keys hash the kind of output, the source (or DOT) hash, RENDERER_VERSION, the Python
+      version and config_hash(**options), which covers viz_config; nothing is ever stale.
+    - Writes go to a temporary file that is renamed into place, so readers never see partial
+      entries and need no locks. Reads bump the entry's mtime, which drives LRU eviction.
+    - When the store grows past max_bytes, one process at a time (flock on a lock file)
+      deletes the least recently used entries until it is back under EVICT_TO of the cap.
+    """
+    def __init__(self, root: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root or default_store_dir()
+        self.max_bytes = max_bytes
+        self._objects = os.path.join(self.root, 'objects')
+        os.makedirs(self._objects, exist_ok=True)
+        self._lock = threading.Lock()
+        # This process's running estimate of the store size; None until the first scan
+        self._approx_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(kind: str, digest: str, **options) -> str:
+        payload = json.dumps([kind, digest, RENDERER_VERSION, sys.version_info[:2], config_hash(**options)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._objects, key[:2], key[2:])
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:  # evicted by another process since we opened it
+            pass
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes * (1 - EVICT_TO):
+            return  # Never store something that would evict a large part of everything else
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self.writes += 1
+            if self._approx_bytes is not None:
+                self._approx_bytes += len(data)
+        if self._approx_bytes is None or self._approx_bytes > self.max_bytes:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        """Remove key's entry, e.g. one that turned out to be unreadable; missing keys are ignored."""
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def contains(self, key: str) -> bool:
+        """Whether key is stored, without reading it or counting as a use."""
+        return os.path.exists(self._path(key))
+
+    def get_text(self, key: str) -> Optional[str]:
+        data = self.get(key)
+        return data.decode('utf-8') if data is not None else None
+
+    def put_text(self, key: str, text: str) -> None:
+        self.put(key, text.encode('utf-8'))
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) of every entry; temporary files of live writers are left alone."""
+        entries = []
+        for dirpath, _, filenames in os.walk(self._objects):
+            for name in filenames:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        with self._lock, open(os.path.join(self.root, 'lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self) -> int:
+        """Re-measure the store and, if it is over max_bytes, delete least recently used entries."""
+        removed = 0
+        with self._exclusive():
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                entries.sort()
+                target = self.max_bytes * EVICT_TO
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+                self.evictions += removed
+            self._approx_bytes = total
+        return removed
+
+    def clear(self) -> None:
+        with self._exclusive():
+            for _, _, path in self._entries():
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self._approx_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        entries = self._entries()
+        with self._lock:
+            return {
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+def default_store() -> Optional[RenderStore]:
+    """
+    The machine-wide store configured by CODEVIZ_STORE_DIR / CODEVIZ_STORE_MAX_MB, or None if CODEVIZ_STORE=0.
+    An unusable store directory (read-only home, no permission) also gives None, with a warning:
+    rendering then only loses the shared cache instead of failing at import.
+    """
+    if os.environ.get('CODEVIZ_STORE', '1') == '0':
+        return None
+    try:
+        return RenderStore(os.environ.get('CODEVIZ_STORE_DIR') or None,
+                           max_bytes=int(os.environ.get('CODEVIZ_STORE_MAX_MB', '512')) * 1024 * 1024)
+    except OSError as e:
+        warnings.warn(f"Render store disabled: {e}", RuntimeWarning)
+        return None
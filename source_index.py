@@ -0,0 +1,184 @@
+from array import array
+from bisect import bisect_right
+from typing import Dict, Optional, Tuple
+
+from ast_handlers import POSITION_FIELDS
+from ast_paths import TOP_LEVEL_ID, child_node_id, join_path, path_node_id, split_path
+from compact_ast import KIND_LIST, KIND_NODE, NO_POSITION, CompactAST
+
+# Source positions are packed into one integer, line * POSITION_STRIDE + column, so they
+# sort like (line, column) tuples and fit a flat array
+POSITION_STRIDE = 1 << 24
+
+Span = Tuple[int, int, int, int]
+
+
+def pack_position(line: int, col: int) -> int:
+    return line * POSITION_STRIDE + min(max(col, 0), POSITION_STRIDE - 1)
+
+
+class SpanIndex:
+    """
+    Maps source positions to AST nodes and back, for one CompactAST.
+    - Node spans (lineno/col_offset to end_lineno/end_col_offset, end exclusive) are swept once
+      into sorted breakpoints, each holding the innermost node from there to the next breakpoint;
+      locate() is then a binary search. Nodes with identical spans (an Expr and its Call)
+      resolve to the deeper one.
+    - Node paths (see ast_paths) are resolved by walking the tree, one child per path part;
+      each row's field and list position in its parent are recorded up front, so building a
+      node's path is one step per level as well.
+    - DOT node IDs are hashes (see ast_paths.child_node_id) and cannot be walked like paths;
+      index_of_id recomputes the IDs of the one top-level statement the ID names.
+    Lines are 1-based and columns 0-based in the AST's units (UTF-8 bytes), as in ast_to_dict.
+    """
+    __slots__ = ('tree', 'points', 'owners', 'fields', 'list_positions')
+
+    def __init__(self, tree: CompactAST):
+        self.tree = tree
+        self.points = array('q')
+        self.owners = array('i')
+        # Per row: string id of the parent's field holding it, and its index in that list (-1 if none)
+        self.fields = array('i', [-1]) * len(tree)
+        self.list_positions = array('i', [-1]) * len(tree)
+        for key, kind, value in zip(tree.slot_key, tree.slot_kind, tree.slot_value):
+            if kind == KIND_NODE:
+                self.fields[value] = key
+            elif kind == KIND_LIST:
+                first = tree.list_start[value]
+                for item in range(first, tree.list_start[value + 1]):
+                    if tree.item_kind[item] == KIND_NODE:
+                        child = tree.item_value[item]
+                        self.fields[child] = key
+                        self.list_positions[child] = item - first
+
+        spans = []
+        for index, (line, col, end_line, end_col) in enumerate(zip(*(tree.positions[f] for f in POSITION_FIELDS))):
+            if line != NO_POSITION and end_line != NO_POSITION:
+                start = line * POSITION_STRIDE + col
+                end = end_line * POSITION_STRIDE + end_col
+                if end > start:
+                    spans.append((start, -end, index))
+        # Outer spans first at each start; pre-order puts descendants after ancestors on ties
+        spans.sort()
+
+        stack = []  # (end, index) of the open spans, innermost last
+
+        def close_until(limit: int) -> None:
+            while stack and stack[-1][0] <= limit:
+                end = stack.pop()[0]
+                # Spans that ended under the one just closed (partial overlaps) are closed with it
+                while stack and stack[-1][0] <= end:
+                    stack.pop()
+                self._set_owner(end, stack[-1][1] if stack else -1)
+
+        for start, negative_end, index in spans:
+            close_until(start)
+            stack.append((-negative_end, index))
+            self._set_owner(start, index)
+        close_until(float('inf'))
+
+    def _set_owner(self, point: int, owner: int) -> None:
+        if self.points and self.points[-1] == point:
+            self.owners[-1] = owner
+        elif not self.owners or self.owners[-1] != owner:
+            self.points.append(point)
+            self.owners.append(owner)
+
+    def locate(self, line: int, col: int = 0) -> Optional[int]:
+        """Index of the innermost node whose span contains (line, col), or None."""
+        at = bisect_right(self.points, pack_position(line, col)) - 1
+        if at < 0 or self.owners[at] < 0:
+            return None
+        return self.owners[at]
+
+    def span(self, index: int) -> Tuple[int, Optional[Span]]:
+        """
+        (index, span) of the node, or of its closest ancestor with a position for nodes
+        that have none (operators, contexts, arguments); span is None if no ancestor has one.
+        """
+        positions = self.tree.positions
+        while index >= 0:
+            if positions['lineno'][index] != NO_POSITION:
+                return index, (positions['lineno'][index], positions['col_offset'][index],
+                               positions['end_lineno'][index], positions['end_col_offset'][index])
+            index = self.tree.parents[index]
+        return -1, None
+
+    def path_of(self, index: int) -> str:
+        """Path of the node at row index, found by walking up to the root."""
+        tree = self.tree
+        parts = []
+        while tree.parents[index] >= 0:
+            position = self.list_positions[index]
+            parts.append((tree.strings[self.fields[index]], position if position >= 0 else None))
+            index = tree.parents[index]
+        path = ''
+        for field, position in reversed(parts):
+            path = join_path(path, field, position)
+        return path
+
+    def index_of(self, path: str) -> int:
+        """
+        Row index of the node at path; touches only the nodes along the path.
+        Raises KeyError when the path does not lead to a node.
+        """
+        tree = self.tree
+        index = 0
+        parts = split_path(path)
+        position = 0
+        while position < len(parts):
+            field = parts[position]
+            key_id = tree.string_ids.get(field) if isinstance(field, str) else None
+            slots = range(tree.slot_start[index], tree.slot_start[index + 1])
+            slot = next((s for s in slots if tree.slot_key[s] == key_id), None) if key_id is not None else None
+            if slot is None:
+                raise KeyError(f"No AST node at path '{path}'")
+            kind, value = tree.slot_kind[slot], tree.slot_value[slot]
+            if kind == KIND_LIST:
+                position += 1
+                item = parts[position] if position < len(parts) else None
+                if not isinstance(item, int) or item >= tree.list_start[value + 1] - tree.list_start[value]:
+                    raise KeyError(f"No AST node at path '{path}'")
+                item += tree.list_start[value]
+                kind, value = tree.item_kind[item], tree.item_value[item]
+            if kind != KIND_NODE:
+                raise KeyError(f"No AST node at path '{path}'")
+            index = value
+            position += 1
+        return index
+
+    def index_of_id(self, node_id: str) -> int:
+        """
+        Row index of the node with DOT node ID node_id; touches only the top-level statement
+        that contains it. Raises KeyError when no node has that ID.
+        """
+        tree = self.tree
+        match = TOP_LEVEL_ID.match(node_id)
+        start = self.index_of(match.group(0)[2:]) if match else 0
+        if node_id == (match.group(0) if match else 'n'):
+            return start
+        ids = {start: match.group(0) if match else 'n'}
+        for index in range(start + 1, tree.subtree_end(start)):
+            position = self.list_positions[index]
+            ids[index] = child_node_id(ids[tree.parents[index]], tree.strings[self.fields[index]],
+                                       position if position >= 0 else None)
+            if ids[index] == node_id:
+                return index
+        raise KeyError(f"No AST node with ID '{node_id}'")
+
+    def describe(self, index: int) -> Dict:
+        """JSON-ready description of a node: path, DOT node ID, type and source span."""
+        path = self.path_of(index)
+        span_index, span = self.span(index)
+        return {
+            "path": path,
+            "id": path_node_id(path),
+            "type": self.tree.node(index)['type'],
+            "span": dict(zip(POSITION_FIELDS, span)) if span else None,
+            "span_path": self.path_of(span_index) if span is not None and span_index != index else None,
+        }
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the index itself (the tree is cached separately)."""
+        return sum(column.itemsize * len(column)
+                   for column in (self.points, self.owners, self.fields, self.list_positions))
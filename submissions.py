@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from profiling import Profiler, Stage
+
+# Limits for source text submitted to POST /api/render (CODEVIZ_SUBMIT_*)
+SUBMIT_MAX_SOURCE_BYTES = int(os.environ.get('CODEVIZ_SUBMIT_MAX_KB', '256')) * 1024
+SUBMIT_MAX_NODES = int(os.environ.get('CODEVIZ_SUBMIT_MAX_NODES', '20000'))
+SUBMIT_TIMEOUT = float(os.environ.get('CODEVIZ_SUBMIT_TIMEOUT', '10'))
+# Distinct submissions rendered at once; identical ones join a running render and do not count
+SUBMIT_MAX_INFLIGHT = int(os.environ.get('CODEVIZ_SUBMIT_MAX_INFLIGHT', '8'))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised at a stage boundary once a submission has used up its time."""
+
+
+class TooManySubmissions(Exception):
+    """Raised by Coalescer.run when max_inflight distinct computations are already running."""
+
+
+class _DeadlineStage(Stage):
+    """Stage that checks the profiler's deadline before it starts."""
+    __slots__ = ()
+
+    def __enter__(self) -> "_DeadlineStage":
+        self._profiler.checkpoint()
+        return super().__enter__()
+
+
+class DeadlineProfiler(Profiler):
+    """
+    Profiler for submitted source: every stage first checks that the deadline has not passed,
+    so a render that runs out of time stops at its next stage instead of finishing unseen.
+    """
+
+    def __init__(self, timeout: float, trace_memory: bool = False):
+        super().__init__(trace_memory)
+        self.deadline = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def stage(self, name: str) -> Stage:
+        return _DeadlineStage(self, name)
+
+    def checkpoint(self) -> None:
+        if time.monotonic() >= self.deadline:
+            raise DeadlineExceeded("time limit reached")
+
+
+class Coalescer:
+    """
+    Runs blocking computations in threads, off the event loop, with at most one per key at a time.
+    - A call whose key is already being computed awaits that computation instead of starting
+      another, and every caller gets its result (or its exception).
+    - Each caller waits at most its own timeout; a caller that gives up (or disconnects) does
+      not cancel the computation the others are waiting for.
+    - At most max_inflight keys are computed at once; beyond that run() raises TooManySubmissions.
+    All calls must come from the same event loop, so the in-flight table needs no lock.
+    """
+    def __init__(self, max_inflight: int = SUBMIT_MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.joined = 0
+        self.rejected = 0
+
+    async def run(self, key: Hashable, func: Callable[..., Any], *args,
+                  timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """Return (func(*args), whether this call joined a computation another call started)."""
+        future = self._inflight.get(key)
+        joined = future is not None
+        if joined:
+            self.joined += 1
+        else:
+            if len(self._inflight) >= self.max_inflight:
+                self.rejected += 1
+                raise TooManySubmissions(f"{len(self._inflight)} renders in progress")
+            future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.started += 1
+        return await asyncio.wait_for(asyncio.shield(future), timeout), joined
+
+    def _forget(self, key: Hashable, done: asyncio.Future) -> None:
+        if self._inflight.get(key) is done:
+            del self._inflight[key]
+        if not done.cancelled():
+            done.exception()  # Retrieved here, so a result nobody waited for is not logged as lost
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), "started": self.started, "joined": self.joined,
+                "rejected": self.rejected}
@@ -0,0 +1,43 @@
+import ast
+
+import pytest
+
+from ast_diff import AstDiff
+from ast_parser import ast_to_dict
+
+
+def diff(old_code, new_code):
+    return AstDiff(ast_to_dict(ast.parse(old_code)), ast_to_dict(ast.parse(new_code)))
+
+
+def assert_one_to_one(result):
+    for n, o in enumerate(result.new_match):
+        if o >= 0:
+            assert result.old_match[o] == n
+    for o, n in enumerate(result.old_match):
+        if n >= 0:
+            assert result.new_match[n] == o
+
+
+def kinds_at(result, path):
+    n = next(i for i, entry in enumerate(result.new) if entry.path == path)
+    return result.kinds.get(n, ())
+
+
+def test_copied_subtree_is_inserted_not_moved():
+    result = diff("x = foo(a, b)\n", "foo(a, b)\nx = foo(a, b)\n")
+    assert_one_to_one(result)
+    assert kinds_at(result, 'body.0') == ('inserted',)
+    assert kinds_at(result, 'body.0.value') == ('inserted',)
+    assert kinds_at(result, 'body.1.value') == ()
+    assert result.deleted == []
+
+
+@pytest.mark.parametrize("old_code, new_code", [
+    ("x = foo(a, b)\n", "foo(a, b)\nx = foo(a, b)\n"),
+    ("foo(a, b)\nx = foo(a, b)\n", "x = foo(a, b)\n"),
+    ("def f(a):\n    return g(a, 1)\n", "def f(a):\n    y = g(a, 1)\n    return g(a, 1)\n"),
+    ("a = [f(x), f(x), f(x)]\n", "b = f(x)\na = [f(x), g(f(x))]\n"),
+])
+def test_matching_is_one_to_one(old_code, new_code):
+    assert_one_to_one(diff(old_code, new_code))
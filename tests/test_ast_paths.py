@@ -0,0 +1,35 @@
+import ast
+import re
+
+from ast_parser import ast_to_dict
+from ast_paths import path_node_id
+from compact_ast import CompactAST
+from dot_render import iter_dot
+from source_index import SpanIndex
+
+NODE_ID = re.compile(r'^\t+"(n(?:\.[^"]*)?)" \[', re.M)
+
+
+def nested_source(depth):
+    lines = []
+    for level in range(depth):
+        lines.append('    ' * level + f'if x{level}:')
+    lines.append('    ' * depth + 'y = f(a, b)')
+    return '\n'.join(lines) + '\n'
+
+
+def test_node_ids_do_not_grow_with_depth():
+    dot_source = ''.join(iter_dot(ast_to_dict(ast.parse(nested_source(60)))))
+    ids = NODE_ID.findall(dot_source)
+    assert ids
+    assert max(len(node_id) for node_id in ids) == len('n.body.0.') + 12
+
+
+def test_node_ids_resolve_to_their_nodes():
+    code = nested_source(5) + 'def g(p, *q):\n    return [p + i for i in q]\n'
+    ast_dict = ast_to_dict(ast.parse(code))
+    spans = SpanIndex(CompactAST.from_dict(ast_dict))
+    ids = NODE_ID.findall(''.join(iter_dot(ast_dict)))
+    assert len(ids) == len(set(ids))
+    for node_id in ids:
+        assert path_node_id(spans.path_of(spans.index_of_id(node_id))) == node_id
@@ -0,0 +1,35 @@
+import ast
+
+from ast_parser import ast_to_dict
+from cfg import build_cfgs
+
+NESTED_TRY = """\
+def f():
+    try:
+        try:
+            raise ValueError
+        finally:
+            cleanup()
+    except ValueError:
+        handle()
+"""
+
+
+def block_with(graph, node_type):
+    return next(block.index for block in graph.blocks
+                if any(statement[1] == node_type for statement in block.statements))
+
+
+def test_raise_in_inner_finally_reaches_outer_handler():
+    graph, = build_cfgs(ast_to_dict(ast.parse(NESTED_TRY)), NESTED_TRY.splitlines(), 'f')
+    raise_block = block_with(graph, 'Raise')
+    handler_block = block_with(graph, 'ExceptHandler')
+    exit_block = next(block.index for block in graph.blocks if block.kind == 'exit')
+    raise_edges = [(tail, head) for tail, head, label in graph.edges if label == 'raise']
+
+    # raise -> finally block -> (end of finally) -> except ValueError, never straight to the exit
+    final_block = next(head for tail, head in raise_edges if tail == raise_block)
+    assert final_block != exit_block
+    assert any(head == handler_block for tail, head in raise_edges if tail != raise_block)
+    assert all(head != exit_block for _, head in raise_edges)
+    assert graph.blocks[handler_block].reachable
@@ -0,0 +1,48 @@
+import ast
+
+import pytest
+
+from ast_parser import ast_to_dict
+from compact_ast import CompactAST
+from render_cache import RenderCache
+from render_store import RenderStore
+
+SOURCE = "x = 1\ndef f(a):\n    return a + 2\n"
+
+MIXED = """\
+global g
+try:
+    d = {**a, 'k': f"{x!r:>{w}}", None: b'y'}
+except (KeyError, ValueError) as e:
+    h = lambda q, *r, s=1.5, **t: q[1:2, ...] + 2j
+"""
+
+
+def test_from_ast_matches_from_dict():
+    tree = ast.parse(MIXED)
+    direct = CompactAST.from_ast(tree)
+    via_dicts = CompactAST.from_dict(ast_to_dict(tree))
+    assert direct.columns() == via_dicts.columns()
+    assert direct.strings == via_dicts.strings
+    assert direct.to_dict() == ast_to_dict(tree)
+
+
+def test_from_bytes_rejects_truncated_payloads():
+    data = CompactAST.from_dict(ast_to_dict(ast.parse(SOURCE))).to_bytes()
+    for end in (4, 6, 20, len(data) - 1):
+        with pytest.raises(ValueError):
+            CompactAST.from_bytes(data[:end])
+
+
+def test_corrupt_store_entry_is_a_miss(tmp_path):
+    store = RenderStore(str(tmp_path / 'store'))
+    path = tmp_path / 'a.py'
+    path.write_text(SOURCE)
+    digest, tree = RenderCache(store=store).get_ast(str(path))
+    key = store.key('ast', digest)
+    good = store.get(key)
+    store.put(key, good[:-3])
+
+    digest, reparsed = RenderCache(store=store).get_ast(str(path))
+    assert reparsed.tree.to_dict() == tree.tree.to_dict()
+    assert store.get(key) == good
@@ -0,0 +1,42 @@
+import ast
+
+from ast_parser import ast_to_dict
+from detail import child_fields, collapse_tree, drawn_child_count, is_node, subtree_sizes
+
+FUNCTIONS = """\
+def f(a, b, c=1):
+    return a + b * c
+
+g = lambda x, y: x
+"""
+
+
+def walk(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        for _, value in child_fields(node):
+            stack.extend(child for child in (value if isinstance(value, list) else (value,)) if is_node(child))
+
+
+def test_arguments_collapse_with_their_function():
+    tree = ast_to_dict(ast.parse(FUNCTIONS))
+    for budget in range(1, subtree_sizes(tree)[id(tree)] + 1):
+        collapsed = collapse_tree(tree, node_budget=budget)
+        for node in walk(collapsed):
+            if node['type'] == 'arguments':
+                assert 'collapsed' not in node
+        summaries = [node for node in walk(collapsed) if 'collapsed' in node]
+        drawn = sum(1 for node in walk(collapsed) if node['type'] != 'arguments')
+        # Every node of the original tree is either drawn or counted by exactly one summary
+        assert drawn + sum(node['collapsed'] for node in summaries) == subtree_sizes(tree)[id(tree)]
+
+
+def test_budget_counts_argument_children_like_subtree_sizes():
+    function = ast_to_dict(ast.parse(FUNCTIONS))['body'][0]
+    # args a, b, c, the default 1 and the Return statement
+    assert drawn_child_count(function) == 5
+    collapsed = collapse_tree({'type': 'Module', 'body': [function]}, max_depth=1)
+    assert collapsed['body'][0]['collapsed'] == subtree_sizes(function)[id(function)] - 1
+    assert 'args' not in collapsed['body'][0]
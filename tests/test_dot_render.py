@@ -0,0 +1,21 @@
+import ast
+import os
+
+from ast_parser import ast_to_dict, parse_code
+from dot_render import generate_dot
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python_examples')
+
+
+def test_except_clause_keeps_its_node_type():
+    with open(os.path.join(EXAMPLES, 'complex.py')) as f:
+        code = f.read()
+    tree = parse_code(code)
+    assert 'error' not in tree
+    handler = next(node for node in ast.walk(ast.parse(code)) if isinstance(node, ast.ExceptHandler))
+    handler_dict = ast_to_dict(handler)
+    assert handler_dict['type'] == 'ExceptHandler'
+    assert handler_dict['exc_type']['type'] == 'Name' and handler_dict['exc_type']['id'] == 'ZeroDivisionError'
+    dot_source = generate_dot(tree).source
+    assert 'ExceptHandler' in dot_source
+    assert 'ZeroDivisionError' in dot_source
@@ -0,0 +1,60 @@
+import pytest
+
+from file_index import FileIndex
+
+
+def test_deeply_nested_file_is_recorded_as_an_error(tmp_path):
+    (tmp_path / 'deep.py').write_text('x = 1' + ' + 1' * 100000 + '\n')
+    (tmp_path / 'ok.py').write_text('y = 1\n')
+    index = FileIndex(str(tmp_path))
+    index.refresh()
+    assert index.measure() == 2
+    entries = {entry['path']: entry for entry in index.query()['files']}
+    assert entries['deep.py']['error'].startswith(('RecursionError', 'MemoryError'))
+    assert entries['ok.py']['nodes'] and entries['ok.py']['error'] is None
+    assert index.stats()['pending'] == 0
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for directory in ('pkg', 'pkg/sub', 'tools'):
+        (tmp_path / directory).mkdir()
+    for name in ('a.py', 'pkg/b.py', 'pkg/c.py', 'pkg/sub/d.py', 'pkg/sub/Extra.py', 'tools/e.py'):
+        (tmp_path / name).write_text('x = 1\n')
+    index = FileIndex(str(tmp_path))
+    index.refresh()
+    return index
+
+
+def pages(index, **query):
+    cursor, seen = None, []
+    while True:
+        page = index.query(cursor=cursor, limit=2, **query)
+        assert len(page['files']) <= 2
+        seen.append([entry['path'] for entry in page['files']])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return page['total'], seen
+
+
+def test_cursor_pages_cover_every_match_once(tree):
+    total, seen = pages(tree)
+    assert total == 6
+    assert seen == [['a.py', 'pkg/b.py'], ['pkg/c.py', 'pkg/sub/Extra.py'], ['pkg/sub/d.py', 'tools/e.py']]
+
+
+@pytest.mark.parametrize('query, expected', [
+    ({'prefix': 'pkg/'}, ['pkg/b.py', 'pkg/c.py', 'pkg/sub/Extra.py', 'pkg/sub/d.py']),
+    ({'search': 'EXTRA'}, ['pkg/sub/Extra.py']),
+    ({'prefix': 'pkg/', 'search': 'sub/'}, ['pkg/sub/Extra.py', 'pkg/sub/d.py']),
+    ({'prefix': 'nothing/'}, []),
+])
+def test_prefix_and_search_pages(tree, query, expected):
+    total, seen = pages(tree, **query)
+    assert total == len(expected)
+    assert [path for page in seen for path in page] == expected
+
+
+def test_foreign_cursor_is_rejected(tree):
+    with pytest.raises(ValueError):
+        tree.query(cursor='not base64!')
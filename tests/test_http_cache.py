@@ -0,0 +1,33 @@
+import pytest
+
+import http_cache
+from http_cache import choose_encoding, encoded_etag, make_etag, match_etag
+
+ETAG = make_etag('dot', 'abc', 'cfg')
+
+
+@pytest.mark.parametrize('header', [ETAG, f'W/{ETAG}', f'"other", {ETAG}', '*', encoded_etag(ETAG, 'gzip')])
+def test_matching_if_none_match(header):
+    assert match_etag(header, ETAG) is not None
+
+
+@pytest.mark.parametrize('header', [None, '', '"other"', make_etag('dot', 'abd', 'cfg')])
+def test_non_matching_if_none_match(header):
+    assert match_etag(header, ETAG) is None
+
+
+@pytest.mark.parametrize('header, with_brotli, expected', [
+    (None, True, None),
+    ('identity', True, None),
+    ('gzip', True, 'gzip'),
+    ('gzip, br', True, 'br'),
+    ('gzip, br', False, 'gzip'),
+    ('br;q=0.5, gzip;q=0.8', True, 'gzip'),
+    ('gzip;q=0', True, None),
+    ('*', False, 'gzip'),
+    ('*, gzip;q=0', False, None),
+    ('gzip;q=oops, br', True, 'br'),
+])
+def test_choose_encoding(monkeypatch, header, with_brotli, expected):
+    monkeypatch.setattr(http_cache, 'brotli', object() if with_brotli else None)
+    assert choose_encoding(header) == expected
@@ -0,0 +1,55 @@
+import ast
+
+import pytest
+
+from ast_parser import ast_to_dict
+from dot_render import iter_dot
+from incremental import IncrementalRenderer
+from profiling import Profiler
+from prune import PRUNE_PRESETS
+
+BASE = """\
+import os
+
+def area(w, h=2):
+    return w * h
+
+class Shape:
+    sides = 4
+
+print(area(3))
+"""
+
+# Each edit starts from the previous one: insert above, edit in place, add, reorder, delete, restore
+EDITS = [
+    BASE,
+    '# header\n\n' + BASE,
+    '# header\n\n' + BASE.replace('w * h', 'w * h + 1'),
+    '# header\n\n' + BASE.replace('w * h', 'w * h + 1') + 'x = [i for i in range(3)]\n',
+    'x = [i for i in range(3)]\n' + BASE.replace('w * h', 'w * h + 1'),
+    'x = [i for i in range(3)]\n' + BASE.replace('w * h', 'w * h + 1').replace('class Shape:\n    sides = 4\n\n', ''),
+    BASE,
+    '',
+    BASE,
+]
+
+
+@pytest.mark.parametrize('prune', sorted(PRUNE_PRESETS))
+def test_every_render_matches_a_full_render(prune):
+    renderer = IncrementalRenderer(name='module', prune=prune)
+    for code in EDITS:
+        expected_dict = ast_to_dict(ast.parse(code))
+        assert renderer.render(code) == ''.join(iter_dot(expected_dict, name='module', prune=prune)), code
+        assert renderer.ast_dict == expected_dict
+
+
+def test_only_edited_statements_are_converted():
+    renderer = IncrementalRenderer()
+    profiler = Profiler()
+    renderer.render(BASE, profiler)
+    renderer.render('# header\n' + BASE.replace('sides = 4', 'sides = 5'), profiler)
+    counts = profiler.stages[-1].counts
+    assert (counts['reused'], counts['moved'], counts['converted']) == (0, 3, 1)
+    renderer.render('# header\n' + BASE.replace('sides = 4', 'sides = 5'), profiler)
+    counts = profiler.stages[-1].counts
+    assert (counts['reused'], counts['moved'], counts['converted']) == (4, 0, 0)
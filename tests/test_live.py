@@ -0,0 +1,71 @@
+from live import LiveSession, fragment_elements, rename_top_level
+
+DOCSTRING = '''\
+def f():
+    """Doc line one.
+    second line x = 1
+    """
+    return 1
+'''
+
+VERSIONS = [
+    "x = 1\ndef f(a):\n    return a\n",
+    "x = 1\ny = 'a < b'\ndef f(a):\n    return a\n",
+    "y = 'a < b'\ndef f(a):\n    return a + 1\n",
+    DOCSTRING + "z = [1, 2]\n",
+    "z = [1, 2]\n",
+]
+
+
+def element_key(kind, element):
+    return (kind, element['tail'], element['head']) if kind == 'edges' else (kind, element['id'])
+
+
+def model(snapshot):
+    return {element_key(kind, element): element for kind in ('clusters', 'nodes', 'edges')
+            for element in snapshot[kind]}
+
+
+def apply(current, message):
+    """Apply a delta message to a client model, in the documented order."""
+    for kind, removed in message['remove'].items():
+        for key in removed:
+            current.pop((kind, *key) if kind == 'edges' else (kind, key))
+    renames = {int(old): new for old, new in message['renames'].items()}
+    renamed = {}
+    for (kind, *ids), element in current.items():
+        element = {field: rename_top_level(value, renames) if field in ('id', 'tail', 'head', 'cluster') and value
+                   else value for field, value in element.items()}
+        renamed[element_key(kind, element)] = element
+    for group in ('update', 'add'):
+        for kind, elements in message[group].items():
+            for element in elements:
+                renamed[element_key(kind, element)] = element
+    return renamed
+
+
+def test_multi_line_docstring_renders_and_parses():
+    session = LiveSession()
+    dot_source, delta = session.update(DOCSTRING)
+    assert delta is None
+    labels = [element['attrs']['label'] for element in session.snapshot()['nodes']]
+    assert any('Doc line one.<BR/>' in label for label in labels)
+    _, delta = session.update(DOCSTRING.replace('return 1', 'return 2'))
+    assert delta
+
+
+def test_statements_may_span_lines():
+    text = '\t\t"n.body.0" [label=<a\nb> style=filled]\n\t\t"n.body.0" -> "n.body.0.x" [label=value]\n'
+    elements = fragment_elements(text)
+    assert elements[('node', 'n.body.0')]['attrs']['label'] == '<a\nb>'
+    assert ('edge', 'n.body.0', 'n.body.0.x') in elements
+
+
+def test_deltas_reproduce_each_snapshot():
+    session = LiveSession()
+    session.update(VERSIONS[0])
+    current = model(session.snapshot())
+    for code in VERSIONS[1:]:
+        _, delta = session.update(code)
+        current = apply(current, delta.as_message())
+        assert current == model(session.snapshot())
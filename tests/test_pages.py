@@ -0,0 +1,44 @@
+import ast
+
+from ast_parser import ast_to_dict
+from pages import OVERVIEW_PAGE, split_pages
+
+MODULE = """\
+import os
+
+
+def helper(a, b):
+    return a + b
+
+
+@staticmethod
+def decorated(x):
+    if x:
+        return helper(x, 1)
+    return None
+
+
+class Store:
+    def get(self, key):
+        return os.environ.get(key)
+"""
+
+
+def digests(code):
+    return {page.name: page.digest for page in split_pages(ast_to_dict(ast.parse(code)))}
+
+
+def test_edits_above_a_definition_leave_its_page_unchanged():
+    before = digests(MODULE)
+    after = digests("# a new comment\n\nimport sys\n" + MODULE)
+    assert before.keys() == after.keys()
+    for name in before:
+        if name != OVERVIEW_PAGE:
+            assert after[name] == before[name], name
+
+
+def test_editing_a_definition_changes_only_its_page():
+    before = digests(MODULE)
+    after = digests(MODULE.replace("a + b", "a - b"))
+    changed = {name for name in before if before[name] != after[name]}
+    assert changed == {'helper'}
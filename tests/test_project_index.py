@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+from project_index import OVERVIEW_DETAILS, ProjectIndex, overview_dot
+
+# A DOT ID as written by graphviz.quoting: quoted, or a bare word
+DOT_ID = r'"(?:[^"\\]|\\.)*"|[^\s"\[\]]+'
+EDGE_LINE = re.compile(rf'^\t+({DOT_ID}) -> ({DOT_ID})(?: \[|$)')
+NODE_LINE = re.compile(rf'^\t+({DOT_ID})(?: \[|$)')
+
+
+def declared_and_linked(dot_source):
+    nodes, endpoints = set(), set()
+    for line in dot_source.splitlines():
+        edge = EDGE_LINE.match(line)
+        if edge:
+            endpoints.update(edge.groups())
+            continue
+        node = NODE_LINE.match(line)
+        if node and node.group(1) not in ('node', 'graph', 'edge', 'subgraph'):
+            nodes.add(node.group(1))
+    return nodes, endpoints
+
+
+@pytest.fixture
+def overview(tmp_path):
+    project = tmp_path / 'proj'
+    (project / 'pkg').mkdir(parents=True)
+    (project / 'pkg' / '__init__.py').write_text('')
+    (project / 'pkg' / 'a.py').write_text('import os\nfrom pkg import b\n\nclass Cls:\n    def run(self):\n        pass\n')
+    (project / 'pkg' / 'b.py').write_text('import json\n\nasync def fetch():\n    pass\n\nclass Other:\n    pass\n')
+    index = ProjectIndex(str(tmp_path / 'index.sqlite'))
+    try:
+        index.update(str(project), jobs=1)
+        yield index.overview(str(project))
+    finally:
+        index.close()
+
+
+@pytest.mark.parametrize('detail', OVERVIEW_DETAILS)
+def test_every_edge_endpoint_is_a_declared_node(overview, detail):
+    nodes, endpoints = declared_and_linked(overview_dot(overview, detail, external=True))
+    assert endpoints
+    assert endpoints <= nodes
+
+
+def test_unusable_default_location_falls_back_to_memory(tmp_path, monkeypatch):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    monkeypatch.setenv('CODEVIZ_INDEX_PATH', str(blocker / 'index.sqlite'))
+    project = tmp_path / 'proj'
+    project.mkdir()
+    (project / 'mod.py').write_text('def f():\n    pass\n')
+    index = ProjectIndex()
+    try:
+        with pytest.warns(RuntimeWarning):
+            stats = index.update(str(project), jobs=1)
+        assert stats['files'] == 1
+        assert [m['module'] for m in index.overview(str(project))['modules']] == ['mod']
+    finally:
+        index.close()
+
+
+def test_fingerprint_follows_update(tmp_path):
+    project = tmp_path / 'proj'
+    project.mkdir()
+    (project / 'mod.py').write_text('x = 1\n')
+    index = ProjectIndex(str(tmp_path / 'index.sqlite'))
+    try:
+        index.update(str(project), jobs=1)
+        before = index.fingerprint(str(project))
+        (project / 'other.py').write_text('y = 2\n')
+        assert index.fingerprint(str(project)) == before
+        index.update(str(project), jobs=1)
+        assert index.fingerprint(str(project)) != before
+    finally:
+        index.close()
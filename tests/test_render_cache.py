@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from render_cache import RenderCache, SourceChanged, source_hash
+
+
+def test_get_with_source_renders_that_version(tmp_path):
+    path = tmp_path / 'a.py'
+    path.write_text("x = 1\n")
+    cache = RenderCache()
+    source = cache.load(str(path))
+    digest, dot_source = cache.get_dot(str(path), source=source)
+    assert digest == source_hash("x = 1\n") and "x" in dot_source
+
+
+def test_get_with_stale_source_raises(tmp_path):
+    path = tmp_path / 'a.py'
+    path.write_text("x = 1\n")
+    st = os.stat(path)
+    cache = RenderCache()
+    cache.load(str(path))
+    # Unchanged signature: the second load does not read the file, so nothing is in hand
+    source = cache.load(str(path))
+    assert source[1] is None
+    path.write_text("y = 2\n")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    with pytest.raises(SourceChanged):
+        cache.get_ast(str(path), source=source)
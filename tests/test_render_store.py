@@ -0,0 +1,33 @@
+import os
+
+from render_store import RenderStore
+
+
+def test_put_then_get_round_trips(tmp_path):
+    store = RenderStore(str(tmp_path))
+    key = RenderStore.key('dot', 'abc', detail='full')
+    assert store.get(key) is None
+    store.put_text(key, 'digraph {}')
+    assert store.contains(key)
+    assert store.get_text(key) == 'digraph {}'
+    assert RenderStore.key('dot', 'abc', detail='compact') != key
+    assert store.stats()['hits'] == 1 and store.stats()['misses'] == 1
+
+
+def test_oversized_entries_are_not_stored(tmp_path):
+    store = RenderStore(str(tmp_path), max_bytes=1000)
+    store.put('big', b'x' * 200)
+    assert not store.contains('big')
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    store = RenderStore(str(tmp_path), max_bytes=1000)
+    keys = [RenderStore.key('dot', str(i)) for i in range(11)]
+    for i, key in enumerate(keys):
+        store.put(key, b'x' * 90)
+        os.utime(store._path(key), (1000 + i, 1000 + i))
+    store.get(keys[0])  # Now the most recently used
+    store.put(RenderStore.key('dot', 'new'), b'x' * 90)
+    kept = [key for key in keys if store.contains(key)]
+    assert store.stats()['bytes'] <= 900
+    assert kept == [keys[0]] + keys[3:]
@@ -0,0 +1,44 @@
+import ast
+
+from ast_handlers import POSITION_FIELDS
+from compact_ast import NO_POSITION, CompactAST
+from source_index import SpanIndex
+
+CODE = """\
+import os
+
+class Shape:
+    def area(self, w, h=2):
+        return w * h  # comment
+
+result = Shape().area(3, h=[x + 1 for x in range(4)])
+print(f"{result!r:>10}", os.sep)
+"""
+
+
+def innermost(tree, line, col):
+    """The node locate() should find, by checking every span."""
+    best = None
+    for index, (start_line, start_col, end_line, end_col) in enumerate(zip(*(tree.positions[f] for f in POSITION_FIELDS))):
+        if start_line == NO_POSITION or end_line == NO_POSITION:
+            continue
+        start, end = (start_line, start_col), (end_line, end_col)
+        if start <= (line, col) < end and (best is None or (start, (-end[0], -end[1])) >= best[0]):
+            best = ((start, (-end[0], -end[1])), index)
+    return None if best is None else best[1]
+
+
+def test_locate_finds_the_innermost_node_at_every_position():
+    tree = CompactAST.from_ast(ast.parse(CODE))
+    index = SpanIndex(tree)
+    lines = CODE.splitlines()
+    for line in range(len(lines) + 2):
+        for col in range(len(lines[line - 1]) + 2 if 0 < line <= len(lines) else 3):
+            assert index.locate(line, col) == innermost(tree, line, col), (line, col)
+
+
+def test_locate_resolves_identical_spans_to_the_deeper_node():
+    tree = CompactAST.from_ast(ast.parse('f(x)\n'))
+    index = SpanIndex(tree)
+    found = index.locate(1, 1)  # The parenthesis: inside the Expr and its Call only
+    assert tree.strings[tree.types[found]] == 'Call'
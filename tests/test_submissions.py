@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+import pytest
+
+from submissions import Coalescer, TooManySubmissions
+
+
+@pytest.fixture(scope='module')
+def client():
+    pytest.importorskip('fastapi')
+    from fastapi.testclient import TestClient
+    import backend.main as main
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize('code', ['x = ' + '-' * 5000 + '1', 'x = (' * 300 + ')' * 300, 'x = 1\0'])
+def test_unparseable_source_is_422(client, code):
+    response = client.post('/api/render', json={'code': code, 'format': 'dot'})
+    assert response.status_code == 422
+    assert response.json()['detail']
+
+
+def test_parser_memory_error_is_413(client, monkeypatch):
+    def exhausted(code, profiler=None):
+        raise MemoryError
+    monkeypatch.setattr('ast_parser.ast.parse', exhausted)
+    response = client.post('/api/render', json={'code': 'x = 2', 'format': 'dot'})
+    assert response.status_code == 413
+
+
+def test_identical_submissions_share_one_run_and_excess_keys_are_rejected():
+    calls = []
+    release = threading.Event()
+
+    def render(code):
+        calls.append(code)
+        release.wait(5)
+        return code.upper()
+
+    async def scenario():
+        coalescer = Coalescer(max_inflight=1)
+        first = asyncio.ensure_future(coalescer.run('k', render, 'x = 1'))
+        second = asyncio.ensure_future(coalescer.run('k', render, 'x = 1'))
+        await asyncio.sleep(0.05)
+        with pytest.raises(TooManySubmissions):
+            await coalescer.run('other', render, 'y = 2')
+        release.set()
+        results = await asyncio.gather(first, second)
+        return results, coalescer.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [('X = 1', False), ('X = 1', True)]
+    assert calls == ['x = 1']
+    assert stats == {"inflight": 0, "started": 1, "joined": 1, "rejected": 1}
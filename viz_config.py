@@ -121,6 +121,23 @@ LEGEND = [
     ("<B>Container/Context</B><BR/>(lists,<BR/>dicts,<BR/>sets,<BR/>tuples,<BR/>Load/Store/Del)", 'List'),
 ]
 
+# Structural diff (ast_diff.py): fill colour of each kind of change, and of nodes that did not change
+DIFF_COLORS = {
+    'inserted': 'palegreen',
+    'deleted': 'lightcoral',
+    'updated': 'gold',
+    'moved': 'lightskyblue',
+    'unchanged': 'white',
+}
+
+DIFF_LEGEND = [
+    ("Inserted", 'inserted'),
+    ("Deleted", 'deleted'),
+    ("Updated", 'updated'),
+    ("Moved", 'moved'),
+    ("Unchanged", 'unchanged'),
+]
+
 _missing_node_types = set()
 
 def get_node_color(node_type):
@@ -128,4 +145,15 @@ def get_node_color(node_type):
         if node_type not in _missing_node_types:
             print(f"[viz_config] Missing color for node type: {node_type}")
             _missing_node_types.add(node_type)
-    return NODE_COLORS.get(node_type, "white") 
\ No newline at end of file
+    return NODE_COLORS.get(node_type, "white") 
+
+
+# Node pruning (prune.py): operators folded into their parent's label are shown as these symbols
+OPERATOR_SYMBOLS = {
+    'Add': '+', 'Sub': '-', 'Mult': '*', 'Div': '/', 'FloorDiv': '//', 'Mod': '%', 'Pow': '**',
+    'LShift': '<<', 'RShift': '>>', 'BitOr': '|', 'BitXor': '^', 'BitAnd': '&', 'MatMult': '@',
+    'Eq': '==', 'NotEq': '!=', 'Lt': '<', 'LtE': '<=', 'Gt': '>', 'GtE': '>=',
+    'Is': 'is', 'IsNot': 'is not', 'In': 'in', 'NotIn': 'not in',
+    'And': 'and', 'Or': 'or',
+    'Invert': '~', 'Not': 'not', 'UAdd': '+', 'USub': '-',
+}